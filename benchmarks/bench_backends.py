@@ -0,0 +1,81 @@
+"""Benchmark of rendering backends on pure data blocks.
+
+Usage: python benchmarks/bench_backends.py [--rows N] [--cols N] [--repeat N]
+
+Drawing, closing and end-to-end (drawing and closing) times are reported.
+Both backends store the same cell records, which `xlsxwriter` serializes
+to sheet XML when the workbook is closed, so closing takes the same time
+with both of them (mostly in `Worksheet._write_cell`) and only drawing
+is faster with `RawBackend`. Garbage is collected before every run,
+so collections of the previous runs' objects are not counted; differences
+in closing times are then within the noise of collections triggered
+while closing (which scale with the number of cell records).
+"""
+
+# Imported modules ------------------------------------------------------------
+
+# Full imports ---
+import argparse
+import gc
+import io
+import time
+import numpy as np
+import xlsxwriter
+
+# Partial imports ---
+from xlsxpandas.backends import XlsxWriterBackend, RawBackend
+
+###############################################################################
+
+def make_columns(rows, cols):
+    """Make a block of mixed typed columns."""
+    rng = np.random.RandomState(1010)
+    columns = []
+    for j in range(cols):
+        if j % 3 == 0:
+            columns.append(rng.randint(0, 1000, rows))
+        elif j % 3 == 1:
+            columns.append(rng.normal(size = rows))
+        else:
+            columns.append(np.array([ 'v%d' % i for i in rng.randint(0, 100, rows) ],
+                                    dtype = object))
+    return columns
+
+def run(backend, columns, repeat):
+    """Time drawing and closing of a workbook with a block."""
+    draw, close, total = [], [], []
+    for _ in range(repeat):
+        gc.collect()
+        wb = xlsxwriter.Workbook(io.BytesIO(), {'in_memory': True})
+        ws = wb.add_worksheet()
+        be = backend(ws, wb)
+        formats = [ be.format({'num_format': '0.00'}) ] * len(columns)
+        t0 = time.perf_counter()
+        be.write_block(0, 0, columns, formats)
+        t1 = time.perf_counter()
+        wb.close()
+        t2 = time.perf_counter()
+        draw.append(t1 - t0)
+        close.append(t2 - t1)
+        total.append(t2 - t0)
+    return min(draw), min(close), min(total)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--rows', type = int, default = 100000)
+    parser.add_argument('--cols', type = int, default = 10)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    columns = make_columns(args.rows, args.cols)
+    print('%d rows x %d columns (best of %d)' % (args.rows, args.cols, args.repeat))
+    base = None
+    for backend in (XlsxWriterBackend, RawBackend):
+        times = run(backend, columns, args.repeat)
+        base = base or times
+        print('%-18s draw: %7.3fs  close: %7.3fs  total: %7.3fs  '
+              'speed-up (draw/total): %5.2fx / %5.2fx'
+              % ((backend.__name__,) + times + (base[0] / times[0], base[2] / times[2])))
+
+if __name__ == '__main__':
+    main()
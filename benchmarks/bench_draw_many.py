@@ -0,0 +1,63 @@
+"""Benchmark of drawing many small elements one by one and in a batch.
+
+Usage: python benchmarks/bench_draw_many.py [--elements N] [--repeat N]
+"""
+
+# Imported modules ------------------------------------------------------------
+
+# Full imports ---
+import argparse
+import io
+import time
+import xlsxwriter
+
+# Partial imports ---
+from xlsxpandas.drawer import Drawer
+from xlsxpandas.elements import Element
+from xlsxpandas.backends import XlsxWriterBackend, RawBackend
+
+###############################################################################
+
+STYLES = [ {'bold': True}, {'num_format': '0.00'}, {'italic': True, 'border': 1} ]
+
+def make_elements(n):
+    """Make small elements with a few distinct styles."""
+    return [ Element(i * 0.5 if i % 2 else 'v%d' % i, style = STYLES[i % 3])
+             for i in range(n) ]
+
+def per_element(dr, elems):
+    for elem in elems:
+        dr.draw(elem)
+        dr.move_vertical()
+
+def batch(dr, elems):
+    dr.draw_many(elems)
+
+def run(method, backend, elems, repeat):
+    """Time drawing of elements (the best of `repeat` runs)."""
+    times = []
+    for _ in range(repeat):
+        wb = xlsxwriter.Workbook(io.BytesIO(), {'in_memory': True})
+        dr = Drawer(wb.add_worksheet(), wb, backend = backend)
+        t0 = time.perf_counter()
+        method(dr, elems)
+        times.append(time.perf_counter() - t0)
+        wb.close()
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--elements', type = int, default = 50000)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    elems = make_elements(args.elements)
+    print('%d elements (best of %d)' % (args.elements, args.repeat))
+    for backend in (XlsxWriterBackend, RawBackend):
+        base = run(per_element, backend, elems, args.repeat)
+        fast = run(batch, backend, elems, args.repeat)
+        print('%-18s draw: %7.3fs  draw_many: %7.3fs  speed-up: %5.2fx'
+              % (backend.__name__, base, fast, base / fast))
+
+if __name__ == '__main__':
+    main()
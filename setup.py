@@ -62,5 +62,20 @@ setup(
     keywords = 'excel reporting automation',
     
     # You can just specify the packages manually here if your project is simple.
-    packages = find_packages(exclude = ['contrib', 'docs', 'tests'])
+    packages = find_packages(exclude = ['contrib', 'docs', 'tests']),
+
+    # RawBackend uses worksheet internals of xlsxwriter (cell records,
+    # dimension checks and shared strings) checked with these versions;
+    # structures of dictionaries and report specs are YAML files
+    install_requires = ['numpy', 'pandas', 'pyyaml', 'xlsxwriter>=1.4.4,<3.3'],
+
+    # Blocks of Arrow data and Feather/Arrow or Parquet inputs of specs
+    extras_require = {
+        'arrow': ['pyarrow']
+    },
+
+    # Command line script rendering reports from specs
+    entry_points = {
+        'console_scripts': ['xlsxpandas = xlsxpandas:main']
+    }
 )
@@ -1,4 +1,7 @@
-def main():
+def main(argv=None):
     """Entry point for the application script
+
+    Renders a report from a YAML or JSON spec (see `xlsxpandas.cli`).
     """
-    pass
+    from xlsxpandas.cli import main
+    return main(argv)
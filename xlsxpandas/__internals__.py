@@ -2,6 +2,22 @@
 
 # Imported moduels -----------------------------------------------------------
 
+import re
+import pandas as pd
+from itertools import product
+from string import ascii_uppercase
+from weakref import WeakKeyDictionary
+from xlsxwriter.utility import xl_cell_to_rowcol_abs, xl_rowcol_to_cell
+from xlsxpandas.styles import Style
+
+# A1 references (cells or ranges) that are not qualified with sheet names
+_A1_REF = re.compile(r'(?<![\w.!$:])(\$?[A-Z]{1,3}\$?\d+)(?::(\$?[A-Z]{1,3}\$?\d+))?(?![\w(!])')
+
+# Formats registered in workbooks (by style keys)
+_FORMATS = WeakKeyDictionary()
+
+# Names of all worksheet columns (computed on the first use)
+_COLUMN_NAMES = []
 
 ###############################################################################
 
@@ -45,4 +61,131 @@ def validate_param(x, name, expected_type, coerce = False, *args):
         msg += '\n'.join(unmet_conditions)
         raise AssertionError(msg)
     return x
-        
\ No newline at end of file
+
+def is_null(value):
+    """Check whether a scalar value is missing (`None`, `NaN`, `NaT` etc.)."""
+    try:
+        return bool(pd.isnull(value))
+    except (TypeError, ValueError):
+        return False
+
+def style_key(style):
+    """Get a hashable key of a style definition.
+
+    Parameters
+    ----------
+        style : dict or None
+            Style definition.
+    """
+    if style is None:
+        return None
+    if style.__class__ is Style:
+        return style.key
+    return tuple(sorted(style.items()))
+
+def make_format(wb, style):
+    """Get a workbook format object for a style definition.
+
+    Formats are cached per workbook, so a given style
+    is registered only once no matter how many cells use it.
+
+    Parameters
+    ----------
+        wb : xlsxwriter.workbook.Workbook
+            Workbook to register the format in.
+        style : dict or Style
+            Style definition.
+    """
+    cache = _FORMATS.setdefault(wb, {})
+    # Style objects are keys with precomputed hashes
+    key = Style.make(style)
+    try:
+        return cache[key]
+    except KeyError:
+        fmt = cache[key] = wb.add_format(dict(style))
+        return fmt
+
+def update_columns(ws, first_col, last_col, width=None, fmt=None):
+    """Set width and/or default format of columns keeping their other options.
+
+    Properties that are not given (`None`) are left unchanged.
+
+    Parameters
+    ----------
+        ws : xlsxwriter.worksheet.Worksheet
+            Worksheet to operate on.
+        first_col : int
+            First column.
+        last_col : int
+            Last column.
+        width : float or None
+            Width of the columns.
+        fmt : xlsxwriter.format.Format or None
+            Default format of the columns.
+    """
+    for col in range(first_col, last_col + 1):
+        info = ws.col_info.get(col, [None, None, False, 0, False])
+        ws.set_column(col, col,
+                      info[0] if width is None else width,
+                      info[1] if fmt is None else fmt,
+                      {'hidden': info[2], 'level': info[3], 'collapsed': info[4]})
+
+def update_row(ws, row, height=None, fmt=None):
+    """Set height and/or default format of a row keeping its other options.
+
+    Properties that are not given (`None`) are left unchanged.
+
+    Parameters
+    ----------
+        ws : xlsxwriter.worksheet.Worksheet
+            Worksheet to operate on.
+        row : int
+            Row to set.
+        height : float or None
+            Height of the row.
+        fmt : xlsxwriter.format.Format or None
+            Default format of the row.
+    """
+    info = ws.set_rows.get(row, [None, None, False, 0, False])
+    ws.set_row(row,
+               info[0] if height is None else height,
+               info[1] if fmt is None else fmt,
+               {'hidden': info[2], 'level': info[3], 'collapsed': info[4]})
+
+def shift_formula(formula, dx, dy):
+    """Move A1 references in a formula by a number of rows and columns.
+
+    Both relative and absolute references are moved (like when a range
+    of cells is cut and pasted), but references qualified with sheet names
+    and text in string literals are left unchanged.
+
+    Parameters
+    ----------
+        formula : str
+            Formula (or a space-separated list of ranges).
+        dx : int
+            Number of rows.
+        dy : int
+            Number of columns.
+    """
+    def shift(ref):
+        row, col, row_abs, col_abs = xl_cell_to_rowcol_abs(ref)
+        return xl_rowcol_to_cell(row + dx, col + dy, row_abs, col_abs)
+    def repl(m):
+        refs = [ shift(r) for r in m.groups() if r is not None ]
+        return ':'.join(refs)
+    parts = formula.split('"')
+    parts[::2] = [ _A1_REF.sub(repl, p) for p in parts[::2] ]
+    return '"'.join(parts)
+
+def column_names():
+    """Get names of all worksheet columns ('A' to 'XFD') in order.
+
+    The table is computed once, so column names are looked up
+    instead of being converted from indices.
+    """
+    if not _COLUMN_NAMES:
+        names = [ ''.join(p) for n in (1, 2, 3)
+                  for p in product(ascii_uppercase, repeat = n) ]
+        _COLUMN_NAMES.extend(names[:16384])
+    return _COLUMN_NAMES
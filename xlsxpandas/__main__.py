@@ -0,0 +1,5 @@
+"""Command line entry point (`python -m xlsxpandas`)."""
+import sys
+from xlsxpandas.cli import main
+
+sys.exit(main())
@@ -0,0 +1,736 @@
+"""Rendering backends
+
+Backends are the only objects that actually write to worksheets.
+Drawing elements do not call `xlsxwriter` worksheets directly,
+but use a backend interface consisting of writing values, merging ranges,
+registering formats, writing comments and setting column widths.
+"""
+
+# Imported modules ------------------------------------------------------------
+
+# Full imports ---
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+# Partial imports ---
+from datetime import datetime, time, timedelta
+from weakref import WeakKeyDictionary
+from xlsxpandas.__internals__ import (
+    validate_param,
+    is_null,
+    make_format,
+    update_columns,
+    update_row
+)
+from xlsxwriter.worksheet import re_dynamic_function
+try:
+    from xlsxwriter.worksheet import (
+        CellNumberTuple,
+        CellStringTuple,
+        CellBooleanTuple,
+        CellFormulaTuple
+    )
+except ImportError:
+    from xlsxwriter.worksheet import (
+        cell_number_tuple as CellNumberTuple,
+        cell_string_tuple as CellStringTuple,
+        cell_boolean_tuple as CellBooleanTuple,
+        cell_formula_tuple as CellFormulaTuple
+    )
+
+# Default backends of worksheets
+_BACKENDS = WeakKeyDictionary()
+
+# Number formats of dates and times written as excel serial numbers
+DATE_FORMATS = {
+    'date': 'yyyy-mm-dd',
+    'datetime': 'yyyy-mm-dd hh:mm:ss',
+    'time': 'hh:mm:ss',
+    'timedelta': '[h]:mm:ss'
+}
+
+# Nanoseconds in a day
+_DAY = 86400 * 10**9
+
+###############################################################################
+
+
+class Backend(object):
+    """Abstract rendering backend.
+
+    Backend is bound to a worksheet and a workbook
+    and implements all operations needed for drawing elements.
+    Subclasses have to implement at least `format`, `write`, `merge`,
+    `comment` and `set_column`; the other methods are implemented
+    in terms of them.
+    """
+
+    # Is the backend drawing a draft (see `DraftBackend`)
+    draft = False
+    # First row that is not written in a draft (`None` if all rows are written)
+    draft_stop = None
+    # Does the backend record operations of a template (see `templates.Recorder`)
+    recording = False
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def ws(self):
+        """xlsxwriter.worksheet.Worksheet: Excel worksheet of the backend."""
+        return self._ws
+
+    @ws.setter
+    def ws(self, value):
+        self._ws = validate_param(value, 'ws', xlsxwriter.worksheet.Worksheet)
+
+    @property
+    def wb(self):
+        """xlsxwriter.workbook.Workbook: Excel workbook of the backend."""
+        return self._wb
+
+    @wb.setter
+    def wb(self, value):
+        self._wb = validate_param(value, 'wb', xlsxwriter.workbook.Workbook)
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, ws, wb):
+        """Initialization method.
+
+        Parameters
+        ----------
+        ws : xlsxwriter.worksheet.Worksheet
+            Worksheet to draw in.
+        wb : xlsxwriter.workbook.Workbook
+            Workbook the worksheet is in.
+        """
+        self.ws = ws
+        self.wb = wb
+
+    def format(self, style):
+        """Get a format object for a style definition.
+
+        Parameters
+        ----------
+            style : dict
+                Style definition.
+        """
+        raise NotImplementedError
+
+    def write(self, x, y, token, fmt=None, method='write', **kwargs):
+        """Write a value in a cell.
+
+        Parameters
+        ----------
+            x : int
+                Row of the cell.
+            y : int
+                Column of the cell.
+            token : any
+                Value to write; tuple of string fragments and formats
+                for `write_rich_string`.
+            fmt : format object or None
+                Format of the cell.
+            method : str
+                Name of a `xlsxwriter.worksheet` write method.
+            **kwargs
+                Additional arguments passed to the write method.
+        """
+        raise NotImplementedError
+
+    def merge(self, x0, y0, x1, y1, fmt=None):
+        """Merge a range of cells.
+
+        Parameters
+        ----------
+            x0 : int
+                Upper row of the range.
+            y0 : int
+                Left column of the range.
+            x1 : int
+                Lower row of the range.
+            y1 : int
+                Right column of the range.
+            fmt : format object or None
+                Format of the merged range.
+        """
+        raise NotImplementedError
+
+    def comment(self, x, y, text, params={}):
+        """Write a comment.
+
+        Parameters
+        ----------
+            x : int
+                Row of the commented cell.
+            y : int
+                Column of the commented cell.
+            text : str
+                Comment text.
+            params : dict
+                Additional comment parameters.
+        """
+        raise NotImplementedError
+
+    def set_column(self, first_col, last_col, width=None, fmt=None):
+        """Set width and/or default format of columns.
+
+        Properties that are not given (`None`) are left unchanged.
+
+        Parameters
+        ----------
+            first_col : int
+                First column.
+            last_col : int
+                Last column.
+            width : float or None
+                Width of the columns.
+            fmt : format object or None
+                Default format of the columns.
+        """
+        raise NotImplementedError
+
+    def set_row(self, row, height=None, fmt=None):
+        """Set height and/or default format of a row.
+
+        Properties that are not given (`None`) are left unchanged.
+
+        Parameters
+        ----------
+            row : int
+                Row to set.
+            height : float or None
+                Height of the row.
+            fmt : format object or None
+                Default format of the row.
+        """
+        raise NotImplementedError
+
+    def outline_rows(self, x, levels):
+        """Set outline (grouping) levels of consecutive rows.
+
+        Heights and formats of the rows are left unchanged.
+
+        Parameters
+        ----------
+            x : int
+                First row.
+            levels : array-like of ints
+                Outline levels (0 to 7) of the rows.
+        """
+        raise NotImplementedError
+
+    def conditional_format(self, x0, y0, x1, y1, options):
+        """Add a conditional format over a range of cells.
+
+        Parameters
+        ----------
+            x0 : int
+                Upper row of the range.
+            y0 : int
+                Left column of the range.
+            x1 : int
+                Lower row of the range.
+            y1 : int
+                Right column of the range.
+            options : dict
+                `xlsxwriter` conditional format options.
+        """
+        raise NotImplementedError
+
+    def write_formulas(self, x, y, formulas, fmt=None, values=None):
+        """Write a column of formulas.
+
+        Parameters
+        ----------
+            x : int
+                Upper row of the column.
+            y : int
+                Column to write in.
+            formulas : list of str
+                Formulas of the rows; they have to be of the same structure
+                (i.e. differ only in cell references).
+            fmt : format object or None
+                Format of the cells.
+            values : list or None
+                Cached results of the formulas; zeros if `None`.
+        """
+        values = [0] * len(formulas) if values is None else values
+        for i, (formula, value) in enumerate(zip(formulas, values), x):
+            self.write(i, y, formula, fmt, 'write_formula', value = value)
+
+    def write_array_formula(self, x0, y0, x1, y1, formula, fmt=None,
+                            dynamic=False, value=0):
+        """Write an array formula over a range of cells.
+
+        Parameters
+        ----------
+            x0 : int
+                Upper row of the range.
+            y0 : int
+                Left column of the range.
+            x1 : int
+                Lower row of the range.
+            y1 : int
+                Right column of the range.
+            formula : str
+                Array formula.
+            fmt : format object or None
+                Format of the cells.
+            dynamic : bool
+                Should it be a dynamic array formula
+                (spilling its results) instead of a legacy (CSE) one.
+            value : any
+                Cached result of the first cell.
+        """
+        raise NotImplementedError
+
+    def write_block(self, x, y, columns, formats=None, na_rep=''):
+        """Write a block of typed columns.
+
+        Parameters
+        ----------
+            x : int
+                Upper row of the block.
+            y : int
+                Left column of the block.
+            columns : list of array-likes
+                Columns of the block (of equal lengths).
+            formats : list of format objects or None
+                Formats of the columns.
+            na_rep : str
+                String representation of missing values;
+                missing values are left blank if it is empty.
+        """
+        columns, formats = self._date_columns(columns, formats)
+        # Rows are written in order (as required by the `constant_memory` mode)
+        columns = [ _values(col) for col in columns ]
+        for i, row in enumerate(zip(*columns), x):
+            for j, (value, fmt) in enumerate(zip(row, formats), y):
+                if pd.isnull(value):
+                    value = na_rep if na_rep else None
+                self.write(i, j, value, fmt)
+
+    def _date_columns(self, columns, formats):
+        """Convert datetime and timedelta columns to excel serial numbers.
+
+        Columns without formats get cached formats with date number formats.
+        """
+        columns = list(columns)
+        formats = [None] * len(columns) if formats is None else list(formats)
+        date_1904 = getattr(self.ws, 'date_1904', False)
+        for j, col in enumerate(columns):
+            if _kind(col) in 'Mm':
+                if formats[j] is None:
+                    formats[j] = self.format({'num_format': date_num_format(col)})
+                columns[j] = excel_dates(col, date_1904)
+        return columns, formats
+
+###############################################################################
+
+
+class XlsxWriterBackend(Backend):
+    """Default backend calling `xlsxwriter` worksheet methods."""
+
+    def format(self, style):
+        return make_format(self.wb, style)
+
+    def write(self, x, y, token, fmt=None, method='write', **kwargs):
+        wmethod = getattr(self.ws, method)
+        if method == 'write_rich_string' and isinstance(token, tuple):
+            args = token if fmt is None else token + (fmt,)
+            return wmethod(x, y, *args, **kwargs)
+        return wmethod(x, y, token, fmt, **kwargs)
+
+    def merge(self, x0, y0, x1, y1, fmt=None):
+        return self.ws.merge_range(x0, y0, x1, y1, '', fmt)
+
+    def comment(self, x, y, text, params={}):
+        return self.ws.write_comment(x, y, text, params)
+
+    def set_column(self, first_col, last_col, width=None, fmt=None):
+        update_columns(self.ws, first_col, last_col, width, fmt)
+
+    def set_row(self, row, height=None, fmt=None):
+        update_row(self.ws, row, height, fmt)
+
+    def outline_rows(self, x, levels):
+        levels = np.clip(np.asarray(levels, dtype=np.int64), 0, 7)
+        if not len(levels):
+            return 0
+        ws = self.ws
+        col = ws.dim_colmin if ws.dim_colmin is not None else 0
+        if ws._check_dimensions(x, col) or \
+           ws._check_dimensions(x + len(levels) - 1, col):
+            return -1
+        # Row records are stored directly (existing ones are updated)
+        set_rows, row_sizes = ws.set_rows, ws.row_sizes
+        height = ws.default_row_height
+        for row, level in enumerate(levels.tolist(), x):
+            info = set_rows.get(row)
+            if info is None:
+                set_rows[row] = [height, None, False, level, False]
+                row_sizes[row] = [height, False]
+            else:
+                info[3] = level
+        ws.outline_row_level = max(ws.outline_row_level, int(levels.max()))
+        ws.row_size_changed = True
+        return 0
+
+    def conditional_format(self, x0, y0, x1, y1, options):
+        return self.ws.conditional_format(x0, y0, x1, y1, options)
+
+    def write_array_formula(self, x0, y0, x1, y1, formula, fmt=None,
+                            dynamic=False, value=0):
+        method = self.ws.write_dynamic_array_formula if dynamic \
+                 else self.ws.write_array_formula
+        return method(x0, y0, x1, y1, formula, fmt, value)
+
+###############################################################################
+
+
+class RawBackend(XlsxWriterBackend):
+    """Optimized backend writing cell records directly.
+
+    Numbers, booleans, plain strings and blanks are stored straight
+    in the worksheet's cell table, which `xlsxwriter` serializes to the sheet XML,
+    so the per-cell type dispatch and bounds checks of the `write` methods
+    are skipped. Blocks of typed columns are written in bulk
+    with formats resolved once per column. Other values and write methods
+    are delegated to the default backend. It can not be used with worksheets
+    in the `constant_memory` mode, which have to be written row by row.
+    Worksheet internals it relies on are checked with `xlsxwriter`
+    1.4.4 to 3.2 (see `setup.py`).
+    """
+
+    def __init__(self, ws, wb):
+        super(RawBackend, self).__init__(ws, wb)
+        if ws.constant_memory:
+            raise ValueError('RawBackend does not support constant_memory mode.')
+
+    def _raw(self, value):
+        """Check whether a value can be stored as a raw cell record.
+
+        Empty strings are not, as `xlsxwriter` writes them as blank cells.
+        """
+        cls = value.__class__
+        if cls is str:
+            ws = self.ws
+            return not (not value or ws.strings_to_numbers or
+                        (ws.strings_to_formulas and value.startswith('=')) or
+                        (ws.strings_to_urls and ':' in value) or
+                        len(value) > ws.xls_strmax)
+        return cls in (int, float, bool) and value == value and \
+               value not in (float('inf'), float('-inf'))
+
+    def _put(self, x, y, value, fmt):
+        """Store a raw cell record (dimensions are not updated)."""
+        cls = value.__class__
+        if cls is str:
+            value = self.ws.str_table._get_shared_string_index(value)
+            record = CellStringTuple(value, fmt)
+        elif cls is bool:
+            record = CellBooleanTuple(int(value), fmt)
+        else:
+            record = CellNumberTuple(value, fmt)
+        self.ws.table[x][y] = record
+
+    def _check(self, x0, y0, x1, y1):
+        """Check bounds of a range and update the worksheet dimensions."""
+        return self.ws._check_dimensions(x0, y0) == 0 and \
+               self.ws._check_dimensions(x1, y1) == 0
+
+    def write(self, x, y, token, fmt=None, method='write', **kwargs):
+        if method != 'write' or kwargs or self.ws.write_handlers or \
+           not self._raw(token):
+            return super(RawBackend, self).write(x, y, token, fmt,
+                                                 method, **kwargs)
+        if not self._check(x, y, x, y):
+            return -1
+        self._put(x, y, token, fmt)
+        return 0
+
+    def write_formulas(self, x, y, formulas, fmt=None, values=None):
+        if not formulas:
+            return
+        # Formulas of the same structure need the same preparation,
+        # so only the first one is checked (and they are stored as they are)
+        ws = self.ws
+        first = formulas[0]
+        if ws.write_handlers or first.startswith('{') or \
+           re_dynamic_function.search(first) or \
+           ws._prepare_formula(first) != (first[1:] if first.startswith('=') else first):
+            return super(RawBackend, self).write_formulas(x, y, formulas, fmt, values)
+        if not self._check(x, y, x + len(formulas) - 1, y):
+            return -1
+        values = [0] * len(formulas) if values is None else values
+        table = ws.table
+        for i, (formula, value) in enumerate(zip(formulas, values), x):
+            if formula.startswith('='):
+                formula = formula[1:]
+            table[i][y] = CellFormulaTuple(formula, fmt, value)
+        return 0
+
+    def write_block(self, x, y, columns, formats=None, na_rep=''):
+        if not columns:
+            return
+        columns, formats = self._date_columns(columns, formats)
+        n = max(len(col) for col in columns)
+        if not self._check(x, y, x + max(n, 1) - 1, y + len(columns) - 1):
+            return -1
+        table = self.ws.table
+        na = None if not na_rep else na_rep
+        for j, (col, fmt) in enumerate(zip(columns, formats)):
+            col = np.asarray(col)
+            kind = col.dtype.kind
+            c = y + j
+            if kind in 'iu':
+                for i, value in enumerate(col.tolist(), x):
+                    table[i][c] = CellNumberTuple(value, fmt)
+            elif kind == 'b':
+                for i, value in enumerate(col.tolist(), x):
+                    table[i][c] = CellBooleanTuple(int(value), fmt)
+            elif kind == 'f':
+                for i, value in enumerate(col.tolist(), x):
+                    table[i][c] = CellNumberTuple(value, fmt)
+                for i in np.flatnonzero(~np.isfinite(col)).tolist():
+                    del table[x + i][c]
+                    value = float(col[i])
+                    self.write(x + i, c, na if value != value else value, fmt)
+            else:
+                for i, value in enumerate(_values(col), x):
+                    if is_null(value):
+                        value = na
+                    if value is not None and self._raw(value):
+                        self._put(i, c, value, fmt)
+                    else:
+                        self.write(i, c, value, fmt)
+        return 0
+
+###############################################################################
+
+
+class DraftBackend(Backend):
+    """Backend drawing a quick draft of a layout with another backend.
+
+    Values are written at the same positions as in the final output,
+    but formats are reduced to their number formats (so numbers and dates
+    read the same) and merges, comments, column widths, row settings,
+    outlines and conditional formats are skipped. Optionally only
+    the first rows of an element are written; elements may check
+    `draft_stop` to stop iterating over rows that are not written.
+    """
+
+    draft = True
+
+    def __init__(self, backend, rows=None, x=0):
+        """Initialization method.
+
+        Parameters
+        ----------
+        backend : Backend
+            Backend to write with.
+        rows : int or None
+            Number of rows of the element (from its top) that are written;
+            all rows are written if `None`.
+        x : int
+            Top row of the drawn element.
+        """
+        super(DraftBackend, self).__init__(backend.ws, backend.wb)
+        self.backend = backend
+        rows = validate_param(rows, 'rows', (int, type(None)))
+        self.draft_stop = None if rows is None else x + rows
+
+    def _rows(self, x, n):
+        """Get the number of rows written from the row `x` (of `n` rows)."""
+        if self.draft_stop is None:
+            return n
+        return max(min(n, self.draft_stop - x), 0)
+
+    def format(self, style):
+        if style and 'num_format' in style:
+            return self.backend.format({'num_format': style['num_format']})
+        return None
+
+    def write(self, x, y, token, fmt=None, method='write', **kwargs):
+        if not self._rows(x, 1):
+            return 0
+        if method == 'write_rich_string' and isinstance(token, tuple):
+            token = ''.join(t for t in token if isinstance(t, str))
+            method = 'write'
+        return self.backend.write(x, y, token, fmt, method, **kwargs)
+
+    def merge(self, x0, y0, x1, y1, fmt=None):
+        return 0
+
+    def comment(self, x, y, text, params={}):
+        return 0
+
+    def set_column(self, first_col, last_col, width=None, fmt=None):
+        return 0
+
+    def set_row(self, row, height=None, fmt=None):
+        return 0
+
+    def outline_rows(self, x, levels):
+        return 0
+
+    def conditional_format(self, x0, y0, x1, y1, options):
+        return 0
+
+    def write_formulas(self, x, y, formulas, fmt=None, values=None):
+        n = self._rows(x, len(formulas))
+        if n:
+            values = None if values is None else values[:n]
+            return self.backend.write_formulas(x, y, formulas[:n], fmt, values)
+
+    def write_array_formula(self, x0, y0, x1, y1, formula, fmt=None,
+                            dynamic=False, value=0):
+        if self._rows(x0, 1):
+            return self.backend.write_array_formula(x0, y0, x1, y1, formula, fmt,
+                                                    dynamic, value)
+
+    def write_block(self, x, y, columns, formats=None, na_rep=''):
+        n = max([ len(col) for col in columns ] + [0])
+        m = self._rows(x, n)
+        if m == n:
+            return self.backend.write_block(x, y, columns, formats, na_rep)
+        if m:
+            return self.backend.write_block(x, y, [ col[:m] for col in columns ],
+                                            formats, na_rep)
+
+###############################################################################
+
+
+def _kind(col):
+    """Get the kind of a column's data type (like `numpy.dtype.kind`)."""
+    dtype = getattr(col, 'dtype', None)
+    if dtype is None:
+        dtype = np.asarray(col).dtype
+    return getattr(dtype, 'kind', 'O')
+
+def excel_dates(values, date_1904=False, timezone=None):
+    """Convert datetime or timedelta values to excel serial numbers.
+
+    Conversion is vectorized (it does not create python objects).
+
+    Parameters
+    ----------
+        values : array-like
+            `numpy` datetime64 or timedelta64 array
+            or `pandas` datetime (possibly timezone-aware) or timedelta values.
+        date_1904 : bool
+            Should the 1904 epoch be used instead of the 1900 one
+            (see the `date_1904` workbook option).
+        timezone : str, tzinfo or None
+            Timezone-aware values are converted to this timezone
+            before timezones are removed; if `None`, then their wall time
+            in their own timezones is used.
+
+    Returns
+    -------
+        numpy.ndarray
+            Serial numbers (floats); missing values (`NaT`) are `NaN`.
+    """
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.array
+    if isinstance(getattr(values, 'dtype', None), pd.DatetimeTZDtype):
+        values = pd.DatetimeIndex(values)
+        if timezone is not None:
+            values = values.tz_convert(timezone)
+        values = values.tz_localize(None).values
+    values = np.asarray(values)
+    if values.dtype.kind == 'm':
+        ns = values.astype('timedelta64[ns]').view(np.int64)
+        serial = ns / _DAY
+    else:
+        ns = values.astype('datetime64[ns]').view(np.int64)
+        epoch = np.datetime64('1904-01-01' if date_1904 else '1899-12-31', 'ns')
+        serial = (ns - epoch.astype(np.int64)) / _DAY
+        # Like in xlsxwriter, datetimes on 1900-01-01 are times of the day 0
+        first = np.datetime64('1900-01-01', 'ns').astype(np.int64)
+        serial[(ns - first) // _DAY == 0] -= 1
+        if not date_1904:
+            # Excel treats 1900 as a leap year
+            serial[serial > 59] += 1
+    serial[ns == np.iinfo(np.int64).min] = np.nan
+    return serial
+
+def datetime_value(value):
+    """Convert a datetime-like scalar to a value supported by `xlsxwriter`.
+
+    `numpy` datetimes and timedeltas are converted to `pandas` ones
+    and timezones are removed (keeping the wall time).
+    Other values are returned unchanged.
+    """
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    elif isinstance(value, np.timedelta64):
+        value = pd.Timedelta(value)
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.replace(tzinfo=None)
+    return value
+
+def date_num_format(values):
+    """Get a number format for datetime or timedelta values.
+
+    Parameters
+    ----------
+        values : array-like or scalar
+            Datetime or timedelta values.
+
+    Returns
+    -------
+        str
+            Date format if all datetimes are at midnight,
+            date and time format otherwise or time interval format
+            for timedeltas (see `DATE_FORMATS`).
+    """
+    if np.ndim(values) == 0:
+        if isinstance(values, (timedelta, np.timedelta64)):
+            return DATE_FORMATS['timedelta']
+        if isinstance(values, time):
+            return DATE_FORMATS['time']
+        if not isinstance(values, (datetime, np.datetime64)):
+            return DATE_FORMATS['date']
+        values = [values]
+    if _kind(values) == 'm':
+        return DATE_FORMATS['timedelta']
+    index = pd.DatetimeIndex(values)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    ns = index.asi8[~index.isna()]
+    return DATE_FORMATS['date' if (ns % _DAY == 0).all() else 'datetime']
+
+def _values(col):
+    """Get values of a column as a list of python objects."""
+    col = np.asarray(col)
+    if col.dtype.kind in 'Mm':
+        return pd.Series(col).astype(object).tolist()
+    return col.tolist()
+
+def get_backend(ws, wb=None):
+    """Get a backend for a worksheet.
+
+    Parameters
+    ----------
+        ws : xlsxwriter.worksheet.Worksheet or Backend
+            Worksheet or a backend; backends are returned unchanged.
+        wb : xlsxwriter.workbook.Workbook
+            Workbook the worksheet is in.
+
+    Returns
+    -------
+        Backend
+            The worksheet's default backend (which is created if needed).
+    """
+    if isinstance(ws, Backend):
+        return ws
+    try:
+        return _BACKENDS[ws]
+    except KeyError:
+        backend = _BACKENDS[ws] = XlsxWriterBackend(ws, wb)
+        return backend
+
+###############################################################################
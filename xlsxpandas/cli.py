@@ -0,0 +1,299 @@
+"""Command line report renderer
+
+Renders an excel report described by a declarative YAML or JSON spec.
+Modules of the package, `pandas` and `yaml` are imported only when needed,
+so the startup (and `--help`) is fast.
+
+Spec structure::
+
+    output: report.xlsx            # output file (may be overridden with -o)
+    options: {}                    # xlsxwriter workbook options
+    context: {}                    # variables for @eval@ expressions of dictionaries
+    inputs:                        # data files (csv, parquet, feather/arrow)
+      sales: {path: sales.csv, read_args: {sep: ';'}}
+    sheets:
+      - name: Summary
+        na_rep: ''
+        gap: 1                     # empty rows between consecutive items
+        backend: raw               # 'xlsxwriter' (default) or 'raw'
+        items:
+          - {type: text, value: Sales report, style: {bold: true}}
+          - {type: dictionary, structure: info.yaml, at: A3}
+          - {type: table, input: sales, columns: [region, total],
+             header_style: {bold: true}, name: sales}
+          - {type: text, value: '=SUM(sales)'}
+
+Items are placed one below another, unless their position is given with `at`
+(a cell in the A1 notation or `[row, column]`). Ranges of items with `name`
+are defined as named ranges of the workbook (for formulas on any sheet);
+items with `spill` may spill over new sheets (they can not have a `name`,
+as a spilled range is not contiguous). Other keys of items are passed
+to the element constructors (`Element`, `Dictionary` and `Block`);
+paths are relative to the spec file.
+"""
+
+# Imported modules ------------------------------------------------------------
+
+# Full imports ---
+import argparse
+import json
+import os
+import sys
+import time
+
+# Partial imports ---
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Formats of input files by extensions
+INPUT_FORMATS = {
+    '.csv': 'csv',
+    '.txt': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+    '.ipc': 'feather'
+}
+
+# Keys of items that are not passed to element constructors
+_ITEM_KEYS = ('type', 'at', 'input', 'columns', 'spill', 'name')
+
+###############################################################################
+
+
+class Profile(object):
+    """Timer of rendering phases."""
+
+    def __init__(self):
+        """Initialization method."""
+        self.times = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        """Measure time of a phase.
+
+        Parameters
+        ----------
+            name : str
+                Name of the phase.
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - t0
+
+    def report(self, stream=None):
+        """Print times of phases.
+
+        Parameters
+        ----------
+            stream : file-like object or None
+                Output stream; defaults to standard error.
+        """
+        stream = sys.stderr if stream is None else stream
+        for name, t in self.times.items():
+            stream.write('%-6s %9.3fs\n' % (name, t))
+        stream.write('%-6s %9.3fs\n' % ('total', sum(self.times.values())))
+
+###############################################################################
+
+def load_spec(path):
+    """Load a report spec from a YAML or JSON file.
+
+    Parameters
+    ----------
+        path : str
+            Path to the spec.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            return json.load(f, object_pairs_hook=OrderedDict)
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('`pyyaml` is required for reading YAML specs.')
+        return yaml.safe_load(f)
+
+def load_input(spec, base='.'):
+    """Load an input data file.
+
+    Parameters
+    ----------
+        spec : dict or str
+            Input definition with `path`, optional `format`
+            ('csv', 'parquet' or 'feather') and `read_args`
+            passed to the reading function; or just a path.
+        base : str
+            Directory relative paths are resolved against.
+
+    Returns
+    -------
+        pandas.DataFrame or pyarrow.Table
+            Data; Feather/Arrow files are memory-mapped `pyarrow` tables.
+    """
+    if isinstance(spec, str):
+        spec = {'path': spec}
+    path = os.path.join(base, spec['path'])
+    fmt = spec.get('format') or INPUT_FORMATS.get(os.path.splitext(path)[1].lower())
+    args = spec.get('read_args', {})
+    if fmt == 'feather':
+        try:
+            from pyarrow import feather
+        except ImportError:
+            raise ImportError('`pyarrow` is required for reading Arrow IPC files.')
+        return feather.read_table(path, memory_map=True, **args)
+    import pandas as pd
+    if fmt == 'csv':
+        return pd.read_csv(path, **args)
+    if fmt == 'parquet':
+        return pd.read_parquet(path, **args)
+    raise ValueError('unknown format of input %r.' % spec['path'])
+
+def build_item(item, inputs, context={}, base='.'):
+    """Build an element from an item definition.
+
+    Parameters
+    ----------
+        item : dict
+            Item definition (with `type` one of 'text', 'dictionary' or 'table').
+        inputs : dict
+            Loaded inputs (by names).
+        context : dict
+            Variables for expressions of dictionaries.
+        base : str
+            Directory relative paths are resolved against.
+    """
+    from xlsxpandas.elements import Element, Dictionary, Block
+    kind = item.get('type', 'text')
+    if item.get('spill') and item.get('name'):
+        raise ValueError('item %r can not both spill and have a name.' % item['name'])
+    args = { k: v for k, v in item.items() if k not in _ITEM_KEYS }
+    if kind == 'text':
+        return Element(**args)
+    if kind == 'dictionary':
+        structure = args.pop('structure')
+        if isinstance(structure, str):
+            structure = os.path.join(base, structure)
+        return Dictionary(structure, context={**context, **args.pop('context', {})},
+                          **args)
+    if kind == 'table':
+        data = inputs[item['input']]
+        columns = item.get('columns')
+        if hasattr(data, 'iloc'):
+            return Block.from_frame(data if columns is None else data[columns], **args)
+        return Block.from_arrow(data if columns is None else data.select(columns), **args)
+    raise ValueError('unknown item type %r.' % kind)
+
+def position(at):
+    """Translate an item position to coordinates.
+
+    Parameters
+    ----------
+        at : str or list
+            Cell in the A1 notation or `[row, column]`.
+    """
+    if isinstance(at, str):
+        from xlsxwriter.utility import xl_cell_to_rowcol
+        return xl_cell_to_rowcol(at)
+    return tuple(at)
+
+def render(spec, output=None, base='.', profile=None, draft=False, draft_rows=None):
+    """Render a report.
+
+    Parameters
+    ----------
+        spec : dict
+            Report spec.
+        output : str or None
+            Output file; defaults to the `output` of the spec
+            (relative to `base`).
+        base : str
+            Directory relative paths are resolved against.
+        profile : Profile or None
+            Timer of phases (a new one is used if `None`).
+        draft : bool
+            Should the report be drawn as a quick draft
+            (values at their final positions without decoration).
+        draft_rows : int or None
+            Number of rows of every item written in drafts.
+
+    Returns
+    -------
+        Profile
+            Times of phases: 'load' (inputs), 'build' (elements),
+            'draw' and 'close' (writing the file).
+    """
+    profile = Profile() if profile is None else profile
+    if output is None and spec.get('output'):
+        output = os.path.join(base, spec['output'])
+    if not output:
+        raise ValueError('output file is not given.')
+    with profile.phase('load'):
+        inputs = OrderedDict((name, load_input(s, base))
+                             for name, s in spec.get('inputs', {}).items())
+    with profile.phase('build'):
+        context = spec.get('context', {})
+        sheets = [ (sheet, [ (item, build_item(item, inputs, context, base))
+                             for item in sheet.get('items', []) ])
+                   for sheet in spec.get('sheets', []) ]
+    with profile.phase('draw'):
+        import xlsxwriter
+        from xlsxpandas.drawer import Drawer
+        from xlsxpandas.backends import XlsxWriterBackend, RawBackend
+        backends = {'xlsxwriter': XlsxWriterBackend, 'raw': RawBackend}
+        wb = xlsxwriter.Workbook(output, spec.get('options', {}))
+        for sheet, items in sheets:
+            ws = wb.add_worksheet(sheet.get('name'))
+            dr = Drawer(ws, wb, na_rep=sheet.get('na_rep', ''),
+                        backend=backends[sheet.get('backend', 'xlsxwriter')],
+                        draft=draft, draft_rows=draft_rows)
+            gap = sheet.get('gap', 1)
+            for n, (item, elem) in enumerate(items):
+                if 'at' in item:
+                    dr.reset(*position(item['at']))
+                elif n > 0:
+                    dr.move_vertical()
+                    dr.move(gap, 0)
+                if item.get('spill'):
+                    dr.spill(elem)
+                else:
+                    dr.draw(elem, name=item.get('name'))
+    with profile.phase('close'):
+        wb.close()
+    return profile
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog='xlsxpandas',
+        description='Render an excel report from a YAML or JSON spec.'
+    )
+    parser.add_argument('spec', help='path to the report spec (.yaml, .yml or .json)')
+    parser.add_argument('-o', '--output', help='output file (overrides the spec)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print time of phases (load, build, draw, close)')
+    parser.add_argument('--draft', action='store_true',
+                        help='draw a quick draft without formats, merges, comments and widths')
+    parser.add_argument('--draft-rows', type=int, metavar='N',
+                        help='write only the first N rows of every item (implies --draft)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the command line renderer.
+
+    Parameters
+    ----------
+        argv : list or None
+            Command line arguments; defaults to `sys.argv`.
+    """
+    args = parse_args(argv)
+    profile = Profile()
+    with profile.phase('spec'):
+        spec = load_spec(args.spec)
+    render(spec, args.output, os.path.dirname(os.path.abspath(args.spec)), profile,
+           args.draft or args.draft_rows is not None, args.draft_rows)
+    if args.profile:
+        profile.report()
+    return 0
@@ -4,17 +4,31 @@
 
 # Full imports ---
 import xlsxwriter
-import re
+import numpy as np
 
 # Partial imports ---
 from collections import OrderedDict, deque
+from itertools import product
+from weakref import WeakKeyDictionary
 from xlsxwriter.utility import (
     xl_rowcol_to_cell,
-    xl_cell_to_rowcol
+    xl_cell_to_rowcol,
+    xl_range_abs,
+    quote_sheetname
 )
 from xlsxpandas.__internals__ import (
-    validate_param
+    validate_param,
+    column_names
 )
+from xlsxpandas.backends import Backend, DraftBackend, get_backend
+from xlsxpandas.elements import Element
+from xlsxpandas.progress import ProgressBackend, Cancelled, discard
+
+# Types of values written by `Drawer.draw_many` without further processing
+_PLAIN = (str, int, float, bool)
+
+# Named ranges defined by drawers (by workbooks)
+_NAMES = WeakKeyDictionary()
 
 ###############################################################################
 
@@ -60,6 +74,19 @@ class Drawer(object):
     def wb(self, value):
         self._wb = validate_param(value, 'wb', xlsxwriter.workbook.Workbook)
 
+    @property
+    def backend(self):
+        """xlsxpandas.backends.Backend: Backend used for drawing."""
+        return self._backend
+
+    @backend.setter
+    def backend(self, value):
+        if value is None:
+            value = get_backend(self.ws, self.wb)
+        elif isinstance(value, type) and issubclass(value, Backend):
+            value = value(self.ws, self.wb)
+        self._backend = validate_param(value, 'backend', Backend)
+
     @property
     def na_rep(self):
         """str: String representation of missing value in the worksheet."""
@@ -69,6 +96,25 @@ class Drawer(object):
     def na_rep(self, value):
         self._na_rep = validate_param(value, 'na_rep', str)
 
+    @property
+    def draft(self):
+        """bool: Should elements be drawn as drafts (see `DraftBackend`)."""
+        return self._draft
+
+    @draft.setter
+    def draft(self, value):
+        self._draft = validate_param(value, 'draft', bool)
+
+    @property
+    def draft_rows(self):
+        """int or None: Number of rows of every element written in drafts."""
+        return self._draft_rows
+
+    @draft_rows.setter
+    def draft_rows(self, value):
+        self._draft_rows = validate_param(value, 'draft_rows', (int, type(None)),
+                                          False, 'x is None or x >= 0')
+
     @property
     def widths(self):
         """list: List of widths of drawn objects."""
@@ -79,9 +125,17 @@ class Drawer(object):
         """list: List of heights of drawn object."""
         return self._heights
 
+    @property
+    def names(self):
+        """OrderedDict: Named ranges defined in the workbook by drawers
+        (absolute references by names; read-only).
+        """
+        return _NAMES.setdefault(self.wb, OrderedDict())
+
     # -------------------------------------------------------------------------
 
-    def __init__(self, ws, wb, x=0, y=0, na_rep='', memlen=10):
+    def __init__(self, ws, wb, x=0, y=0, na_rep='', memlen=10, backend=None,
+                 draft=False, draft_rows=None):
         """Initilization method.
 
         Parameters
@@ -100,17 +154,31 @@ class Drawer(object):
         memlen : int
             Maximum length of stored previous widths and heights
             of drawn objects.
+        backend : xlsxpandas.backends.Backend, its subclass or None
+            Backend used for drawing; a subclass is instantiated
+            with the drawer's worksheet and workbook.
+            Defaults to the worksheet's `xlsxwriter` backend.
+        draft : bool
+            Should elements be drawn as quick drafts: values are written
+            at their final positions, but without formats (except number
+            formats), merges, comments, column widths and other decoration.
+        draft_rows : int or None
+            Number of rows of every element written in drafts
+            (all rows if `None`); sizes of elements are not changed.
         """
         self._x = x
         self._y = y
         self.ws = ws
         self.wb = wb
+        self.backend = backend
         self.checkpoints = OrderedDict()
         self.na_rep = na_rep
+        self.draft = draft
+        self.draft_rows = draft_rows
         self._widths = deque([], maxlen=memlen)
         self._heights = deque([], maxlen=memlen)
 
-    def draw(self, elem, **kwargs):
+    def draw(self, elem, progress=None, name=None, **kwargs):
         """Draw an element in a worksheet.
 
         Parameters
@@ -118,12 +186,195 @@ class Drawer(object):
             elem : any object with a proper `draw` method
             and `width` and `height` properties.
                 An object to draw on the worksheet.
+            progress : xlsxpandas.progress.Progress or None
+                Progress counting written cells, reporting them
+                and checking the deadline and cancellation; a cancelled
+                rendering releases the workbook (see `progress.discard`),
+                which can not be written then,
+                and raises `xlsxpandas.progress.Cancelled`.
+            name : str or None
+                Name the range of the element is defined under
+                in the workbook (see `define_name`).
             **kwargs
                 Keyword arguments passed to the invoked draw method.
         """
-        elem.draw(self.x, self.y, self.ws, self.wb, self.na_rep, **kwargs)
+        backend = self._draft_backend()
+        try:
+            if progress is not None:
+                progress.begin(elem)
+                backend = ProgressBackend(backend, progress, self.x)
+            elem.draw(self.x, self.y, backend, self.wb, self.na_rep, **kwargs)
+        except Cancelled:
+            discard(self.wb)
+            raise
+        if progress is not None:
+            progress.finish()
         self.widths.append(elem.width)
         self.heights.append(elem.height)
+        if name is not None:
+            self.define_name(name)
+
+    def _draft_backend(self):
+        """Get the backend for drawing at the current position
+        (wrapped in a draft backend in the draft mode).
+        """
+        if not self.draft:
+            return self.backend
+        return DraftBackend(self.backend, self.draft_rows, self.x)
+
+    def draw_many(self, elems, offsets=None, direction='vertical', **kwargs):
+        """Draw a batch of elements.
+
+        Elements are placed relative to the drawer's position,
+        either at given offsets or one after another in a given direction.
+        Formats are resolved once per distinct style in the batch
+        and simple elements (single cells with plain non-missing values
+        and without comments, rich strings, write arguments or column widths)
+        are written straight
+        with the backend in a tight loop; other elements are drawn
+        with their own `draw` methods. The whole batch is remembered
+        as a single drawn object (its bounding box), so the drawer
+        may be moved past it with `move_vertical` or `move_horizontal`.
+
+        Parameters
+        ----------
+            elems : iterable of elements
+                Objects to draw.
+            offsets : list of tuples or None
+                Offsets `(x, y)` of the elements relative to the drawer.
+            direction : 'vertical' or 'horizontal'
+                Direction the elements are laid out in
+                if `offsets` are not given.
+            **kwargs
+                Keyword arguments passed to the write methods.
+        """
+        elems = list(elems)
+        if offsets is None:
+            if direction not in ('vertical', 'horizontal'):
+                raise ValueError("`direction` has to be 'vertical' or 'horizontal'.")
+            offsets = []
+            dx, dy = 0, 0
+            vertical = direction == 'vertical'
+            for elem in elems:
+                offsets.append((dx, dy))
+                if vertical:
+                    dx += elem.height
+                else:
+                    dy += elem.width
+        elif len(offsets) != len(elems):
+            raise ValueError('`offsets` has different length than `elems`.')
+
+        be, wb, na_rep = self._draft_backend(), self.wb, self.na_rep
+        write = be.write
+        formats = {}
+        x0, y0 = self.x, self.y
+        height, width = 0, 0
+        for elem, (dx, dy) in zip(elems, offsets):
+            h, w = elem.height, elem.width
+            value = elem.value if elem.__class__ is Element else None
+            if value.__class__ in _PLAIN and value == value \
+               and h == 1 and w == 1 and not kwargs \
+               and elem.comment is None and elem.col_width is None \
+               and not elem.write_args and elem.write_method != 'write_rich_string':
+                # Styles of elements are hashable style objects
+                try:
+                    fmt = formats[elem.style]
+                except KeyError:
+                    fmt = formats[elem.style] = be.format(elem.style)
+                write(x0 + dx, y0 + dy, value, fmt, elem.write_method)
+            else:
+                elem.draw(x0 + dx, y0 + dy, be, wb, na_rep, **kwargs)
+            if dx + h > height:
+                height = dx + h
+            if dy + w > width:
+                width = dy + w
+        self.widths.append(width)
+        self.heights.append(height)
+
+    def spill(self, elem, sheet_name='{name} ({n})', **kwargs):
+        """Draw an element spilling it over new worksheets if it is too large.
+
+        If the element does not fit within the worksheet's row and column limits
+        (counting from the drawer's position), then split points are determined
+        in advance and the remaining parts are drawn in new worksheets
+        (with repeated headers) at the same position,
+        each one with its own drawer. The element has to implement
+        `split_sizes` and `split` methods (i.e. `DataFrame` and `Block`).
+        Aggregate rows of data frames are drawn only under the last part
+        of rows, and they aggregate all parts.
+
+        Parameters
+        ----------
+            elem : DataFrame, Block or another splittable element
+                An object to draw.
+            sheet_name : str
+                Format of names of new worksheets; `name` is the name
+                of the drawer's worksheet and `n` is the number of the part.
+            **kwargs
+                Keyword arguments passed to the invoked draw methods.
+
+        Returns
+        -------
+            list
+                Drawers used for drawing the parts
+                (starting with the drawer itself).
+        """
+        header, heights, widths = elem.split_sizes(**kwargs)
+        row_parts = self._split_points(heights, self.ws.xls_rowmax - self.x - header)
+        col_parts = self._split_points(widths, self.ws.xls_colmax - self.y)
+        if len(row_parts) == 1 and len(col_parts) == 1:
+            self.draw(elem, **kwargs)
+            return [self]
+        drawers = []
+        # Aggregates of the last part of rows refer to the preceding parts
+        previous = []
+        aggregated = bool(getattr(elem, 'aggregates', None))
+        for n, (cols, rows) in enumerate(product(col_parts, row_parts), 1):
+            if rows == row_parts[0]:
+                previous = []
+            if n == 1:
+                dr = self
+            else:
+                name = sheet_name.format(name=self.ws.name, n=n)
+                ws = self.wb.add_worksheet(name[-31:])
+                dr = Drawer(ws, self.wb, self.x, self.y, self.na_rep,
+                            self.widths.maxlen, type(self.backend),
+                            self.draft, self.draft_rows)
+            if aggregated and rows == row_parts[-1]:
+                part = elem.split(rows, cols, previous)
+            else:
+                part = elem.split(rows, cols)
+            dr.draw(part, **kwargs)
+            drawers.append(dr)
+            previous.append((dr.ws.name, int(np.sum(heights[rows[0]:rows[1]]))))
+        return drawers
+
+    @staticmethod
+    def _split_points(sizes, limit):
+        """Split sizes into consecutive parts with sums within a limit.
+
+        Parameters
+        ----------
+            sizes : array-like
+                Sizes (i.e. heights of rows).
+            limit : int
+                Maximum total size of a part.
+
+        Returns
+        -------
+            list
+                Start and stop indices of the parts.
+        """
+        ends = np.cumsum(sizes)
+        parts = []
+        start, offset = 0, 0
+        while start < len(ends):
+            stop = int(np.searchsorted(ends, offset + limit, side='right'))
+            if stop == start:
+                raise ValueError('Element does not fit in a worksheet.')
+            parts.append((start, stop))
+            start, offset = stop, ends[stop - 1]
+        return parts or [(0, 0)]
 
     def move(self, x=0, y=0):
         """Move drawer.
@@ -258,7 +509,7 @@ class Drawer(object):
             y : int
                 Number of columns to shift when determining the position.
         """
-        return re.sub('[0-9]', '', self.xl_position(y=y))
+        return column_names()[self.y + y]
 
     def xl_row(self, x=0):
         """Get Drawer's current row in the excel notation
@@ -268,7 +519,7 @@ class Drawer(object):
             x : int
                 Number of rows to shift when determining position.
         """
-        return re.sub('[A-Z]', '', self.xl_position(x=x))
+        return str(self.x + x + 1)
 
     def xl_upleft(self, x=0, y=0):
         """Get upper left corner coordinates of the last drawn object.
@@ -299,6 +550,64 @@ class Drawer(object):
         """
         return self.xl_upleft() + ':' + self.xl_loright()
 
+    def define_name(self, name, x=0, y=0, height=None, width=None, local=False):
+        """Define a named range over (a part of) the last drawn element.
+
+        The name is defined in the workbook, so formulas on any worksheet
+        may refer to the range by the name (i.e. `=SUM(sales)`)
+        instead of copying the data; absolute references
+        (for charts) are given by `ref`.
+
+        Parameters
+        ----------
+            name : str
+                Name of the range.
+            x : int
+                Rows skipped from the top of the element (i.e. a header).
+            y : int
+                Columns skipped from the left of the element.
+            height : int or None
+                Height of the range; the rest of the element by default.
+            width : int or None
+                Width of the range; the rest of the element by default.
+            local : bool
+                Should the name be local to the drawer's worksheet.
+
+        Returns
+        -------
+            str
+                Absolute reference of the range.
+        """
+        height = self.height() - x if height is None else height
+        width = self.width() - y if width is None else width
+        if height < 1 or width < 1:
+            raise ValueError('named range `%s` is empty.' % name)
+        sheet = quote_sheetname(self.ws.name)
+        ref = '%s!%s' % (sheet, xl_range_abs(self.x + x, self.y + y,
+                                             self.x + x + height - 1,
+                                             self.y + y + width - 1))
+        key = '%s!%s' % (sheet, name) if local else name
+        if key in self.names:
+            raise ValueError('name `%s` is already defined.' % key)
+        if self.wb.define_name(key, '=' + ref) == -1:
+            raise ValueError('`%s` is not a valid excel name.' % name)
+        self.names[key] = ref
+        return ref
+
+    def ref(self, name):
+        """Get the absolute reference of a named range (i.e. for charts).
+
+        Parameters
+        ----------
+            name : str
+                Name of the range (prefixed with the quoted name
+                of its worksheet if it is local).
+        """
+        try:
+            return '=' + self.names[name]
+        except KeyError:
+            raise KeyError('name `%s` is not defined.' % name)
+
     @staticmethod
     def xl2coords(rng):
         """Translate an excel range string to matrix coordinates.
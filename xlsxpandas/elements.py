@@ -6,15 +6,64 @@
 # Full imports ---
 import sys
 import re
-import yaml
+import numpy as np
 import pandas as pd
 
 # Partial imports ----
-from collections import OrderedDict
-from xlsxwriter.utility import xl_rowcol_to_cell
+from collections import Counter, OrderedDict
+from copy import copy
+from functools import partial
+from itertools import groupby
+from string import Formatter
+from datetime import date, time, timedelta, tzinfo
+from xlsxwriter.utility import xl_rowcol_to_cell, quote_sheetname
 from xlsxpandas.__internals__ import (
-    validate_param
+    validate_param,
+    style_key,
+    is_null,
+    column_names
 )
+from xlsxpandas.styles import Style, layer, css_style
+from xlsxpandas.backends import (
+    Backend,
+    get_backend,
+    datetime_value,
+    DATE_FORMATS,
+    date_num_format
+)
+
+# Aggregate functions: excel function and pandas function
+AGGREGATES = OrderedDict([
+    ('sum', ('SUM', 'sum')),
+    ('mean', ('AVERAGE', 'mean')),
+    ('count', ('COUNT', 'count')),
+    ('min', ('MIN', 'min')),
+    ('max', ('MAX', 'max')),
+    ('median', ('MEDIAN', 'median'))
+])
+
+# Excel functions of subtotals of outline groups (ignoring nested subtotals)
+SUBTOTALS = {
+    'sum': 'SUBTOTAL(9,%s)',
+    'mean': 'SUBTOTAL(1,%s)',
+    'count': 'SUBTOTAL(2,%s)',
+    'min': 'SUBTOTAL(5,%s)',
+    'max': 'SUBTOTAL(4,%s)',
+    'median': '_xlfn.AGGREGATE(12,0,%s)'
+}
+
+# Results of aggregate functions over ranges without numbers (as in excel)
+EMPTY_AGGREGATES = {
+    'sum': 0,
+    'mean': '#DIV/0!',
+    'count': 0,
+    'min': 0,
+    'max': 0,
+    'median': '#NUM!'
+}
+
+# Types of multiple values of dictionary entries built from data frames
+_LIST_TYPES = (list, tuple, np.ndarray)
 
 ###############################################################################
 
@@ -61,12 +110,14 @@ class Element(object):
 
     @property
     def style(self):
-        """dict: `xlsxwriter`-compatible style definitions for the element."""
+        """Style: `xlsxwriter`-compatible style definitions for the element
+        (dicts are converted to immutable style objects).
+        """
         return self._style
 
     @style.setter
     def style(self, value):
-        self._style = validate_param(value, 'style', dict)
+        self._style = Style.make(validate_param(value, 'style', dict))
 
     @property
     def comment(self):
@@ -165,7 +216,7 @@ class Element(object):
         self.value = value
         self.height = height
         self.width = width
-        self.style = style.copy()
+        self.style = style
         self.comment = comment
         self.comment_params = comment_params
         self.write_method = write_method
@@ -173,9 +224,9 @@ class Element(object):
         self.col_width = col_width
         self.padding = padding
 
-    def _make_style(self, wb):
-        """Register Element's style for drawing"""
-        return wb.add_format(self.style)
+    def _make_style(self, be, style=None):
+        """Register Element's style (or its adjusted version) for drawing"""
+        return be.format(self.style if style is None else style)
 
     def xl_upleft(self, x, y):
         """Get upper-left corner coordinates of the Element
@@ -217,7 +268,21 @@ class Element(object):
         loright = self.xl_loright(x, y)
         return upleft + ':' + loright
 
-    def draw(self, x, y, ws, wb, na_rep, **kwargs):
+    def data_positions(self, x=0, y=0, **kwargs):
+        """Get coordinates of the cells holding values of the Element.
+
+        Parameters
+        ----------
+            x : int
+                Element's x-coordinate (its upper-left corner).
+            y : int
+                Element's y-coordinate (its upper-left corner).
+            **kwargs
+                Ignored; accepted for compatibility with complex elements.
+        """
+        return [(x, y)]
+
+    def draw(self, x, y, ws, wb, na_rep, default_style=None, **kwargs):
         """Draw Element in the worksheet.
 
         This method is public, but usually should not be used 'by hand'.
@@ -229,39 +294,56 @@ class Element(object):
                 X-coordinate for the upper-left corner of the Element.
             y : int
                 Y-coordinate for the upper-left corner of the Element.
-            ws : xlsxwriter.worksheet.Worksheet
-                Worksheet to write the Element in.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the Element in.
             wb : xlsxwriter.workbook.Workbook
                 Workbook the worksheet is in.
             na_rep : str
                 String representation of missing values.
+            default_style : dict or None
+                Default style of the row or column the Element is in.
+                If it is the same as the Element's style, then the Element
+                is written without its own format, so the default one applies.
             **kwargs : any
                 Optional keyword parameters passed to the write methods.
         """
+        be = get_backend(ws, wb)
+        value = self.value
+        stl = self.style
         if self.write_method == 'write_rich_string' and \
-            isinstance(self.value, tuple):
-            vals = list(self.value)
-            vals = [ wb.add_format({**self.style, **x}) if isinstance(x, dict) else x for x in vals ]
-            self.value = tuple(vals)
-        wmethod = getattr(ws, self.write_method)
-        style = self._make_style(wb)
+            isinstance(value, tuple):
+            value = tuple(be.format(layer(self.style, x)) if isinstance(x, dict) else x
+                          for x in value)
+        elif is_null(value):
+            value = na_rep if na_rep else None
+        elif self.write_method in ('write', 'write_datetime'):
+            value = datetime_value(value)
+            if isinstance(value, (date, time, timedelta)) and 'num_format' not in stl:
+                stl = layer(stl, {'num_format': date_num_format(value)})
+        if default_style is not None and \
+            style_key(default_style) == style_key(stl):
+            style = None
+        else:
+            style = self._make_style(be, stl)
         wargs = {**self.write_args, **kwargs}
-        if isinstance(self.value, tuple) and self.write_method == 'write_rich_string':
+        if isinstance(value, tuple) and self.write_method == 'write_rich_string':
             if self.height > 1 or self.width > 1:
-                ws.merge_range(self.xl_range(x, y), '', style)
-            wmethod(self.xl_upleft(x, y), *self.value)
+                be.merge(x, y, x + self.height - 1, y + self.width - 1, style)
+            be.write(x, y, value, None, self.write_method)
         else:
             if self.width > 1 or self.height > 1:
-                rng = self.xl_range(x, y)
-                ws.merge_range(rng, '', style)
-            wmethod(x, y, self.value, style, **wargs)
+                be.merge(x, y, x + self.height - 1, y + self.width - 1, style)
+            be.write(x, y, value, style, self.write_method, **wargs)
             if self.comment is not None:
-                addr = self.xl_upleft(x, y)
-                ws.write_comment(addr, self.comment, self.comment_params)
+                be.comment(x, y, self.comment, self.comment_params)
+        if be.draft:
+            return
 
         # Apply column width adjustment
         def vlen(value):
-            if value is not None:
+            if isinstance(value, tuple):
+                return sum(len(x) for x in value if isinstance(x, str))
+            elif value is not None:
                 return len(str(value))
             else:
                 return None
@@ -278,7 +360,259 @@ class Element(object):
                 return
             else:
                 raise ValueError('incorrect value of col_width.')
-            ws.set_column(y, y + self.width - 1, col_width / self.width)
+            be.set_column(y, y + self.width - 1, col_width / self.width)
+
+###############################################################################
+
+
+class ConditionalFormat(object):
+    """Conditional formatting rule.
+
+    It is a native excel conditional format that is attached to a complex
+    element (i.e. a series or a data frame) instead of styling of single
+    elements. The range it applies to is determined while the element is drawn,
+    so the rule is written once with a single `conditional_format` call
+    no matter how many cells it highlights.
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def params(self):
+        """dict: `xlsxwriter` conditional format options (including `type`)."""
+        return self._params
+
+    @params.setter
+    def params(self, value):
+        self._params = validate_param(value, 'params', dict,
+                                      False, "'type' in x")
+
+    @property
+    def style(self):
+        """dict or None: `xlsxwriter`-compatible style applied to matching cells."""
+        return self._style
+
+    @style.setter
+    def style(self, value):
+        self._style = validate_param(value, 'style', (dict, type(None)))
+
+    @property
+    def columns(self):
+        """list or None: labels of columns the rule is restricted to."""
+        return self._columns
+
+    @columns.setter
+    def columns(self, value):
+        self._columns = validate_param(value, 'columns', (list, type(None)),
+                                       lambda x: x if x is None else list(x))
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, type, style=None, columns=None, **params):
+        """Initialization method.
+
+        Parameters
+        ----------
+        type : str
+            Type of the rule; one of the `xlsxwriter` conditional format types
+            (i.e. 'cell', 'formula', '2_color_scale', '3_color_scale', 'data_bar').
+        style : dict or None
+            Style of highlighted cells. It is ignored by the rules that do not
+            use formats (color scales and data bars).
+        columns : list or None
+            Labels of columns the rule is applied to.
+            Used only by data frames; `None` means all columns.
+        **params
+            Other `xlsxwriter` conditional format options
+            (see [xlsxwriter docs](xlsxwriter.readthedocs.io/working_with_conditional_formats.html)).
+            String values of `criteria` and `value` may use `{cell}`
+            (relative upper-left cell of the range) and `{range}` (absolute range)
+            placeholders, so formula rules can refer to the drawn coordinates.
+        """
+        self.params = {'type': type, **params}
+        self.style = style
+        self.columns = columns
+
+    @classmethod
+    def make(cls, rule):
+        """Make a rule from a rule object or a `dict` with its definition."""
+        if isinstance(rule, cls):
+            return rule
+        if isinstance(rule, (dict, OrderedDict)):
+            return cls(**rule)
+        raise TypeError('%r is not a valid conditional format.' % rule)
+
+    def draw(self, ranges, ws, wb):
+        """Draw the rule over a set of worksheet ranges.
+
+        Parameters
+        ----------
+            ranges : list of tuples
+                Ranges given as `(x0, y0, x1, y1)` tuples of
+                upper-left and lower-right corners.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the rule in.
+            wb : xlsxwriter.workbook.Workbook
+                Workbook the worksheet is in.
+        """
+        if not ranges:
+            return
+        x0, y0, x1, y1 = ranges[0]
+        cell = xl_rowcol_to_cell(x0, y0)
+        rng = ' '.join(xl_rowcol_to_cell(a, b, True, True) + ':' + \
+                       xl_rowcol_to_cell(c, d, True, True)
+                       for a, b, c, d in ranges)
+        options = self.params.copy()
+        for key in ('criteria', 'value'):
+            if isinstance(options.get(key), str):
+                options[key] = options[key].format(cell=cell, range=rng)
+        be = get_backend(ws, wb)
+        if self.style is not None:
+            options['format'] = be.format(self.style)
+        if len(ranges) > 1:
+            options['multi_range'] = rng.replace('$', '')
+        be.conditional_format(x0, y0, x1, y1, options)
+
+###############################################################################
+
+
+class StyleMap(object):
+    """Static mapping of values to styles.
+
+    Values are assigned to bins (`numpy.digitize`) or categories
+    (codes of `pandas.Categorical`) all at once, and every bin (category)
+    has a single style object. So elements styled with a map share styles,
+    and the number of distinct formats does not grow with the number
+    of cells (i.e. significance stars, bins or traffic lights).
+    Unlike `ConditionalFormat` styles are fixed when the map is applied.
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def styles(self):
+        """list: Styles of the bins (or categories)."""
+        return self._styles
+
+    @property
+    def bins(self):
+        """numpy.ndarray or None: Increasing edges of the bins."""
+        return self._bins
+
+    @property
+    def categories(self):
+        """list or None: Categories (in order of the styles)."""
+        return self._categories
+
+    @property
+    def right(self):
+        """bool: Do the bins include their right edges instead of the left ones."""
+        return self._right
+    @right.setter
+    def right(self, value):
+        self._right = validate_param(value, 'right', bool)
+
+    @property
+    def default(self):
+        """dict or None: Style of values out of the categories
+        and of missing or non-numeric values (`None` keeps their styles).
+        """
+        return self._default
+    @default.setter
+    def default(self, value):
+        value = validate_param(value, 'default', (dict, type(None)))
+        self._default = None if value is None else Style.make(value)
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, styles, bins=None, right=False, default=None):
+        """Initialization method.
+
+        Parameters
+        ----------
+        styles : list or dict
+            Styles of the bins; `n` edges of bins define `n + 1` bins
+            (the first and the last one are open). A `dict` maps
+            categories (values) to styles and then `bins` are not used.
+        bins : array-like or None
+            Increasing edges of the bins.
+        right : bool
+            Should the bins include their right edges instead of the left ones.
+        default : dict or None
+            Style of values out of the categories and of missing
+            (or non-numeric, when binned) values; they keep their styles if `None`.
+        """
+        styles = validate_param(styles, 'styles', (list, tuple, dict))
+        if isinstance(styles, dict):
+            self._categories = list(styles.keys())
+            self._bins = None
+            styles = list(styles.values())
+        else:
+            if bins is None:
+                raise ValueError('`bins` are needed unless categories are given.')
+            bins = np.asarray(bins, dtype=float)
+            if bins.ndim != 1 or np.any(np.diff(bins) <= 0):
+                raise ValueError('`bins` have to be increasing.')
+            if len(styles) != len(bins) + 1:
+                raise ValueError('%d edges define %d bins, but %d styles were given.'
+                                 % (len(bins), len(bins) + 1, len(styles)))
+            self._categories = None
+            self._bins = bins
+        self._styles = [ Style.make(validate_param(stl, 'styles', dict))
+                         for stl in styles ]
+        self.right = right
+        self.default = default
+
+    @classmethod
+    def make(cls, rule):
+        """Make a map from a map object or a `dict` with its definition
+        (with the `styles` key).
+        """
+        if isinstance(rule, cls):
+            return rule
+        if isinstance(rule, (dict, OrderedDict)) and 'styles' in rule:
+            return cls(**rule)
+        raise TypeError('%r is not a valid style map.' % (rule,))
+
+    def codes(self, values):
+        """Get ids of styles of values.
+
+        Parameters
+        ----------
+            values : array-like
+                Values to map.
+
+        Returns
+        -------
+            numpy.ndarray
+                Indices of `styles`; -1 for values without a bin (category).
+        """
+        if self.categories is not None:
+            values = pd.Series(np.asarray(values, dtype=object), dtype=object)
+            return pd.Categorical(values, categories=self.categories).codes \
+                     .astype(np.int64)
+        x = pd.to_numeric(pd.Series(np.asarray(values, dtype=object)),
+                          errors='coerce').values.astype(float)
+        codes = np.digitize(x, self.bins, right=self.right).astype(np.int64)
+        codes[np.isnan(x)] = -1
+        return codes
+
+    def lookup(self, values):
+        """Get styles of values.
+
+        Parameters
+        ----------
+            values : array-like
+                Values to map.
+
+        Returns
+        -------
+            numpy.ndarray
+                Style objects (or the default style) of the values.
+        """
+        table = np.empty(len(self.styles) + 1, dtype=object)
+        table[:] = self.styles + [self.default]
+        return table[self.codes(values)]
 
 ###############################################################################
 
@@ -345,13 +679,23 @@ class Series(pd.Series):
     def padding(self, value):
         self._padding = validate_param(value, 'padding', float, True, 'x >= 0')
 
+    @property
+    def conditional_formats(self):
+        """list: Conditional formatting rules applied to the series."""
+        return self._conditional_formats
+    @conditional_formats.setter
+    def conditional_formats(self, value):
+        value = validate_param(value, 'conditional_formats', list, list)
+        self._conditional_formats = [ ConditionalFormat.make(x) for x in value ]
+
     # -------------------------------------------------------------------------
 
     def __init__(self, data, horizontal=False, height=1, width=1,
                  style={}, name_args={},
                  borders=None, first={}, last={},
                  write_method='write', write_args={},
-                 col_width=None, padding=2.0, **kwargs):
+                 col_width=None, padding=2.0, conditional_formats=[],
+                 **kwargs):
         """Initialization method.
 
         Parameters
@@ -386,6 +730,8 @@ class Series(pd.Series):
             then width determines total width of all columns.
         padding : float
             Padding added on both sides when `col_width = 'auto'`.
+        conditional_formats : list of ConditionalFormat or dicts
+            Conditional formatting rules applied to the elements of the series.
         **kwargs
             Other optional parameters passed to the pandas Series constructor.
         """
@@ -401,13 +747,14 @@ class Series(pd.Series):
             style[side2] = borders
             first = {fpos: borders}
             last = {lpos: borders}
+        style = Style.make(style)
 
         # Initilize elements ---
         for i in self.index:
             if not isinstance(self[i], Element):
                 if isinstance(self[i], (dict, OrderedDict)):
                     elem = Element(**self[i])
-                    elem.style = {**style, **elem.style}
+                    elem.style = layer(style, elem.style)
                 else:
                     elem = Element(self[i], height, width, style,
                                    col_width = col_width, padding = padding,
@@ -420,28 +767,35 @@ class Series(pd.Series):
             if not isinstance(self.name, Element):
                 if isinstance(self.name, (dict, OrderedDict)):
                     self.name = Element(**self.name)
-                    self.name.style = {**style, **self.name.style}
+                    self.name.style = layer(style, self.name.style)
                 else:
-                    stl = name_args.pop('style', {})
+                    nargs = name_args.copy()
+                    stl = nargs.pop('style', {})
                     self.name = Element(self.name, height, width,
-                                        {**style, **stl}, **name_args)
+                                        layer(style, stl), **nargs)
 
         # Determine first and last elements' styles ---
-        felem = self.iloc[0]
-        lelem = self.iloc[-1]
-        fstl = {**felem.style, fpos: first} if isinstance(first, int) \
-                                            else {**felem.style, **first}
-        lstl = {**lelem.style, lpos: last} if isinstance(last, int) \
-                                           else {**lelem.style, **last}
-        felem.style = fstl
-        lelem.style = lstl
+        # (elements are copied, so elements passed in data are not changed)
+        felem = copy(self.iloc[0])
+        felem.style = layer(felem.style, {fpos: first} if isinstance(first, int)
+                                         else first)
         self.iloc[0] = felem
+        lelem = copy(self.iloc[-1])
+        lelem.style = layer(lelem.style, {lpos: last} if isinstance(last, int)
+                                         else last)
         self.iloc[-1] = lelem
 
         self.horizontal = horizontal
+        self.conditional_formats = conditional_formats
         #self.col_width = col_width
         #self.padding = padding
 
+    def _copy_elements(self):
+        """Copy the series together with its elements."""
+        return Series([ copy(e) for e in self.values ], index = self.index,
+                      name = self.name, horizontal = self.horizontal,
+                      conditional_formats = self.conditional_formats)
+
     def setprop(self, propname, value, inplace=False):
         """Set a property of all elements in the series.
 
@@ -457,19 +811,19 @@ class Series(pd.Series):
             inplace : bool
                 Should assignment be done in place; defaults to `False`.
         """
-        sr = self if inplace else self.copy()
+        sr = self if inplace else self._copy_elements()
         if isinstance(value, list):
             if len(value) != sr.size:
                 raise ValueError(
                     '`value` has different length than the series.'
                 )
-            for i, val in zip(sr.index, value):
-                setattr(sr[i], propname, val)
+            for elem, val in zip(sr.values, value):
+                setattr(elem, propname, val)
         else:
-            for i in sr.index:
-                setattr(sr[i], propname, value)
+            for elem in sr.values:
+                setattr(elem, propname, value)
         if not inplace:
-            return self
+            return sr
 
     def addstyle(self, style, inplace=False):
         """Add additional styling to the existing style.
@@ -483,21 +837,74 @@ class Series(pd.Series):
             inplace : bool
                 Should assignment be done in place; defaults to `False`.
         """
-        sr = self if inplace else self.copy()
+        sr = self if inplace else self._copy_elements()
         if isinstance(style, list):
             if len(style) != sr.size:
                 raise ValueError(
                     '`style` has differen length than the series.'
                 )
-            for i, stl in zip(sr.index, style):
-                sr[i].style = {**sr[i].style, **stl}
+            for elem, stl in zip(sr.values, style):
+                elem.style = layer(elem.style, stl)
         else:
-            for i in sr.index:
-                sr[i].style = {**sr[i].style, **style}
+            style = Style.make(style)
+            for elem in sr.values:
+                elem.style = layer(elem.style, style)
+        if not inplace:
+            return sr
+
+    def mapstyle(self, mapping, inplace=False):
+        """Add styles mapped from values of the elements.
+
+        Values of all elements are mapped at once;
+        elements with the same style and the same mapped style
+        share the resulting style (and its format).
+
+        Parameters
+        ----------
+            mapping : StyleMap or dict
+                Style map or its definition.
+            inplace : bool
+                Should assignment be done in place; defaults to `False`.
+        """
+        sr = self if inplace else self._copy_elements()
+        styles = StyleMap.make(mapping).lookup([ e.value for e in sr.values ])
+        for elem, stl in zip(sr.values, styles.tolist()):
+            if stl is not None:
+                elem.style = layer(elem.style, stl)
         if not inplace:
-            return self
+            return sr
+
+    def data_positions(self, x=0, y=0, draw_name=False, **kwargs):
+        """Get coordinates of the cells holding values of the series' elements.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the Series.
+            y : int
+                Y-coordinate for the upper-left corner of the Series.
+            draw_name : bool
+                Is name element drawn.
+            **kwargs
+                Ignored; accepted for compatibility with the draw method.
+        """
+        positions = []
+        if self.horizontal:
+            if draw_name and self.name:
+                y += self.name.width
+            for elem in self.values:
+                positions.append((x, y))
+                y += elem.width
+        else:
+            if draw_name and self.name:
+                x += self.name.height
+            for elem in self.values:
+                positions.append((x, y))
+                x += elem.height
+        return positions
 
-    def draw(self, x, y, ws, wb, na_rep, draw_name=False, **kwargs):
+    def draw(self, x, y, ws, wb, na_rep, draw_name=False,
+             default_style=None, **kwargs):
         """Draw Series in the worksheet.
 
         Parameters
@@ -506,32 +913,53 @@ class Series(pd.Series):
                 X-coordinate for the upper-left corner of the Series.
             y : int
                 Y-coordinate for the upper-left corner of the Series.
-            ws : xlsxwriter.worksheet.Worksheet
-                Worksheet to write the Element in.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the Element in.
             wb : xlsxwriter.workbook.Workbook
                 Workbook the worksheet is in.
             na_rep : str
                 String representation of missing values.
             draw_name : bool
                 Should name element be drawn (if defined).
+            default_style : dict, list of dicts or None
+                Default style of the row/column the elements are in;
+                elements with the same style are written without own formats.
+                It may be given separately for every element as a list.
             **kwargs
                 Optional keyword parameters passed to the write methods.
         """
         y0, x0 = x, y
+        ws = get_backend(ws, wb)
+        if not isinstance(default_style, list):
+            default_style = [default_style] * self.size
         if self.horizontal:
             if draw_name and self.name:
                 self.name.draw(x, y, ws, wb, na_rep, **kwargs)
                 y += self.name.width
-            for elem in self.values:
-                elem.draw(x, y, ws, wb, na_rep, **kwargs)
+            for elem, dstl in zip(self.values, default_style):
+                elem.draw(x, y, ws, wb, na_rep, default_style=dstl, **kwargs)
                 y += elem.width
         else:
             if draw_name and self.name:
                 self.name.draw(x, y, ws, wb, na_rep, **kwargs)
                 x += self.name.height
-            for elem in self.values:
-                elem.draw(x, y, ws, wb, na_rep, **kwargs)
+            stop = ws.draft_stop
+            if stop is not None:
+                # Rows that are not written in a draft are skipped
+                end = x + self.length
+            for elem, dstl in zip(self.values, default_style):
+                if stop is not None and x >= stop:
+                    x = end
+                    break
+                elem.draw(x, y, ws, wb, na_rep, default_style=dstl, **kwargs)
                 x += elem.height
+        if self.conditional_formats:
+            if self.horizontal:
+                rng = (x, y - self.length, x + self.height - 1, y - 1)
+            else:
+                rng = (x - self.length, y, x - 1, y + self.width - 1)
+            for rule in self.conditional_formats:
+                rule.draw([rng], ws, wb)
 
 ###############################################################################
 
@@ -553,8 +981,9 @@ class DataFrame(pd.DataFrame):
 
     @property
     def height(self):
-        """positive int: height of the data frame."""
-        return self.apply(lambda x: sum([ y.height for y in x ]), axis = 0).max()
+        """positive int: height of the data frame (including aggregate rows)."""
+        height = self.apply(lambda x: sum([ y.height for y in x ]), axis = 0).max()
+        return height + len(self._aggregate_functions())
 
     @property
     def name_args(self):
@@ -572,12 +1001,57 @@ class DataFrame(pd.DataFrame):
     def col_args(self, value):
         self._col_args = validate_param(value, 'col_args', dict)
 
+    @property
+    def conditional_formats(self):
+        """list: Conditional formatting rules applied to the data frame."""
+        return self._conditional_formats
+    @conditional_formats.setter
+    def conditional_formats(self, value):
+        value = validate_param(value, 'conditional_formats', list, list)
+        self._conditional_formats = [ ConditionalFormat.make(x) for x in value ]
+
+    @property
+    def aggregates(self):
+        """str, list or dict: Aggregate functions of the footer rows
+        (for all numeric columns or by column labels).
+        """
+        return self._aggregates
+    @aggregates.setter
+    def aggregates(self, value):
+        value = validate_param(value, 'aggregates', (str, list, dict, type(None)))
+        funcs = [value] if isinstance(value, str) else value or []
+        if isinstance(funcs, dict):
+            funcs = [ f for v in funcs.values()
+                      for f in ([v] if isinstance(v, str) else v) ]
+        for f in funcs:
+            if f not in AGGREGATES:
+                raise ValueError('`%s` is not a valid aggregate function.' % f)
+        self._aggregates = value
+
+    @property
+    def aggregate_style(self):
+        """dict: Additional styling of the aggregate rows."""
+        return self._aggregate_style
+    @aggregate_style.setter
+    def aggregate_style(self, value):
+        self._aggregate_style = validate_param(value, 'aggregate_style', dict)
+
+    @property
+    def aggregate_labels(self):
+        """dict: Labels of the aggregate rows (by functions)."""
+        return self._aggregate_labels
+    @aggregate_labels.setter
+    def aggregate_labels(self, value):
+        self._aggregate_labels = validate_param(value, 'aggregate_labels', dict)
+
     # -------------------------------------------------------------------------
 
     def __init__(self, data, height=1, width=1, style={},
                  borders=None, top={}, bottom={}, left={}, right={},
                  write_method='write', write_args={},
-                 name_args={}, col_args={}, **kwargs):
+                 name_args={}, col_args={}, conditional_formats=[],
+                 aggregates=None, aggregate_style={'bold': True},
+                 aggregate_labels={}, **kwargs):
         """Initialization method.
 
         Parameters
@@ -613,11 +1087,26 @@ class DataFrame(pd.DataFrame):
         col_args : dict
             Additional arbitrary arguments passed
             to column series constructor while drawing.
+        conditional_formats : list of ConditionalFormat or dicts
+            Conditional formatting rules applied to the body of the data frame
+            (or to its columns listed in the `columns` attribute of a rule).
+        aggregates : str, list, dict or None
+            Aggregate functions ('sum', 'mean', 'count', 'min', 'max', 'median')
+            written in footer rows (one for every function) as formulas
+            over the drawn columns with values computed in advance as cached results.
+            `str` or `list` applies to all numeric columns;
+            `dict` maps column labels to functions.
+        aggregate_style : dict
+            Additional styling of the aggregate rows
+            (on top of the styles of the last elements of columns).
+        aggregate_labels : dict
+            Labels of the aggregate rows written in the first column
+            if it is not aggregated (by functions; defaults to function names).
         **kwargs
             other optional parameters passed
              to the pandas DataFrame constructor
         """
-        style = style.copy()
+        style = Style.make(style)
         super(DataFrame, self).__init__(data, **kwargs)
 
         if borders:
@@ -627,12 +1116,15 @@ class DataFrame(pd.DataFrame):
             left = {**left, 'left': borders}
 
         # Initialize elements ---
-        for i, row in self.iterrows():
+        # (frames made only of elements, i.e. by `from_styler`, are not scanned)
+        made = all(isinstance(e, Element) for e in self.values.ravel().tolist())
+        for i, row in ([] if made else self.iterrows()):
             for j, elem in row.iteritems():
                 if not isinstance(elem, Element):
                     if isinstance(elem, dict):
+                        elem = elem.copy()
                         stl = elem.pop('style', {})
-                        elem = Element(**elem, style = {**style, **stl})
+                        elem = Element(**elem, style = layer(style, stl))
                     else:
                         elem = Element(elem, height, width, style,
                                        write_method = write_method,
@@ -643,21 +1135,276 @@ class DataFrame(pd.DataFrame):
                         self.loc[i, j] = elem
 
         # Determine boundary styles ---
-        top = {'top': top} if isinstance(top, int) else top
-        bottom = {'bottom': bottom} if isinstance(bottom, int) else bottom
-        left = {'left': left} if isinstance(left, int) else left
-        right = {'right': right} if isinstance(right, int) else right
+        top = Style.make({'top': top} if isinstance(top, int) else top)
+        bottom = Style.make({'bottom': bottom} if isinstance(bottom, int) else bottom)
+        left = Style.make({'left': left} if isinstance(left, int) else left)
+        right = Style.make({'right': right} if isinstance(right, int) else right)
 
         # Apply boundary styles ---
+        # (boundary elements are copied, so elements passed in data are not changed)
+        def restyle(i, j, stl):
+            if stl:
+                elem = copy(self.iat[i, j])
+                elem.style = layer(elem.style, stl)
+                self.iat[i, j] = elem
         for i in range(self.shape[1]):
-            self.iloc[0, i].style = {**self.iloc[0, i].style, **top}
-            self.iloc[-1, i].style = {**self.iloc[-1, i].style, **bottom}
+            restyle(0, i, top)
+            restyle(-1, i, bottom)
         for i in range(self.shape[0]):
-            self.iloc[i, 0].style = {**self.iloc[i, 0].style, **left}
-            self.iloc[i, -1].style = {**self.iloc[i, -1].style, **right}
+            restyle(i, 0, left)
+            restyle(i, -1, right)
 
         self.col_args  = col_args
         self.name_args = name_args
+        self.conditional_formats = conditional_formats
+        self.aggregates = aggregates
+        self.aggregate_style = aggregate_style
+        self.aggregate_labels = aggregate_labels
+
+    @classmethod
+    def from_styler(cls, styler, index=True, style={}, **kwargs):
+        """Make a data frame from a pandas `Styler`.
+
+        CSS computed by the styler for the cells (and for the index
+        and the column labels) is translated into styles with `css_style`;
+        every distinct set of declarations is resolved once and shared
+        by all cells using it. Raw values are written, so display formats
+        of the styler are not applied (but `number-format` declarations are).
+        Rows and columns hidden in the styler are skipped and so are
+        table styles (CSS selectors). Column labels are drawn with their
+        styles when the data frame is drawn with `draw_names = True`;
+        they have to be unique, also with names of the drawn index levels
+        (`index` or `level_<n>` for unnamed ones), and multi-level
+        labels are joined with spaces.
+
+        Parameters
+        ----------
+            styler : pandas.io.formats.style.Styler
+                Styler of a data frame.
+            index : bool
+                Should the index be drawn (as the first columns)
+                unless it is hidden in the styler.
+            style : dict
+                Base style of the data frame (below the styles from CSS).
+            **kwargs
+                Other arguments passed to the constructor;
+                styles of column labels are layered on top of `name_args`.
+        """
+        styler._compute()
+        data = styler.data
+        style = Style.make(style)
+        resolved = {}
+        def resolve(declarations):
+            key = tuple(declarations)
+            try:
+                return resolved[key]
+            except KeyError:
+                stl = resolved[key] = layer(style, css_style(key))
+                return stl
+        hidden_rows = set(getattr(styler, 'hidden_rows', []))
+        hidden_cols = set(getattr(styler, 'hidden_columns', []))
+        rows = [ i for i in range(data.shape[0]) if i not in hidden_rows ]
+
+        # Styles of cells (only styled cells are visited) ---
+        styles = np.empty(data.shape, dtype = object)
+        styles.fill(style)
+        for (i, j), declarations in styler.ctx.items():
+            if declarations:
+                styles[i, j] = resolve(declarations)
+        styles = styles[rows]
+
+        def label(x):
+            return ' '.join(map(str, x)) if isinstance(x, tuple) else x
+        # Elements are copied from a prototype (skipping validation)
+        proto = Element(None)
+        def make(value, stl):
+            elem = copy(proto)
+            elem.value = value
+            elem._style = stl
+            return elem
+
+        # Columns of elements ---
+        columns = OrderedDict()
+        def add(name, cells):
+            if name in columns:
+                raise ValueError('column `%s` is already defined '
+                                 '(labels of the styler are not unique).' % (name,))
+            columns[name] = cells
+        if index and not all(getattr(styler, 'hide_index_', [False])):
+            ctx_index = getattr(styler, 'ctx_index', {})
+            idx = data.index
+            for k in range(idx.nlevels):
+                name = idx.names[k]
+                if name is None:
+                    name = 'index' if idx.nlevels == 1 else 'level_%d' % k
+                values = idx.get_level_values(k)[rows].tolist()
+                add(name, [ make(v, resolve(ctx_index.get((i, k), ())))
+                            for v, i in zip(values, rows) ])
+        ctx_columns = getattr(styler, 'ctx_columns', {})
+        level = data.columns.nlevels - 1
+        col_args = dict(kwargs.pop('col_args', {}))
+        name_style = kwargs.get('name_args', {}).get('style')
+        for j in range(data.shape[1]):
+            if j in hidden_cols:
+                continue
+            name = label(data.columns[j])
+            values = data.iloc[rows, j].tolist()
+            add(name, [ make(v, stl) for v, stl
+                        in zip(values, styles[:, j].tolist()) ])
+            declarations = ctx_columns.get((level, j))
+            if declarations:
+                cargs = dict(col_args.get(name, {}))
+                nargs = dict(cargs.get('name_args', {}))
+                nargs['style'] = layer(name_style, nargs.get('style'),
+                                       css_style(declarations))
+                cargs['name_args'] = nargs
+                col_args[name] = cargs
+        return cls(pd.DataFrame(columns), style = style,
+                   col_args = col_args, **kwargs)
+
+    def _aggregate_functions(self):
+        """Get aggregate functions of the footer rows (in order)."""
+        aggs = self.aggregates
+        if isinstance(aggs, dict):
+            aggs = [ f for v in aggs.values() for f in ([v] if isinstance(v, str) else v) ]
+        elif isinstance(aggs, str):
+            aggs = [aggs]
+        return [ f for f in AGGREGATES if f in (aggs or []) ]
+
+    def _aggregate_values(self):
+        """Compute values of aggregates.
+
+        Returns
+        -------
+            OrderedDict
+                Maps column labels to `dict`s with values of their aggregates.
+        """
+        funcs = self._aggregate_functions()
+        if not funcs:
+            return OrderedDict()
+        # Like excel functions, only numbers count (not text nor booleans)
+        values = self.applymap(lambda e: e.value
+                               if isinstance(e.value, (int, float, np.number))
+                               and not isinstance(e.value, (bool, np.bool_))
+                               else np.nan).astype(float)
+        if isinstance(self.aggregates, dict):
+            spec = OrderedDict((c, [f] if isinstance(f, str) else f)
+                               for c, f in self.aggregates.items())
+        else:
+            spec = OrderedDict((c, funcs) for c in values.columns[values.notnull().any()])
+        result = values.agg([ AGGREGATES[f][1] for f in funcs ])
+        result.index = funcs
+        return OrderedDict((c, { f: result.at[f, c] for f in fs })
+                           for c, fs in spec.items())
+
+    def _draw_aggregates(self, x, cols, spans, be, **kwargs):
+        """Draw aggregate rows as formulas with cached results.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate of the first aggregate row.
+            cols : OrderedDict
+                Drawn column series (by labels).
+            spans : OrderedDict
+                Ranges of data of the drawn columns (by labels).
+            be : xlsxpandas.backends.Backend
+                Backend to draw with.
+            **kwargs
+                Optional keyword parameters passed to the write methods.
+        """
+        # Parts of a spilled data frame draw totals of the whole columns
+        aggs, previous = getattr(self, '_totals', None) or \
+                         (self._aggregate_values(), [])
+        for f in self._aggregate_functions():
+            for k, (index, col) in enumerate(cols.items()):
+                x0, y0, x1, y1 = spans[index]
+                style = layer(col.values[-1].style, self.aggregate_style) \
+                        if col.size else self.aggregate_style
+                fmt = be.format(style)
+                if y1 > y0:
+                    be.merge(x, y0, x, y1, fmt)
+                if f in aggs.get(index, {}):
+                    value = aggs[index][f]
+                    refs = [ '%s!%s:%s' % (quote_sheetname(name),
+                                           xl_rowcol_to_cell(x0, y0),
+                                           xl_rowcol_to_cell(x0 + n - 1, y0))
+                             for name, n in previous ]
+                    refs.append('%s:%s' % (xl_rowcol_to_cell(x0, y0),
+                                           xl_rowcol_to_cell(x1, y0)))
+                    formula = '=%s(%s)' % (AGGREGATES[f][0], ','.join(refs))
+                    value = EMPTY_AGGREGATES[f] if pd.isnull(value) else value
+                    be.write(x, y0, formula, fmt, 'write_formula', value = value)
+                elif k == 0:
+                    be.write(x, y0, self.aggregate_labels.get(f, f), fmt)
+                else:
+                    be.write(x, y0, None, fmt)
+            x += 1
+
+    def split_sizes(self, draw_names=False, **kwargs):
+        """Get sizes used for splitting the data frame.
+
+        Parameters
+        ----------
+            draw_names : bool
+                Are column names drawn.
+            **kwargs
+                Other drawing arguments (not used).
+
+        Returns
+        -------
+            tuple
+                Height of the header, heights of rows and widths of columns.
+        """
+        header = 0
+        if draw_names:
+            header = max([ self.col_args.get(c, {}).get('height', 1) if c else 0
+                           for c in self.columns ] + [0])
+        # Room for aggregate rows is left in every part
+        # (they are drawn only under the last part of rows)
+        header += len(self._aggregate_functions())
+        heights = self.applymap(lambda e: e.height).max(axis = 1).values
+        widths = self.applymap(lambda e: e.width).max(axis = 0).values
+        return header, heights, widths
+
+    def split(self, rows, cols, previous=()):
+        """Get a part of the data frame.
+
+        Aggregate rows are kept only in the last part of rows, where they
+        aggregate whole columns (their formulas refer also to the rows
+        drawn in other worksheets).
+
+        Parameters
+        ----------
+            rows : tuple
+                Start and stop of the range of rows.
+            cols : tuple
+                Start and stop of the range of columns.
+            previous : list of tuples
+                Names of worksheets and numbers of worksheet rows
+                of the preceding parts of rows (of the same columns),
+                which are drawn at the same position as this part.
+        """
+        df = self.iloc[rows[0]:rows[1], cols[0]:cols[1]]
+        aggs = self.aggregates if rows[1] >= self.shape[0] else None
+        if isinstance(aggs, dict):
+            aggs = { k: v for k, v in aggs.items() if k in df.columns }
+        part = DataFrame(df, col_args = self.col_args, name_args = self.name_args,
+                         conditional_formats = self.conditional_formats,
+                         aggregates = aggs, aggregate_style = self.aggregate_style,
+                         aggregate_labels = self.aggregate_labels)
+        if aggs and rows[0] > 0:
+            part._totals = (self._aggregate_values(), list(previous))
+        return part
+
+    def _copy_elements(self):
+        """Copy the data frame together with its elements."""
+        return DataFrame(pd.DataFrame(self).applymap(copy),
+                         col_args = self.col_args, name_args = self.name_args,
+                         conditional_formats = self.conditional_formats,
+                         aggregates = self.aggregates,
+                         aggregate_style = self.aggregate_style,
+                         aggregate_labels = self.aggregate_labels)
 
     def setprop(self, propname, value, inplace=False):
         """Set a property of all elements in the data frame.
@@ -676,15 +1423,12 @@ class DataFrame(pd.DataFrame):
             inplace : bool
                 Should assignment be done in place; defaults to `False`.
         """
-        df = self if inplace else self.copy()
-        for i in df.index:
-            for j in df.columns:
-                try:
-                    setattr(df.iloc[i, j], propname, value)
-                except ValueError:
-                    setattr(df.loc[i, j], propname, value)
+        df = self if inplace else self._copy_elements()
+        for i in range(df.shape[0]):
+            for j in range(df.shape[1]):
+                setattr(df.iat[i, j], propname, value)
         if not inplace:
-            return self
+            return df
 
     def addstyle(self, style, inplace=False):
         """Add additional styling to the existing style.
@@ -699,17 +1443,77 @@ class DataFrame(pd.DataFrame):
             inplace : bool
                 Should assignment be done in place; defaults to `False`.
         """
-        df = self if inplace else self.copy()
-        for i in df.index:
-            for j in df.columns:
-                try:
-                    df.iloc[i, j].style = {**df.iloc[i, j].style, **style}
-                except ValueError:
-                    df.loc[i, j].style = {**df.loc[i, j].style, **style}
+        df = self if inplace else self._copy_elements()
+        style = Style.make(style)
+        for i in range(df.shape[0]):
+            for j in range(df.shape[1]):
+                elem = df.iat[i, j]
+                elem.style = layer(elem.style, style)
+        if not inplace:
+            return df
+
+    def mapstyle(self, mapping, columns=None, inplace=False):
+        """Add styles mapped from values of the elements.
+
+        Values of all mapped columns are mapped at once;
+        elements with the same style and the same mapped style
+        share the resulting style (and its format).
+
+        Parameters
+        ----------
+            mapping : StyleMap or dict
+                Style map or its definition.
+            columns : list or None
+                Labels of the mapped columns; `None` means all columns.
+            inplace : bool
+                Should assignment be done in place; defaults to `False`.
+        """
+        df = self if inplace else self._copy_elements()
+        cols = range(df.shape[1]) if columns is None else \
+               [ df.columns.get_loc(c) for c in columns ]
+        elems = df.values[:, list(cols)].T.ravel().tolist()
+        styles = StyleMap.make(mapping).lookup([ e.value for e in elems ])
+        for elem, stl in zip(elems, styles.tolist()):
+            if stl is not None:
+                elem.style = layer(elem.style, stl)
         if not inplace:
             return df
 
-    def draw(self, x, y, ws, wb, na_rep, draw_names=False, **kwargs):
+    def _columns(self):
+        """Make column series as they are drawn (by labels)."""
+        cols = OrderedDict()
+        for index, col in self.iteritems():
+            cargs = self.col_args.get(index, {}).copy()
+            stl   = cargs.pop('style', {})
+            nargs = {**self.name_args, **cargs.pop('name_args', {})}
+            nargs['style'] = layer(nargs.get('style'), stl)
+            cols[index] = Series(col, name_args = nargs, **cargs) \
+                          .addstyle(stl)
+        return cols
+
+    def data_positions(self, x=0, y=0, draw_names=False, **kwargs):
+        """Get coordinates of the cells holding values of the elements
+        (in row-major order).
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the DataFrame.
+            y : int
+                Y-coordinate for the upper-left corner of the DataFrame.
+            draw_names : bool
+                Are column names drawn.
+            **kwargs
+                Ignored; accepted for compatibility with the draw method.
+        """
+        columns = []
+        for col in self._columns().values():
+            columns.append(col.data_positions(x, y, draw_name = draw_names))
+            y += col.width
+        return [ pos for row in zip(*columns) for pos in row ]
+
+    def draw(self, x, y, ws, wb, na_rep, draw_names=False,
+             default_formats=None, **kwargs):
         """Draw DataFrame in the worksheet
 
         Parameters
@@ -718,27 +1522,89 @@ class DataFrame(pd.DataFrame):
                 X-coordinate for the upper-left corner of the DataFrame.
             y : int
                 Y-coordinate for the upper-left corner of the DataFrame.
-            ws : xlsxwriter.worksheet.Worksheet
-                Worksheet to write the Element in.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the Element in.
             wb : xlsxwriter.workbook.Workbook
                 Workbook the worksheet is in.
             na_rep : str
                 String representation of missing values.
             draw_names : bool
                 Should column names be draw; defaults to `False`.
+            default_formats : 'columns', 'rows' or None
+                If set, then the most common style of every column
+                (or a style shared by all elements of a row) is applied once
+                as the column's (row's) default format and only the elements
+                with other styles are written with their own formats.
+                Row formats are used only for rows of elements of height 1.
+                Note that default formats apply also to empty cells
+                outside of the data frame.
             **kwargs
                 Optional keyword parameters passed to the write methods.
         """
-        for index, col in self.iteritems():
-            cargs = self.col_args.get(index, {})
-            stl   = cargs.pop('style', {})
-            nargs = {**self.name_args, **cargs.pop('name_args', {})}
-            nargs['style'] = {**nargs.get('style', {}), **stl}
-            col = Series(col, name_args = nargs, **cargs) \
-                  .addstyle(stl)
-            col.draw(x, y, ws, wb, na_rep, draw_name = draw_names, **kwargs)
+        if default_formats not in ('columns', 'rows', None):
+            raise ValueError("`default_formats` has to be 'columns', 'rows' or None.")
+        be = get_backend(ws, wb)
+        if be.draft:
+            # Drafts have no formats to share
+            default_formats = None
+        cols = self._columns()
+
+        spans = OrderedDict()
+        for index, col in cols.items():
+            x0 = x + col.name.height if draw_names and col.name else x
+            spans[index] = (x0, y, x0 + col.height - 1, y + col.width - 1)
             y += col.width
 
+        # Determine default formats ---
+        defaults = { index: None for index in cols }
+        row_defaults = OrderedDict()
+        if default_formats == 'columns':
+            for index, col in cols.items():
+                keys = [ style_key(e.style) for e in col.values ]
+                if not keys:
+                    continue
+                key = Counter(keys).most_common(1)[0][0]
+                dstl = col.values[keys.index(key)].style
+                defaults[index] = dstl
+        elif default_formats == 'rows' and \
+            len(set(s[0] for s in spans.values())) == 1:
+            x0 = next(iter(spans.values()))[0]
+            for index in cols:
+                defaults[index] = [None] * self.shape[0]
+            for i in range(self.shape[0]):
+                elems = [ col.values[i] for col in cols.values() ]
+                keys = set(style_key(e.style) for e in elems)
+                if len(keys) == 1 and all(e.height == 1 for e in elems):
+                    row_defaults[x0] = elems[0].style
+                    for index in cols:
+                        defaults[index][i] = elems[0].style
+                x0 += elems[0].height
+
+        for index, col in cols.items():
+            x0, y0, x1, y1 = spans[index]
+            col.draw(x, y0, be, wb, na_rep, draw_name = draw_names,
+                     default_style = defaults[index], **kwargs)
+            if default_formats == 'columns' and defaults[index] is not None:
+                be.set_column(y0, y1, fmt = be.format(defaults[index]))
+        for row, dstl in row_defaults.items():
+            be.set_row(row, fmt = be.format(dstl))
+
+        # Draw aggregate rows ---
+        if spans:
+            x1 = max(r[2] for r in spans.values()) + 1
+            if be.draft_stop is None or x1 < be.draft_stop:
+                self._draw_aggregates(x1, cols, spans, be, **kwargs)
+
+        # Apply conditional formats ---
+        for rule in self.conditional_formats if spans else []:
+            if rule.columns is None:
+                ranges = list(spans.values())
+                ranges = [ (min(r[0] for r in ranges), ranges[0][1],
+                            max(r[2] for r in ranges), ranges[-1][3]) ]
+            else:
+                ranges = [ spans[c] for c in rule.columns if c in spans ]
+            rule.draw(ranges, be, wb)
+
 ###############################################################################
 
 class Dictionary(object):
@@ -762,6 +1628,8 @@ class Dictionary(object):
         if isinstance(value, str):
             value = self.load_config(value)
         self._structure = validate_param(value, 'structure', list)
+        self._frame = None
+        self._geometry = None
 
     @property
     def hspace(self):
@@ -770,6 +1638,7 @@ class Dictionary(object):
     @hspace.setter
     def hspace(self, value):
         self._hspace = validate_param(value, 'hspace', int, True, 'x >= 0')
+        self._geometry = None
 
     @property
     def vspace(self):
@@ -778,6 +1647,7 @@ class Dictionary(object):
     @vspace.setter
     def vspace(self, value):
         self._vspace = validate_param(value, 'vspace', int, True, 'x >= 0')
+        self._geometry = None
 
     @property
     def keys_params(self):
@@ -807,34 +1677,84 @@ class Dictionary(object):
 
     @property
     def width(self):
-        """positive int: Width of the dictionary."""
+        """positive int: Width of the dictionary.
+
+        Width and height are computed once; they are recomputed
+        only after `structure`, `hspace` or `vspace` is set again
+        (so a structure modified in place has to be reassigned).
+        """
+        return self._get_geometry()['width']
+
+    @property
+    def height(self):
+        """positive int: Height of the dictionary."""
+        return self._get_geometry()['height']
+
+    def _get_geometry(self):
+        """Compute (or get the cached) geometry of the dictionary."""
+        if self._geometry is None:
+            if self._frame is None:
+                self._geometry = self._structure_geometry()
+            else:
+                self._geometry = self._frame_geometry()
+        return self._geometry
+
+    def _structure_geometry(self):
+        """Compute width and height of a dictionary defined by a structure."""
         width = 0
+        height = 0
         for elem in self.structure:
             w = elem['key'].get('width', 1)
             w += elem['value'].get('width', 1)
             w += elem.get('hspace', self.hspace)
             if w > width:
                 width = w
-        return width
-
-    @property
-    def height(self):
-        """positive int: Height of the dictionary."""
-        height = 0
-        for elem in self.structure:
-            w = elem['key'].get('height', 1)
+            h = elem['key'].get('height', 1)
             if isinstance(elem['value']['value'], list):
                 try:
-                    vw = \
+                    vh = \
                     sum([ e.get('height', 1) for e in elem['value']['value'] ])
                 except AttributeError:
-                    vw = \
+                    vh = \
                     len(elem['value']['value'])*elem['value'].get('height', 1)
-                if vw > w:
-                    w = vw
-            height += w
+                if vh > h:
+                    h = vh
+            height += h
             height += elem.get('vspace', self.vspace)
-        return height
+        return {'width': width, 'height': height}
+
+    def _frame_geometry(self):
+        """Compute the layout of a dictionary built from a data frame.
+
+        Positions of all keys and values are computed at once:
+        an entry takes as many rows as it has values (at least one)
+        and it is followed by `vspace` empty rows.
+        """
+        keys, values = self._frame
+        n = len(keys)
+        nested = values.dtype.kind == 'O' and \
+            any(isinstance(v, _LIST_TYPES) for v in values)
+        if nested:
+            counts = np.fromiter((len(v) if isinstance(v, _LIST_TYPES) else 1
+                                  for v in values), int, n)
+            flat = [ u for v in values
+                     for u in (v if isinstance(v, _LIST_TYPES) else (v,)) ]
+            values = pd.Series(flat, dtype=object).infer_objects().values
+        else:
+            counts = np.ones(n, dtype=int)
+        heights = np.maximum(counts, 1) + self.vspace
+        ends = np.cumsum(heights)
+        key_rows = ends - heights
+        # Values of an entry take consecutive rows starting at its key row
+        starts = np.cumsum(counts) - counts
+        value_rows = np.repeat(key_rows - starts, counts) + np.arange(counts.sum())
+        return {
+            'width': self.hspace + 2 if n else 0,
+            'height': int(ends[-1]) if n else 0,
+            'key_rows': key_rows,
+            'value_rows': value_rows,
+            'values': values
+        }
 
     # -------------------------------------------------------------------------
 
@@ -866,6 +1786,32 @@ class Dictionary(object):
         self.values_params = values_params
         self.context = context
 
+    @classmethod
+    def from_frame(cls, df, key='key', value='value', **kwargs):
+        """Make a dictionary from a key/value data frame.
+
+        Keys and values are kept as columns, so the layout is computed
+        with array operations and the dictionary is drawn with typed
+        column writes (like `Block`) instead of an element per cell.
+        Values are not evaluated as `@eval@` expressions.
+
+        Parameters
+        ----------
+            df : pandas.DataFrame
+                Data frame with one row per entry.
+            key : str
+                Column of keys.
+            value : str
+                Column of values; a value may be a list (or an array)
+                of values written one below another.
+            **kwargs
+                Other arguments passed to the constructor
+                (`hspace`, `vspace`, `keys_params` and `values_params`).
+        """
+        dct = cls([], **kwargs)
+        dct._frame = (np.asarray(df[key].values), np.asarray(df[value].values))
+        return dct
+
     @staticmethod
     def load_config(path=None):
         """Loads config from a config.yaml file.
@@ -880,6 +1826,7 @@ class Dictionary(object):
             list
                 config parsed to a `list` of `OrderedDicts`.
         """
+        import yaml
         def ordered_load(stream, Loader=yaml.Loader, object_pairs_hook=OrderedDict):
             class OrderedLoader(Loader):
                 pass
@@ -918,8 +1865,8 @@ class Dictionary(object):
                 X-coordinate for the upper-left corner of the Dictionary.
             y : int
                 Y-coordinate for the upper-left corner of the Dictionary.
-            ws : xlsxwriter.worksheet.Worksheet
-                Worksheet to write the Element in.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the Element in.
             wb : xlsxwriter.workbook.Workbook
                 Workbook the worksheet is in.
             na_rep : str
@@ -927,36 +1874,1932 @@ class Dictionary(object):
             **kwargs
                 Optional keyword parameters passed to the write methods.
         """
+        ws = get_backend(ws, wb)
+        if self._frame is not None:
+            self._draw_frame(x, y, ws, na_rep)
+            return
+        stop = ws.draft_stop
+        for x, y, elem, is_value in self._layout(x, y):
+            if stop is not None and x >= stop:
+                continue
+            elem.draw(x, y, ws, wb, na_rep, **kwargs)
+
+    def _draw_frame(self, x, y, be, na_rep):
+        """Draw a dictionary built from a data frame.
+
+        Keys and values are written with `write_block`
+        in runs of consecutive rows with the same format
+        (cell by cell when a template is recorded, so that values
+        may be substituted).
+        """
+        write_block = partial(Backend.write_block, be) if be.recording else be.write_block
+        geom = self._get_geometry()
+        columns = (
+            (self._frame[0], geom['key_rows'], y, self.keys_params),
+            (geom['values'], geom['value_rows'], y + self.hspace + 1, self.values_params)
+        )
+        for col, rows, j, style in columns:
+            formats, codes = self._frame_formats(be, col, style)
+            breaks = np.flatnonzero((np.diff(rows) != 1) | (np.diff(codes) != 0)) + 1
+            for start, stop in zip(np.r_[0, breaks], np.r_[breaks, len(rows)]):
+                write_block(x + int(rows[start]), j, [col[start:stop]],
+                            [formats[codes[start]]], na_rep)
+
+    @staticmethod
+    def _frame_formats(be, values, style):
+        """Get formats of a column of a dictionary built from a data frame.
+
+        Dates get date number formats (unless the style has one),
+        also when they are mixed with other values.
+
+        Returns
+        -------
+            tuple
+                List of formats and codes of formats of the values.
+        """
+        codes = np.zeros(len(values), dtype=int)
+        if 'num_format' in style:
+            return [be.format(layer(style))], codes
+        if values.dtype.kind in 'Mm':
+            return [be.format(layer(style, {'num_format': date_num_format(values)}))], codes
+        styles = [layer(style)]
+        if values.dtype.kind == 'O':
+            num_formats = {}
+            for i, v in enumerate(values):
+                if isinstance(v, (date, time, timedelta)) and not is_null(v):
+                    nf = date_num_format(datetime_value(v))
+                    if nf not in num_formats:
+                        num_formats[nf] = len(styles)
+                        styles.append(layer(style, {'num_format': nf}))
+                    codes[i] = num_formats[nf]
+        return [ be.format(s) for s in styles ], codes
+
+    def data_positions(self, x=0, y=0, **kwargs):
+        """Get coordinates of the cells holding values (not keys) of the Dictionary.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the Dictionary.
+            y : int
+                Y-coordinate for the upper-left corner of the Dictionary.
+            **kwargs
+                Ignored; accepted for compatibility with the draw method.
+        """
+        if self._frame is not None:
+            j = y + self.hspace + 1
+            return [ (x + i, j) for i in self._get_geometry()['value_rows'].tolist() ]
+        return [ (x, y) for x, y, elem, is_value in self._layout(x, y) if is_value ]
+
+    def _layout(self, x, y):
+        """Lay out keys and values of the dictionary.
+
+        The structure definition is not modified,
+        so the dictionary may be drawn repeatedly.
+
+        Yields
+        ------
+            tuple
+                Coordinates, the element and a flag indicating
+                whether the element is a value.
+        """
         y0 = y
         for elem in self.structure:
-            elem['key']['value'] = self._process_value(elem['key']['value'])
-            elem['key']['style'] = \
-            {**self.keys_params, **elem['key'].get('style', {})}
-            if isinstance(elem['value']['value'], list):
-                elem['value']['value'] = \
-                [ self._process_value(x) for x in elem['value']['value'] ]
+            kdef = {**elem['key'],
+                    'value': self._process_value(elem['key']['value']),
+                    'style': layer(self.keys_params, elem['key'].get('style'))}
+            vdef = dict(elem['value'])
+            values = vdef['value']
+            if isinstance(values, list):
+                values = [ self._process_value(v) for v in values ]
             else:
-                elem['value']['value'] = \
-                self._process_value(elem['value']['value'])
-            elem['value']['style'] = \
-            {**self.values_params, **elem['value'].get('style',{})}
-            key = Element(**elem['key'])
-            key.draw(x, y, ws, wb, na_rep, **kwargs)
+                values = self._process_value(values)
+            vdef['style'] = layer(self.values_params, vdef.get('style'))
+            yield x, y, Element(**kdef), False
             y += self.hspace + 1
-            values = elem['value']['value']
             if isinstance(values, list):
-                for value in elem['value']['value']:
+                for value in values:
                     if isinstance(value, (dict, OrderedDict)):
-                        e = Element(**{**elem['value'], **value})
+                        e = Element(**{**vdef, **value})
                     else:
-                        e = Element(**{**elem['value'], 'value': value})
-                    e.draw(x, y, ws, wb, na_rep, **kwargs)
+                        e = Element(**{**vdef, 'value': value})
+                    yield x, y, e, True
                     x += e.height
                 x += elem.get('vspace', self.vspace)
             else:
-                e = Element(**{**elem['value'], 'value': values})
-                e.draw(x, y, ws, wb, na_rep, **kwargs)
+                e = Element(**{**vdef, 'value': values})
+                yield x, y, e, True
                 x += e.height + elem.get('vspace', self.vspace)
             y = y0
 
 ###############################################################################
+
+class Block(object):
+    """Block of typed columns.
+
+    It is a table that is drawn straight from its columns
+    (`numpy` arrays, including memory-mapped and structured ones,
+    `pandas` series or `pyarrow` arrays) without converting values
+    to elements. Columns are not copied; they are read in bands of rows,
+    so only a single band is ever converted to python values.
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def columns(self):
+        """OrderedDict: Columns of the block (by names)."""
+        return self._columns
+    @columns.setter
+    def columns(self, value):
+        value = validate_param(value, 'columns', dict)
+        columns = OrderedDict()
+        for name, col in value.items():
+            if isinstance(col, (pd.Series, pd.Index)):
+                # Timezone-aware datetimes are kept as pandas arrays
+                tz = isinstance(col.dtype, pd.DatetimeTZDtype)
+                col = col.array if tz else col.values
+            elif not hasattr(col, 'to_numpy'):
+                col = np.asarray(col)
+            columns[name] = col
+        if len(set(len(col) for col in columns.values())) > 1:
+            raise ValueError('columns of a block have to be of equal lengths.')
+        self._columns = columns
+
+    @property
+    def header(self):
+        """bool: Should column names be drawn above the columns."""
+        return self._header
+    @header.setter
+    def header(self, value):
+        self._header = validate_param(value, 'header', bool)
+
+    @property
+    def style(self):
+        """dict: Base style of the block."""
+        return self._style
+    @style.setter
+    def style(self, value):
+        self._style = validate_param(value, 'style', dict)
+
+    @property
+    def header_style(self):
+        """dict: Additional styling of the header."""
+        return self._header_style
+    @header_style.setter
+    def header_style(self, value):
+        self._header_style = validate_param(value, 'header_style', dict)
+
+    @property
+    def col_styles(self):
+        """dict: Additional styling of columns (by names)."""
+        return self._col_styles
+    @col_styles.setter
+    def col_styles(self, value):
+        self._col_styles = validate_param(value, 'col_styles', dict)
+
+    @property
+    def col_widths(self):
+        """dict: Widths of columns (by names)."""
+        return self._col_widths
+    @col_widths.setter
+    def col_widths(self, value):
+        self._col_widths = validate_param(value, 'col_widths', dict)
+
+    @property
+    def na_rep(self):
+        """str or None: String representation of missing values.
+        Drawer's representation is used if `None`.
+        """
+        return self._na_rep
+    @na_rep.setter
+    def na_rep(self, value):
+        self._na_rep = validate_param(value, 'na_rep', (str, type(None)))
+
+    @property
+    def timezone(self):
+        """str, tzinfo or None: Timezone timezone-aware datetimes are converted to
+        (before they are written as excel dates, which have no timezones).
+        Wall time in their own timezones is written if `None`.
+        """
+        return self._timezone
+    @timezone.setter
+    def timezone(self, value):
+        self._timezone = validate_param(value, 'timezone', (str, tzinfo, type(None)))
+
+    @property
+    def chunksize(self):
+        """positive int: Number of rows converted and written at once."""
+        return self._chunksize
+    @chunksize.setter
+    def chunksize(self, value):
+        self._chunksize = validate_param(value, 'chunksize', int, True, 'x > 0')
+
+    @property
+    def nrows(self):
+        """int: Number of data rows (read-only)."""
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @property
+    def width(self):
+        """int: Width of the block (read-only)."""
+        return len(self.columns)
+
+    @property
+    def height(self):
+        """int: Height of the block including the header (read-only)."""
+        return self.nrows + int(self.header)
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, columns, header=True, style={}, header_style={},
+                 col_styles={}, col_widths={}, na_rep=None, timezone=None,
+                 chunksize=65536):
+        """Initialization method.
+
+        Parameters
+        ----------
+        columns : dict
+            Columns given as 1-dimensional array-likes (by names).
+        header : bool
+            Should column names be drawn above the columns.
+        style : dict
+            Base style of the block.
+        header_style : dict
+            Additional styling of the header.
+        col_styles : dict
+            Additional styling of columns (by names).
+        col_widths : dict
+            Widths of columns (by names).
+        na_rep : str or None
+            String representation of missing values (including `NaT`);
+            defaults to the drawer's one.
+        timezone : str, tzinfo or None
+            Timezone timezone-aware datetimes are converted to;
+            their wall time is written if `None`.
+        chunksize : int
+            Number of rows converted and written at once.
+        """
+        self.columns = columns
+        self.header = header
+        self.style = style
+        self.header_style = header_style
+        self.col_styles = col_styles
+        self.col_widths = col_widths
+        self.na_rep = na_rep
+        self.timezone = timezone
+        self.chunksize = chunksize
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        """Make a block from a `pandas` data frame.
+
+        Parameters
+        ----------
+            df : pandas.DataFrame
+                Data frame; columns of `numpy` dtypes are not copied.
+            **kwargs
+                Other arguments passed to the constructor.
+        """
+        return cls(OrderedDict((c, df[c]) for c in df.columns), **kwargs)
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        """Make a block from a `numpy` structured array.
+
+        Parameters
+        ----------
+            records : numpy.ndarray
+                Structured (record) array; may be memory-mapped.
+                Columns are views of its fields.
+            **kwargs
+                Other arguments passed to the constructor.
+        """
+        return cls(OrderedDict((n, records[n]) for n in records.dtype.names),
+                   **kwargs)
+
+    @classmethod
+    def from_arrow(cls, table, **kwargs):
+        """Make a block from a `pyarrow` table or record batch.
+
+        Parameters
+        ----------
+            table : pyarrow.Table or pyarrow.RecordBatch
+                Arrow data; columns are converted only band by band while drawing.
+            **kwargs
+                Other arguments passed to the constructor.
+        """
+        return cls(OrderedDict(zip(table.schema.names, table.columns)), **kwargs)
+
+    @classmethod
+    def from_ipc(cls, path, columns=None, memory_map=True, **kwargs):
+        """Make a block from a Feather or Arrow IPC file.
+
+        Parameters
+        ----------
+            path : str
+                Path to the file.
+            columns : list or None
+                Names of columns to read; all if `None`.
+            memory_map : bool
+                Should the file be memory-mapped. Data of uncompressed files
+                is then read straight from the mapping without copying.
+            **kwargs
+                Other arguments passed to the constructor.
+        """
+        try:
+            from pyarrow import feather
+        except ImportError:
+            raise ImportError('`pyarrow` is required for reading Arrow IPC files.')
+        table = feather.read_table(path, columns=columns, memory_map=memory_map)
+        return cls.from_arrow(table, **kwargs)
+
+    def split_sizes(self, **kwargs):
+        """Get sizes used for splitting the block.
+
+        Parameters
+        ----------
+            **kwargs
+                Drawing arguments (not used).
+
+        Returns
+        -------
+            tuple
+                Height of the header, heights of rows and widths of columns.
+        """
+        return int(self.header), np.ones(self.nrows, dtype=int), \
+               np.ones(self.width, dtype=int)
+
+    def split(self, rows, cols):
+        """Get a part of the block (columns are not copied).
+
+        Parameters
+        ----------
+            rows : tuple
+                Start and stop of the range of rows.
+            cols : tuple
+                Start and stop of the range of columns.
+        """
+        names = list(self.columns)[cols[0]:cols[1]]
+        columns = OrderedDict((n, self._slice(self.columns[n], *rows))
+                              for n in names)
+        return Block(columns, self.header, self.style, self.header_style,
+                     self.col_styles, self.col_widths, self.na_rep,
+                     self.timezone, self.chunksize)
+
+    @staticmethod
+    def _slice(col, start, stop):
+        """Get a slice of a column (without copying)."""
+        if hasattr(col, 'slice'):
+            return col.slice(start, stop - start)
+        return col[start:stop]
+
+    def _band(self, col, start, stop):
+        """Get a band of rows of a column as an array.
+
+        Timezone-aware datetimes are converted to naive ones
+        according to the block's timezone policy.
+        """
+        col = self._slice(col, start, stop)
+        if hasattr(col, 'slice'):
+            tz = getattr(col.type, 'tz', None)
+            try:
+                col = col.to_numpy(zero_copy_only=False)
+            except TypeError:
+                col = col.to_numpy()
+            if tz is not None:
+                col = pd.DatetimeIndex(col).tz_localize('UTC').tz_convert(tz)
+        if isinstance(getattr(col, 'dtype', None), pd.DatetimeTZDtype):
+            col = pd.DatetimeIndex(col)
+            if self.timezone is not None:
+                col = col.tz_convert(self.timezone)
+            col = col.tz_localize(None).values
+        return col
+
+    def _column_style(self, name, col):
+        """Get a style of a column (with a date format for datetime columns).
+
+        The date format is determined by all rows of the column;
+        columns other than `numpy` arrays are checked band by band.
+        """
+        style = {**self.style, **self.col_styles.get(name, {})}
+        if 'num_format' in style:
+            return style
+        kind = getattr(getattr(self._band(col, 0, 0), 'dtype', None), 'kind', None)
+        if kind is None or kind not in 'Mm':
+            return style
+        if isinstance(col, np.ndarray):
+            style['num_format'] = date_num_format(col)
+            return style
+        formats = [ date_num_format(self._band(col, start, start + self.chunksize))
+                    for start in range(0, len(col), self.chunksize) ] or \
+                  [ date_num_format(self._band(col, 0, 0)) ]
+        with_time = DATE_FORMATS['datetime']
+        style['num_format'] = with_time if with_time in formats else formats[0]
+        return style
+
+    def draw(self, x, y, ws, wb, na_rep, **kwargs):
+        """Draw Block in the worksheet.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the Block.
+            y : int
+                Y-coordinate for the upper-left corner of the Block.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the Block in.
+            wb : xlsxwriter.workbook.Workbook
+                Workbook the worksheet is in.
+            na_rep : str
+                String representation of missing values.
+            **kwargs
+                Not used; accepted for compatibility with other elements.
+        """
+        be = get_backend(ws, wb)
+        na_rep = na_rep if self.na_rep is None else self.na_rep
+        names = list(self.columns)
+        if self.header:
+            fmt = be.format({**self.style, **self.header_style})
+            for j, name in enumerate(names):
+                be.write(x, y + j, name, fmt)
+            x += 1
+        columns = list(self.columns.values())
+        formats = [ be.format(self._column_style(n, col))
+                    for n, col in zip(names, columns) ]
+        for start in range(0, self.nrows, self.chunksize):
+            if be.draft_stop is not None and x + start >= be.draft_stop:
+                break
+            stop = min(start + self.chunksize, self.nrows)
+            band = [ self._band(col, start, stop) for col in columns ]
+            be.write_block(x + start, y, band, formats, na_rep)
+        for j, name in enumerate(names):
+            if name in self.col_widths:
+                be.set_column(y + j, y + j, float(self.col_widths[name]))
+
+###############################################################################
+
+
+class SparseTable(object):
+    """Sparse table of values.
+
+    It is a table stored as coordinate arrays of its non-empty cells,
+    so it is built and drawn in time proportional to the number of values
+    rather than to the area of the table. Only cells with values and empty cells
+    with additional styling (of regions or boundaries) are written;
+    other empty cells are left untouched.
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def rows(self):
+        """numpy.ndarray: Row indices of the cells with values."""
+        return self._rows
+
+    @property
+    def cols(self):
+        """numpy.ndarray: Column indices of the cells with values."""
+        return self._cols
+
+    @property
+    def values(self):
+        """numpy.ndarray: Values of the cells."""
+        return self._values
+
+    @property
+    def shape(self):
+        """tuple: Number of rows and columns of the table."""
+        return self._shape
+    @shape.setter
+    def shape(self, value):
+        if value is None:
+            value = (int(self.rows.max()) + 1 if self.rows.size else 0,
+                     int(self.cols.max()) + 1 if self.cols.size else 0)
+        value = tuple(validate_param(value, 'shape', (tuple, list)))
+        if len(value) != 2 or (self.rows.size and (self.rows.max() >= value[0] or
+                                                   self.cols.max() >= value[1])):
+            raise ValueError('`shape` has to be a pair covering all the cells.')
+        self._shape = value
+
+    @property
+    def style(self):
+        """dict: Base style of the cells with values."""
+        return self._style
+    @style.setter
+    def style(self, value):
+        self._style = validate_param(value, 'style', dict)
+
+    @property
+    def regions(self):
+        """list of dicts: Styles of rectangular regions
+        (with 'rows' and 'cols' ranges and 'style').
+        """
+        return self._regions
+    @regions.setter
+    def regions(self, value):
+        value = validate_param(value, 'regions', list)
+        regions = []
+        for region in value:
+            rows = region.get('rows') or (0, self.shape[0])
+            cols = region.get('cols') or (0, self.shape[1])
+            regions.append({'rows': (max(rows[0], 0), min(rows[1], self.shape[0])),
+                            'cols': (max(cols[0], 0), min(cols[1], self.shape[1])),
+                            'style': validate_param(region.get('style', {}),
+                                                    'style', dict)})
+        self._regions = regions
+
+    @property
+    def na_rep(self):
+        """str or None: String representation of missing values.
+        Drawer's representation is used if `None`.
+        """
+        return self._na_rep
+    @na_rep.setter
+    def na_rep(self, value):
+        self._na_rep = validate_param(value, 'na_rep', (str, type(None)))
+
+    @property
+    def height(self):
+        """int: Height of the table (read-only)."""
+        return self.shape[0]
+
+    @property
+    def width(self):
+        """int: Width of the table (read-only)."""
+        return self.shape[1]
+
+    @property
+    def size(self):
+        """int: Number of cells with values (read-only)."""
+        return self.values.size
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, rows, cols, values, shape=None, style={}, regions=[],
+                 borders=None, top={}, bottom={}, left={}, right={}, na_rep=None):
+        """Initialization method.
+
+        Parameters
+        ----------
+        rows : array-like of ints
+            Row indices of the cells with values (relative to the table).
+        cols : array-like of ints
+            Column indices of the cells with values.
+        values : array-like
+            Values of the cells.
+        shape : tuple or None
+            Number of rows and columns of the table;
+            defaults to the smallest one covering all the cells.
+        style : dict
+            Base style of the cells with values.
+        regions : list of dicts
+            Additional styling of rectangular regions given as `dict`s
+            with 'rows' and 'cols' ranges (`(start, stop)` tuples;
+            whole table if not given) and 'style'.
+            Later regions override earlier ones. Empty cells in styled regions
+            are written as blanks (in time proportional to the region's area).
+        borders : int or None
+            Set border definitions for boundary cells.
+        top : int or dict
+            Additional styling for the top row of the table;
+            if int then it is a border value.
+        bottom : int or dict
+            Additional styling for the bottom row of the table.
+        left : int or dict
+            Additional styling for the leftmost column of the table.
+        right : int or dict
+            Additional styling for the rightmost column of the table.
+        na_rep : str or None
+            String representation of missing values;
+            defaults to the drawer's one.
+        """
+        self._rows = np.asarray(rows, dtype=np.int64).ravel()
+        self._cols = np.asarray(cols, dtype=np.int64).ravel()
+        self._values = np.asarray(values).ravel()
+        if not self.rows.size == self.cols.size == self.values.size:
+            raise ValueError('coordinates and values have to be of equal lengths.')
+        if self.rows.size and (self.rows.min() < 0 or self.cols.min() < 0):
+            raise ValueError('coordinates have to be nonnegative.')
+        self.shape = shape
+        self.style = style
+        self.regions = regions
+        self.na_rep = na_rep
+
+        if borders:
+            top = {**top, 'top': borders}
+            right = {**right, 'right': borders}
+            bottom = {**bottom, 'bottom': borders}
+            left = {**left, 'left': borders}
+        self._boundaries = (
+            {'top': top} if isinstance(top, int) else top,
+            {'bottom': bottom} if isinstance(bottom, int) else bottom,
+            {'left': left} if isinstance(left, int) else left,
+            {'right': right} if isinstance(right, int) else right
+        )
+
+    @classmethod
+    def from_frame(cls, df, header=False, index=False, header_style={}, **kwargs):
+        """Make a sparse table from the non-null values of a data frame.
+
+        Parameters
+        ----------
+            df : pandas.DataFrame
+                Data frame (a crosstab etc.).
+            header : bool
+                Should column labels be written above the values.
+            index : bool
+                Should index labels be written to the left of the values.
+            header_style : dict
+                Additional styling of the labels (as a region style).
+            **kwargs
+                Other arguments passed to the constructor.
+        """
+        rows, cols = np.nonzero(df.notnull().values)
+        values = [df.values[rows, cols]]
+        dx, dy = int(header), int(index)
+        rows, cols = [rows + dx], [cols + dy]
+        regions = []
+        if header:
+            rows.append(np.zeros(df.shape[1], dtype=np.int64))
+            cols.append(np.arange(df.shape[1]) + dy)
+            values.append(np.asarray(df.columns, dtype=object))
+            regions.append({'rows': (0, 1), 'style': header_style})
+        if index:
+            rows.append(np.arange(df.shape[0]) + dx)
+            cols.append(np.zeros(df.shape[0], dtype=np.int64))
+            values.append(np.asarray(df.index, dtype=object))
+            regions.append({'cols': (0, 1), 'style': header_style})
+        if len(values) > 1:
+            values = [ v.astype(object) for v in values ]
+        kwargs['regions'] = regions + kwargs.get('regions', [])
+        return cls(np.concatenate(rows), np.concatenate(cols),
+                   np.concatenate(values),
+                   (df.shape[0] + dx, df.shape[1] + dy), **kwargs)
+
+    @classmethod
+    def from_sparse(cls, matrix, **kwargs):
+        """Make a sparse table from a sparse matrix.
+
+        Parameters
+        ----------
+            matrix : scipy.sparse matrix or array
+                Any matrix with a `tocoo` method; explicitly stored zeros
+                are kept as values.
+            **kwargs
+                Other arguments passed to the constructor.
+        """
+        coo = matrix.tocoo()
+        return cls(coo.row, coo.col, coo.data, coo.shape, **kwargs)
+
+    def _cells(self):
+        """Get cells to write in row-major order.
+
+        Returns
+        -------
+            tuple
+                Row and column indices, indices of values
+                (-1 for blank cells) and memberships of the cells
+                in the regions and boundaries (a boolean matrix).
+        """
+        nrows, ncols = self.shape
+        ranges = [ (r['rows'], r['cols']) for r in self.regions ]
+        ranges += [ ((0, 1), (0, ncols)), ((nrows - 1, nrows), (0, ncols)),
+                    ((0, nrows), (0, 1)), ((0, nrows), (ncols - 1, ncols)) ]
+        styled = [ r['style'] for r in self.regions ] + list(self._boundaries)
+        # Empty cells are written only if they are styled
+        blanks = [ np.add.outer(np.arange(*rows) * ncols, np.arange(*cols)).ravel()
+                   for (rows, cols), stl in zip(ranges, styled)
+                   if stl and rows[1] > rows[0] and cols[1] > cols[0] ]
+        filled = self.rows * ncols + self.cols
+        blanks = np.setdiff1d(np.concatenate(blanks), filled) if blanks \
+                 else np.empty(0, dtype=np.int64)
+        cells = np.concatenate([filled, blanks])
+        index = np.concatenate([np.arange(filled.size),
+                                np.full(blanks.size, -1, dtype=np.int64)])
+        order = np.argsort(cells, kind='stable')
+        cells, index = cells[order], index[order]
+        rows, cols = cells // ncols, cells % ncols
+        member = np.zeros((cells.size, len(ranges)), dtype=bool)
+        for k, ((r0, r1), (c0, c1)) in enumerate(ranges):
+            member[:, k] = (rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1)
+        return rows, cols, index, member
+
+    def split_sizes(self, **kwargs):
+        """Get sizes used for splitting the table.
+
+        Parameters
+        ----------
+            **kwargs
+                Drawing arguments (not used).
+
+        Returns
+        -------
+            tuple
+                Height of the header, heights of rows and widths of columns.
+        """
+        return 0, np.ones(self.shape[0], dtype=int), np.ones(self.shape[1], dtype=int)
+
+    def split(self, rows, cols):
+        """Get a part of the table.
+
+        Parameters
+        ----------
+            rows : tuple
+                Start and stop of the range of rows.
+            cols : tuple
+                Start and stop of the range of columns.
+        """
+        mask = (self.rows >= rows[0]) & (self.rows < rows[1]) & \
+               (self.cols >= cols[0]) & (self.cols < cols[1])
+        regions = [ {'rows': (r['rows'][0] - rows[0], r['rows'][1] - rows[0]),
+                     'cols': (r['cols'][0] - cols[0], r['cols'][1] - cols[0]),
+                     'style': r['style']} for r in self.regions ]
+        top, bottom, left, right = self._boundaries
+        return SparseTable(self.rows[mask] - rows[0], self.cols[mask] - cols[0],
+                           self.values[mask],
+                           (rows[1] - rows[0], cols[1] - cols[0]), self.style,
+                           regions, None, top, bottom, left, right, self.na_rep)
+
+    def draw(self, x, y, ws, wb, na_rep, **kwargs):
+        """Draw SparseTable in the worksheet.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the table.
+            y : int
+                Y-coordinate for the upper-left corner of the table.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the table in.
+            wb : xlsxwriter.workbook.Workbook
+                Workbook the worksheet is in.
+            na_rep : str
+                String representation of missing values.
+            **kwargs
+                Optional keyword parameters passed to the write methods.
+        """
+        be = get_backend(ws, wb)
+        na_rep = na_rep if self.na_rep is None else self.na_rep
+        if not self.shape[0] or not self.shape[1]:
+            return
+        rows, cols, index, member = self._cells()
+        base = self.style
+        values = self.values
+        if values.dtype.kind in 'Mm':
+            if 'num_format' not in base:
+                base = {**base, 'num_format': date_num_format(values)}
+            values = np.array([ datetime_value(v) for v in pd.Series(values) ],
+                              dtype=object)
+        values = values.tolist() + [None]
+        # One format for every combination of regions
+        styles = [ r['style'] for r in self.regions ] + list(self._boundaries)
+        combos, codes = np.unique(member, axis=0, return_inverse=True)
+        formats = []
+        for combo in combos:
+            style = base.copy()
+            for stl, flag in zip(styles, combo):
+                if flag:
+                    style.update(stl)
+            formats.append(be.format(style) if style else None)
+        for r, c, i, k in zip((rows + x).tolist(), (cols + y).tolist(),
+                              index.tolist(), codes.ravel().tolist()):
+            value = values[i]
+            if i >= 0 and is_null(value):
+                value = na_rep or None
+            be.write(r, c, value, formats[k], **kwargs)
+
+###############################################################################
+
+
+class Crosstab(object):
+    """Batch of crosstabs of row variables by column variables.
+
+    Tables of all row variables (i.e. survey questions) by all column
+    variables (i.e. demographics) are computed from a single respondent-level
+    data frame in one counting pass per column variable
+    (coded answers to row variables are stacked) and drawn one below another.
+    Every table starts with a header of column variables and their categories
+    and then has a section of rows for every statistic
+    (counts and percentages) with optional totals.
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def stats(self):
+        """list: Statistics of the tables ('count' and/or 'percent')."""
+        return self._stats
+    @stats.setter
+    def stats(self, value):
+        value = list(validate_param(value, 'stats', (list, tuple)))
+        for s in value:
+            if s not in ('count', 'percent'):
+                raise ValueError('`%s` is not a valid statistic.' % s)
+        self._stats = value
+
+    @property
+    def percentages(self):
+        """str: Totals percentages are computed against
+        ('columns', 'index' or 'all').
+        """
+        return self._percentages
+    @percentages.setter
+    def percentages(self, value):
+        if value not in ('columns', 'index', 'all'):
+            raise ValueError("`percentages` has to be 'columns', 'index' or 'all'.")
+        self._percentages = value
+
+    @property
+    def labels(self):
+        """dict: Labels of variables, statistics and totals (by names)."""
+        return self._labels
+    @labels.setter
+    def labels(self, value):
+        self._labels = validate_param(value, 'labels', dict)
+
+    @property
+    def vspace(self):
+        """nonnegative int: Number of empty rows between tables."""
+        return self._vspace
+    @vspace.setter
+    def vspace(self, value):
+        self._vspace = validate_param(value, 'vspace', int, True, 'x >= 0')
+
+    @property
+    def style(self):
+        """dict: Base style of the tables."""
+        return self._style
+    @style.setter
+    def style(self, value):
+        self._style = validate_param(value, 'style', dict)
+
+    @property
+    def header_style(self):
+        """dict: Additional styling of the headers and statistics' labels."""
+        return self._header_style
+    @header_style.setter
+    def header_style(self, value):
+        self._header_style = validate_param(value, 'header_style', dict)
+
+    @property
+    def num_formats(self):
+        """dict: Number formats of the statistics."""
+        return self._num_formats
+    @num_formats.setter
+    def num_formats(self, value):
+        self._num_formats = validate_param(value, 'num_formats', dict)
+
+    @property
+    def tables(self):
+        """OrderedDict: Computed tables by row variables (read-only);
+        every one is a `dict` of `pandas.DataFrame`s by statistics,
+        with categories of column variables as a 2-level column index.
+        """
+        return self._tables
+
+    @property
+    def width(self):
+        """int: Width of the tables (read-only)."""
+        table = next(iter(self.tables.values()), None)
+        return 0 if table is None else table['count'].shape[1] + 1
+
+    @property
+    def height(self):
+        """int: Height of all the tables with spacing (read-only)."""
+        heights = [ self._table_height(t) for t in self.tables.values() ]
+        return sum(heights) + self.vspace * max(len(heights) - 1, 0)
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, data, rows, columns=[], weights=None,
+                 stats=('count', 'percent'), percentages='columns', totals=True,
+                 labels={}, vspace=1, style={}, header_style={'bold': True},
+                 num_formats={'percent': '0.0%'}):
+        """Initialization method.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Respondent-level data.
+        rows : list
+            Row variables (column names of the data); one table per variable.
+        columns : list
+            Column variables (column names of the data).
+        weights : str or None
+            Column of weights; counts are sums of weights if given.
+        stats : list
+            Sections of the tables: 'count' and/or 'percent'.
+        percentages : str
+            Totals percentages are computed against:
+            'columns' (column percentages), 'index' (row percentages)
+            or 'all' (grand total).
+        totals : bool
+            Should total rows and the total column be included.
+        labels : dict
+            Labels of variables, statistics ('count' and 'percent')
+            and totals ('total'); names are used by default.
+        vspace : int (>= 0)
+            Number of empty rows between tables.
+        style : dict
+            Base style of the tables.
+        header_style : dict
+            Additional styling of the headers and statistics' labels.
+        num_formats : dict
+            Number formats of the statistics.
+        """
+        data = validate_param(data, 'data', pd.DataFrame)
+        rows = validate_param(rows, 'rows', (list, tuple))
+        columns = validate_param(columns, 'columns', (list, tuple))
+        self.stats = stats
+        self.percentages = percentages
+        self.totals = validate_param(totals, 'totals', bool)
+        self.labels = labels
+        self.vspace = vspace
+        self.style = style
+        self.header_style = header_style
+        self.num_formats = num_formats
+        self._tables = self._compute(data, list(rows), list(columns), weights)
+
+    @staticmethod
+    def _categories(col):
+        """Get categories of a variable in order."""
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            return list(col.cat.categories)
+        values = pd.unique(col.dropna())
+        try:
+            return sorted(values)
+        except TypeError:
+            return list(values)
+
+    def _compute(self, data, rows, columns, weights):
+        """Compute the tables.
+
+        Answers to all row variables are coded as integers and stacked,
+        so counts of all tables by a column variable are computed
+        in a single `numpy.bincount` pass.
+        """
+        n = len(data)
+        weights = None if weights is None else data[weights].values.astype(float)
+        answers = [ self._categories(data[r]) for r in rows ]
+        size = max([ len(a) for a in answers ] + [1])
+        # Stacked codes of (row variable, answer) pairs; -1 for missing answers
+        codes = np.full((len(rows), n), -1, dtype=np.int64)
+        for i, (r, cats) in enumerate(zip(rows, answers)):
+            a = pd.Categorical(data[r], categories=cats).codes
+            codes[i] = np.where(a >= 0, i * size + a, -1)
+        codes = codes.ravel()
+        tiled = None if weights is None else np.tile(weights, len(rows))
+
+        def count(keys, minlength):
+            valid = keys >= 0
+            w = None if tiled is None else tiled[valid]
+            counts = np.bincount(keys[valid], weights=w, minlength=minlength)
+            return counts if weights is not None else counts.astype(np.int64)
+
+        total = self.labels.get('total', 'Total')
+        blocks, header = [], []
+        if self.totals:
+            blocks.append(count(codes, len(rows) * size).reshape(len(rows), size, 1))
+            header.append((total, ''))
+        for c in columns:
+            cats = self._categories(data[c])
+            cc = np.tile(pd.Categorical(data[c], categories=cats).codes, len(rows))
+            keys = np.where((codes >= 0) & (cc >= 0), codes * len(cats) + cc, -1)
+            blocks.append(count(keys, len(rows) * size * len(cats))
+                          .reshape(len(rows), size, len(cats)))
+            header.extend((c, cat) for cat in cats)
+        counts = np.concatenate(blocks, axis=2) if blocks \
+                 else np.zeros((len(rows), size, 0), dtype=np.int64)
+        header = pd.MultiIndex.from_tuples(header) if header \
+                 else pd.MultiIndex.from_tuples([], names=[None, None])
+
+        tables = OrderedDict()
+        for i, (r, cats) in enumerate(zip(rows, answers)):
+            values = counts[i, :len(cats)]
+            index = list(cats)
+            if self.totals:
+                values = np.vstack([values, values.sum(axis=0)])
+                index.append(total)
+            table = { 'count': pd.DataFrame(values, index=index, columns=header) }
+            if 'percent' in self.stats:
+                table['percent'] = self._percent(table['count'])
+            tables[r] = table
+        return tables
+
+    def _percent(self, count):
+        """Compute percentages of a table of counts."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.totals:
+                if self.percentages == 'columns':
+                    return count / count.iloc[-1]
+                if self.percentages == 'index':
+                    return count.div(count.iloc[:, 0], axis=0)
+                return count / count.iloc[-1, 0]
+            if self.percentages == 'columns':
+                return count / count.sum()
+            if self.percentages == 'index':
+                return count.div(count.sum(axis=1), axis=0)
+            return count / count.values.sum()
+
+    def _table_height(self, table):
+        """Get a height of a table."""
+        return 2 + len(self.stats) * (1 + table['count'].shape[0])
+
+    def draw(self, x, y, ws, wb, na_rep, **kwargs):
+        """Draw Crosstab in the worksheet.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the first table.
+            y : int
+                Y-coordinate for the upper-left corner of the tables.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the tables in.
+            wb : xlsxwriter.workbook.Workbook
+                Workbook the worksheet is in.
+            na_rep : str
+                String representation of missing values
+                (i.e. undefined percentages).
+            **kwargs
+                Not used; accepted for compatibility with other elements.
+        """
+        be = get_backend(ws, wb)
+        label = lambda k: self.labels.get(k, k)
+        head = be.format({**self.style, **self.header_style})
+        body = be.format(self.style) if self.style else None
+        formats = { s: be.format({**self.style, 'num_format': self.num_formats[s]})
+                    if s in self.num_formats else body for s in self.stats }
+        for r, table in self.tables.items():
+            count = table['count']
+            # Header: row variable, column variables and their categories
+            be.write(x, y, label(r), head)
+            be.write(x + 1, y, None, head)
+            j = y + 1
+            if self.totals:
+                be.merge(x, j, x + 1, j, head)
+                be.write(x, j, count.columns[0][0], head)
+                j += 1
+            for var, cats in groupby(count.columns[int(self.totals):], lambda c: c[0]):
+                cats = [ c[1] for c in cats ]
+                if len(cats) > 1:
+                    be.merge(x, j, x, j + len(cats) - 1, head)
+                be.write(x, j, label(var), head)
+                for k, cat in enumerate(cats):
+                    be.write(x + 1, j + k, cat, head)
+                j += len(cats)
+            x += 2
+            for s in self.stats:
+                be.write(x, y, label(s), head)
+                x += 1
+                values = table[s].values.tolist()
+                for answer, row in zip(table[s].index.tolist(), values):
+                    be.write(x, y, answer, body)
+                    for k, v in enumerate(row, y + 1):
+                        if v != v or v in (float('inf'), float('-inf')):
+                            v = na_rep or None
+                        be.write(x, k, v, formats[s])
+                    x += 1
+            x += self.vspace
+
+###############################################################################
+
+
+class FormulaColumn(object):
+    """Column of formulas generated from a template.
+
+    References in the template are given relative to the column's cells
+    as `{c}` (a cell `c` columns to the right in the same row; negative
+    to the left) or `{c,r}` (also `r` rows below), i.e. `={-2}*{-1}`
+    multiplies values of the two columns to the left. Literal braces
+    are written doubled. Formulas of all rows are generated at once
+    from a table of column names and vectorized row numbers.
+    Alternatively, a single array formula over whole columns may be written.
+    """
+
+    # Reference fields of templates
+    _FIELD = re.compile(r'^\s*([+-]?\d+)\s*(?:,\s*([+-]?\d+)\s*)?$')
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def formula(self):
+        """str: Formula template."""
+        return self._formula
+    @formula.setter
+    def formula(self, value):
+        value = validate_param(value, 'formula', str)
+        parts = []
+        for text, field, spec, conv in Formatter().parse(value):
+            if text:
+                parts.append(text)
+            if field is None:
+                continue
+            m = self._FIELD.match(field)
+            if not m or spec or conv:
+                ref = '{%s%s%s}' % (field, '!' + conv if conv else '',
+                                    ':' + spec if spec else '')
+                raise ValueError('`%s` is not a valid relative reference.' % ref)
+            parts.append((int(m.group(1)), int(m.group(2) or 0)))
+        self._formula = value
+        self._parts = parts
+
+    @property
+    def nrows(self):
+        """nonnegative int: Number of rows."""
+        return self._nrows
+    @nrows.setter
+    def nrows(self, value):
+        self._nrows = validate_param(value, 'nrows', int, True, 'x >= 0')
+
+    @property
+    def name(self):
+        """str or None: Name drawn above the formulas."""
+        return self._name
+    @name.setter
+    def name(self, value):
+        self._name = validate_param(value, 'name', (str, type(None)))
+
+    @property
+    def style(self):
+        """dict: Style of the formula cells."""
+        return self._style
+    @style.setter
+    def style(self, value):
+        self._style = validate_param(value, 'style', dict)
+
+    @property
+    def name_style(self):
+        """dict: Additional styling of the name."""
+        return self._name_style
+    @name_style.setter
+    def name_style(self, value):
+        self._name_style = validate_param(value, 'name_style', dict)
+
+    @property
+    def values(self):
+        """list or None: Cached results of the formulas."""
+        return self._values
+    @values.setter
+    def values(self, value):
+        if value is not None:
+            value = [ 0 if is_null(v) else v for v in np.asarray(value).tolist() ]
+            if len(value) != self.nrows:
+                raise ValueError('there have to be `nrows` cached results.')
+        self._values = value
+
+    @property
+    def array(self):
+        """str or None: Type of a single array formula written instead
+        of formulas of rows ('array' or 'dynamic').
+        """
+        return self._array
+    @array.setter
+    def array(self, value):
+        if value not in ('array', 'dynamic', None):
+            raise ValueError("`array` has to be 'array', 'dynamic' or None.")
+        self._array = value
+
+    @property
+    def width(self):
+        """int: Width of the column (read-only)."""
+        return 1
+
+    @property
+    def height(self):
+        """int: Height of the column including the name (read-only)."""
+        return self.nrows + int(self.name is not None)
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, formula, nrows, name=None, style={}, name_style={},
+                 values=None, array=None):
+        """Initialization method.
+
+        Parameters
+        ----------
+        formula : str
+            Formula template with relative references
+            (`{c}` or `{c,r}` for column and row offsets).
+        nrows : int
+            Number of rows.
+        name : str or None
+            Name drawn above the formulas.
+        style : dict
+            Style of the formula cells.
+        name_style : dict
+            Additional styling of the name.
+        values : array-like or None
+            Cached results of the formulas (shown until recalculation);
+            zeros if `None`.
+        array : 'array', 'dynamic' or None
+            If set, then a single array formula (a legacy one or a dynamic
+            one spilling its results) is written instead of formulas
+            of rows, with references extended to whole columns.
+        """
+        self.formula = formula
+        self.nrows = nrows
+        self.name = name
+        self.style = style
+        self.name_style = name_style
+        self.values = values
+        self.array = array
+
+    def formulas(self, x, y):
+        """Generate formulas of the rows.
+
+        Parameters
+        ----------
+            x : int
+                Row of the first formula.
+            y : int
+                Column of the formulas.
+
+        Returns
+        -------
+            list of str
+                Formulas of the rows (or a single array formula).
+        """
+        names = column_names()
+        for p in self._parts:
+            if not isinstance(p, str) and (x + p[1] < 0 or y + p[0] < 0):
+                raise ValueError('reference `{%d,%d}` is outside of the worksheet.' % p)
+        if self.array:
+            last = x + self.nrows
+            return [ ''.join(p if isinstance(p, str) else
+                             '%s%d:%s%d' % (names[y + p[0]], x + p[1] + 1,
+                                            names[y + p[0]], last + p[1])
+                             for p in self._parts) ]
+        rows = {}
+        out = np.full(self.nrows, '', dtype=object)
+        for p in self._parts:
+            if isinstance(p, str):
+                out = out + p
+                continue
+            dy, dx = p
+            if dx not in rows:
+                rows[dx] = np.arange(x + dx + 1, x + dx + 1 + self.nrows) \
+                             .astype(str).astype(object)
+            out = out + names[y + dy] + rows[dx]
+        return out.tolist()
+
+    def draw(self, x, y, ws, wb, na_rep, **kwargs):
+        """Draw FormulaColumn in the worksheet.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the column.
+            y : int
+                Y-coordinate for the upper-left corner of the column.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the column in.
+            wb : xlsxwriter.workbook.Workbook
+                Workbook the worksheet is in.
+            na_rep : str
+                Not used; accepted for compatibility with other elements.
+            **kwargs
+                Not used; accepted for compatibility with other elements.
+        """
+        be = get_backend(ws, wb)
+        if self.name is not None:
+            be.write(x, y, self.name, be.format({**self.style, **self.name_style}))
+            x += 1
+        if not self.nrows:
+            return
+        fmt = be.format(self.style) if self.style else None
+        formulas = self.formulas(x, y)
+        if self.array:
+            value = self.values[0] if self.values else 0
+            be.write_array_formula(x, y, x + self.nrows - 1, y, formulas[0], fmt,
+                                   self.array == 'dynamic', value)
+        else:
+            be.write_formulas(x, y, formulas, fmt, self.values)
+
+###############################################################################
+
+
+class GroupedTable(object):
+    """Table of a sorted data frame with outline groups and subtotals.
+
+    Rows of the data frame are grouped by one or more key columns
+    (i.e. region, then branch, then product). Every group starts with
+    a header row with its key and ends with a subtotal row; rows are given
+    outline levels, so groups can be collapsed in excel. Group boundaries,
+    positions of all rows and subtotals of all levels are computed
+    with array operations over the sorted rows, and detail rows
+    are drawn with typed column writes (like `Block`).
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def by(self):
+        """list: Key columns of the groups (from the outermost level)."""
+        return self._by
+
+    @property
+    def subtotals(self):
+        """OrderedDict: Aggregate functions of the subtotal rows (by columns)."""
+        return self._subtotals
+
+    @property
+    def formulas(self):
+        """bool: Should subtotals be written as formulas (with cached results)."""
+        return self._formulas
+    @formulas.setter
+    def formulas(self, value):
+        self._formulas = validate_param(value, 'formulas', bool)
+
+    @property
+    def total(self):
+        """bool: Should a grand total row be drawn."""
+        return self._total
+    @total.setter
+    def total(self, value):
+        self._total = validate_param(value, 'total', bool)
+
+    @property
+    def labels(self):
+        """dict: Templates of labels of group headers ('group'),
+        subtotal rows ('subtotal') and the grand total row ('total').
+        """
+        return self._labels
+    @labels.setter
+    def labels(self, value):
+        self._labels = validate_param(value, 'labels', dict)
+
+    @property
+    def group_style(self):
+        """dict: Additional styling of group headers
+        (indented by their levels).
+        """
+        return self._group_style
+    @group_style.setter
+    def group_style(self, value):
+        self._group_style = validate_param(value, 'group_style', dict)
+
+    @property
+    def subtotal_style(self):
+        """dict: Additional styling of subtotal and grand total rows."""
+        return self._subtotal_style
+    @subtotal_style.setter
+    def subtotal_style(self, value):
+        self._subtotal_style = validate_param(value, 'subtotal_style', dict)
+
+    @property
+    def nrows(self):
+        """int: Number of detail rows (read-only)."""
+        return self._block.nrows
+
+    @property
+    def width(self):
+        """int: Width of the table (read-only)."""
+        return self._block.width
+
+    @property
+    def height(self):
+        """int: Height of the table with group headers, subtotals
+        and the header row (read-only).
+        """
+        return int(self._block.header) + len(self._levels) + int(self.total)
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, data, by, columns=None, subtotals=None, formulas=True,
+                 total=True, labels={}, header=True, style={},
+                 header_style={'bold': True}, group_style={'bold': True},
+                 subtotal_style={'bold': True}, col_styles={}, col_widths={},
+                 na_rep=None, timezone=None, chunksize=65536):
+        """Initialization method.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Data sorted by the key columns.
+        by : str or list
+            Key columns of the groups (from the outermost level);
+            at most 6 levels, so detail rows get at most the outline level 7.
+        columns : list or None
+            Columns of detail rows; all columns but the keys by default.
+            Labels of group headers and subtotal rows are written
+            in the first column.
+        subtotals : str, list, dict or None
+            Aggregate functions (see `AGGREGATES`) of the subtotal rows:
+            a function for all numeric columns (but the first one),
+            a list of columns to sum or functions by columns;
+            sums of numeric columns by default.
+        formulas : bool
+            Should subtotals be written as excel formulas (`SUBTOTAL`,
+            which ignores nested subtotals) with cached results.
+        total : bool
+            Should a grand total row be drawn below the groups.
+        labels : dict
+            Templates of labels of group headers ('group', '%s' by default),
+            subtotal rows ('subtotal', 'Total %s') and the grand total
+            row ('total', 'Total').
+        header : bool
+            Should column names be drawn above the table.
+        style : dict
+            Base style of the table.
+        header_style : dict
+            Additional styling of the header.
+        group_style : dict
+            Additional styling of group headers.
+        subtotal_style : dict
+            Additional styling of subtotal and grand total rows.
+        col_styles : dict
+            Additional styling of columns (by names).
+        col_widths : dict
+            Widths of columns (by names).
+        na_rep : str or None
+            String representation of missing values; defaults to the drawer's one.
+        timezone : str, tzinfo or None
+            Timezone timezone-aware datetimes are converted to.
+        chunksize : int
+            Maximal number of detail rows converted and written at once.
+        """
+        data = validate_param(data, 'data', pd.DataFrame)
+        by = [by] if isinstance(by, str) else list(validate_param(by, 'by', (list, tuple)))
+        if not 1 <= len(by) <= 6:
+            raise ValueError('`by` has to have 1 to 6 key columns.')
+        if columns is None:
+            columns = [ c for c in data.columns if c not in by ]
+        columns = list(validate_param(columns, 'columns', (list, tuple)))
+        self._by = by
+        self._block = Block(OrderedDict((c, data[c]) for c in columns),
+                            header=header, style=style, header_style=header_style,
+                            col_styles=col_styles, col_widths=col_widths,
+                            na_rep=na_rep, timezone=timezone, chunksize=chunksize)
+        self._subtotals = self._subtotal_functions(data, columns, subtotals)
+        self.formulas = formulas
+        self.total = total
+        self.labels = labels
+        self.group_style = group_style
+        self.subtotal_style = subtotal_style
+        self._layout(data)
+
+    @staticmethod
+    def _subtotal_functions(data, columns, subtotals):
+        """Normalize aggregate functions of the subtotal rows."""
+        numeric = [ c for c in columns[1:]
+                    if pd.api.types.is_numeric_dtype(data[c].dtype) and
+                    not pd.api.types.is_bool_dtype(data[c].dtype) ]
+        if subtotals is None:
+            subtotals = OrderedDict((c, 'sum') for c in numeric)
+        elif isinstance(subtotals, str):
+            subtotals = OrderedDict((c, subtotals) for c in numeric)
+        elif isinstance(subtotals, (list, tuple)):
+            subtotals = OrderedDict((c, 'sum') for c in subtotals)
+        subtotals = OrderedDict(validate_param(subtotals, 'subtotals', dict))
+        for c, f in subtotals.items():
+            if c not in columns[1:]:
+                raise ValueError('`%s` is not a column of the table '
+                                 '(other than the first one).' % (c,))
+            if f not in AGGREGATES:
+                raise ValueError('`%s` is not a valid aggregate function.' % f)
+        return subtotals
+
+    def _layout(self, data):
+        """Compute positions of all rows and subtotals.
+
+        Rows are sorted, so groups are contiguous: a group of a level starts
+        where any key up to that level changes. Headers of the groups starting
+        at a row are placed right above it (the outermost first) and subtotals
+        of the groups ending at a row right below it (the innermost first),
+        so positions of all rows follow from cumulative counts of boundaries.
+        Subtotals are reduced over the contiguous groups of every level.
+        """
+        n, nlevels = len(data), len(self.by)
+        starts = np.zeros((nlevels, n), dtype=bool)
+        changed = np.zeros(n, dtype=bool)
+        if n:
+            changed[0] = True
+        for k, key in enumerate(self.by):
+            codes = pd.factorize(data[key].values)[0]
+            changed[1:] |= codes[1:] != codes[:-1]
+            starts[k] = changed
+        ends = np.zeros_like(starts)
+        ends[:, :-1] = starts[:, 1:]
+        if n:
+            ends[:, -1] = True
+        # Rows of the body: detail rows shifted by headers and subtotals above them
+        shift = starts.cumsum(axis=1).sum(axis=0) + \
+                (ends.cumsum(axis=1) - ends).sum(axis=0)
+        rows = np.arange(n) + shift
+        size = n + 2 * int(starts.sum())
+        levels = np.full(size, nlevels, dtype=np.int64)
+        groups = []
+        for k in range(nlevels):
+            first, last = np.flatnonzero(starts[k]), np.flatnonzero(ends[k])
+            head, foot = rows[first] - (nlevels - k), rows[last] + (nlevels - k)
+            levels[head] = levels[foot] = k
+            groups.append({
+                'level': k,
+                'head': head,
+                'foot': foot,
+                'keys': data[self.by[k]].values[first],
+                'values': self._reduce(data, first, last)
+            })
+        self._rows = rows
+        self._levels = levels
+        self._groups = groups
+        self._totals = self._reduce(data, np.array([0] if n else [], dtype=np.int64),
+                                    np.array([n - 1] if n else [], dtype=np.int64))
+
+    def _reduce(self, data, first, last):
+        """Compute subtotals of contiguous groups of rows.
+
+        Returns
+        -------
+            OrderedDict
+                Arrays of subtotals of the groups (by columns).
+        """
+        values = OrderedDict()
+        for c, f in self.subtotals.items():
+            x = data[c].values.astype(float)
+            if not len(first):
+                values[c] = np.zeros(0)
+                continue
+            valid = ~np.isnan(x)
+            if f == 'median':
+                codes = np.repeat(np.arange(len(first)), last - first + 1)
+                values[c] = pd.Series(x[first[0]:last[-1] + 1]) \
+                              .groupby(codes).median().values
+                continue
+            count = np.add.reduceat(valid, first).astype(float)
+            if f == 'count':
+                values[c] = count
+            elif f in ('sum', 'mean'):
+                total = np.add.reduceat(np.where(valid, x, 0.0), first)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    values[c] = total if f == 'sum' else total / count
+            else:
+                ufunc = np.fmin if f == 'min' else np.fmax
+                values[c] = ufunc.reduceat(x, first)
+        return values
+
+    def _subtotal_cells(self, be, x, y, row, values, index, top, formats):
+        """Write subtotals of a group (or the grand total).
+
+        Parameters
+        ----------
+            be : xlsxpandas.backends.Backend
+                Backend to draw with.
+            x : int
+                X-coordinate of the first row of the body.
+            y : int
+                Y-coordinate of the table.
+            row : int
+                Subtotal row (in the body).
+            values : OrderedDict
+                Subtotals of the groups of the level (by columns).
+            index : int
+                Index of the group.
+            top : int
+                Group header row (in the body).
+            formats : list
+                Formats of the subtotals.
+        """
+        names = column_names()
+        positions = list(self._block.columns)
+        for (c, f), fmt in zip(self.subtotals.items(), formats):
+            j = y + positions.index(c)
+            value = values[c][index]
+            value = None if value != value or abs(value) == np.inf else float(value)
+            if self.formulas:
+                # Rows between the group header and the subtotal row (1-based)
+                ref = '%s%d:%s%d' % (names[j], x + top + 2, names[j], x + row)
+                be.write(x + row, j, '=' + SUBTOTALS[f] % ref, fmt, 'write_formula',
+                         value=EMPTY_AGGREGATES[f] if value is None else value)
+            else:
+                be.write(x + row, j, value, fmt)
+
+    def draw(self, x, y, ws, wb, na_rep, **kwargs):
+        """Draw GroupedTable in the worksheet.
+
+        Rows are written in order, so the table can be drawn
+        in worksheets in the `constant_memory` mode.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the table.
+            y : int
+                Y-coordinate for the upper-left corner of the table.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the table in.
+            wb : xlsxwriter.workbook.Workbook
+                Workbook the worksheet is in.
+            na_rep : str
+                String representation of missing values.
+            **kwargs
+                Not used; accepted for compatibility with other elements.
+        """
+        be = get_backend(ws, wb)
+        block = self._block
+        na_rep = na_rep if block.na_rep is None else block.na_rep
+        names = list(block.columns)
+        if block.header:
+            fmt = be.format(layer(block.style, block.header_style))
+            for j, name in enumerate(names):
+                be.write(x, y + j, name, fmt)
+            x += 1
+        subtotal_fmts = [ be.format(layer(block.style, block.col_styles.get(c),
+                                          self.subtotal_style))
+                          for c in self.subtotals ]
+        label_fmt = be.format(layer(block.style, self.subtotal_style))
+        group_fmts = [ be.format(layer(block.style, {'indent': k}, self.group_style))
+                       for k in range(len(self.by)) ]
+        levels = self._levels
+        if self.total:
+            levels = np.append(levels, 0)
+        be.outline_rows(x, levels)
+
+        # Inserted rows and runs of consecutive detail rows, in order of rows
+        group_label = self.labels.get('group', '%s')
+        subtotal_label = self.labels.get('subtotal', 'Total %s')
+        inserted = [ (row, kind, k, i)
+                     for g in self._groups
+                     for kind, rows in ((1, g['head']), (2, g['foot']))
+                     for k, i, row in zip([g['level']] * len(rows),
+                                          range(len(rows)), rows.tolist()) ]
+        rows = self._rows
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        runs = [ (int(rows[a]), 0, a, b) for a, b in
+                 zip(np.r_[0, breaks].tolist(), np.r_[breaks, len(rows)].tolist())
+                 if b > a ]
+        formats = [ be.format(block._column_style(c, col))
+                    for c, col in block.columns.items() ]
+        for row, kind, a, b in sorted(inserted + runs):
+            if be.draft_stop is not None and x + row >= be.draft_stop:
+                break
+            if kind == 0:
+                for start in range(a, b, block.chunksize):
+                    stop = min(start + block.chunksize, b)
+                    band = [ block._band(col, start, stop)
+                             for col in block.columns.values() ]
+                    be.write_block(x + row + start - a, y, band, formats, na_rep)
+                continue
+            g = self._groups[a]
+            key = g['keys'][b]
+            if kind == 1:
+                be.write(x + row, y, group_label % (key,), group_fmts[a])
+            else:
+                be.write(x + row, y, subtotal_label % (key,), label_fmt)
+                top = int(g['head'][b])
+                self._subtotal_cells(be, x, y, row, g['values'], b, top,
+                                     subtotal_fmts)
+        if self.total:
+            row = len(self._levels)
+            be.write(x + row, y, self.labels.get('total', 'Total'), label_fmt)
+            self._subtotal_cells(be, x, y, row, self._totals, 0, -1, subtotal_fmts)
+        for j, name in enumerate(names):
+            if name in block.col_widths:
+                be.set_column(y + j, y + j, float(block.col_widths[name]))
+
+###############################################################################
+
+
+class FrameDiff(object):
+    """Current values of a data frame with changes against its previous version.
+
+    Frames are aligned on their index and columns; rows and columns
+    of the previous frame only are drawn (with previous values) as removed.
+    Changed, added and removed cells are determined with array comparisons
+    (with an optional tolerance for numbers), so every column has only
+    a small fixed set of formats (one per kind of change).
+    Unchanged rows are drawn with typed column writes in runs
+    and only rows with changes are written cell by cell, in order of rows.
+    """
+
+    # Kinds of cells (codes of `codes`)
+    UNCHANGED, CHANGED, ADDED, REMOVED = range(4)
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def codes(self):
+        """pandas.DataFrame: Kinds of cells (`UNCHANGED`, `CHANGED`,
+        `ADDED` or `REMOVED`) of the aligned frames (read-only).
+        """
+        return pd.DataFrame(self._codes, index=self._index, columns=self._columns)
+
+    @property
+    def counts(self):
+        """dict: Numbers of changed, added and removed cells (read-only)."""
+        return { kind: int(np.count_nonzero(self._codes == code))
+                 for code, kind in ((1, 'changed'), (2, 'added'), (3, 'removed')) }
+
+    @property
+    def tolerance(self):
+        """nonnegative float: Absolute tolerance of changes of numbers."""
+        return self._tolerance
+
+    @property
+    def styles(self):
+        """dict: Additional styling of 'changed', 'added' and 'removed' cells."""
+        return self._styles
+    @styles.setter
+    def styles(self, value):
+        self._styles = validate_param(value, 'styles', dict)
+
+    @property
+    def style(self):
+        """dict: Base style of the table."""
+        return self._style
+    @style.setter
+    def style(self, value):
+        self._style = validate_param(value, 'style', dict)
+
+    @property
+    def header_style(self):
+        """dict: Additional styling of the header and the index."""
+        return self._header_style
+    @header_style.setter
+    def header_style(self, value):
+        self._header_style = validate_param(value, 'header_style', dict)
+
+    @property
+    def width(self):
+        """int: Width of the table (read-only)."""
+        return len(self._columns) + int(self.index)
+
+    @property
+    def height(self):
+        """int: Height of the table (read-only)."""
+        return len(self._index) + int(self.header)
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, current, previous, tolerance=0, header=True, index=True,
+                 style={}, header_style={'bold': True},
+                 styles={'changed': {'bg_color': '#FFEB9C'},
+                         'added': {'bg_color': '#C6EFCE'},
+                         'removed': {'bg_color': '#FFC7CE', 'font_strikeout': True}},
+                 comments=False, comment_label='Previous: %s',
+                 na_rep=None, chunksize=65536):
+        """Initialization method.
+
+        Parameters
+        ----------
+        current : pandas.DataFrame
+            Current data (with unique index and column labels).
+        previous : pandas.DataFrame
+            Previous data (with unique index and column labels).
+        tolerance : float (>= 0)
+            Absolute differences of numbers up to it are not changes.
+        header : bool
+            Should column names be drawn above the table.
+        index : bool
+            Should the index be drawn as the first column.
+        style : dict
+            Base style of the table.
+        header_style : dict
+            Additional styling of the header and the index.
+        styles : dict
+            Additional styling of 'changed', 'added' and 'removed' cells
+            (also of labels of added and removed rows and columns).
+        comments : bool
+            Should previous values be written as comments of changed cells.
+        comment_label : str
+            Template of the comments.
+        na_rep : str or None
+            String representation of missing values; defaults to the drawer's one.
+        chunksize : int
+            Number of rows converted and written at once.
+        """
+        current = validate_param(current, 'current', pd.DataFrame)
+        previous = validate_param(previous, 'previous', pd.DataFrame)
+        for df, name in ((current, 'current'), (previous, 'previous')):
+            if not (df.index.is_unique and df.columns.is_unique):
+                raise ValueError('`%s` has to have unique index and column labels.' % name)
+        self._tolerance = validate_param(tolerance, 'tolerance', float, True, 'x >= 0')
+        self.header = validate_param(header, 'header', bool)
+        self.index = validate_param(index, 'index', bool)
+        self.style = style
+        self.header_style = header_style
+        self.styles = styles
+        self.comments = validate_param(comments, 'comments', bool)
+        self.comment_label = validate_param(comment_label, 'comment_label', str)
+        self.na_rep = validate_param(na_rep, 'na_rep', (str, type(None)))
+        self.chunksize = validate_param(chunksize, 'chunksize', int, True, 'x > 0')
+        self._compare(current, previous)
+
+    def _compare(self, current, previous):
+        """Align the frames and determine kinds of all cells."""
+        index = current.index.append(previous.index.difference(current.index, sort=False))
+        columns = current.columns.append(
+            previous.columns.difference(current.columns, sort=False))
+        cur = current.reindex(index=index, columns=columns)
+        prev = previous.reindex(index=index, columns=columns)
+        rows_cur, rows_prev = index.isin(current.index), index.isin(previous.index)
+        cols_cur, cols_prev = columns.isin(current.columns), columns.isin(previous.columns)
+        in_cur = rows_cur[:, None] & cols_cur[None, :]
+        in_prev = rows_prev[:, None] & cols_prev[None, :]
+
+        codes = np.zeros((len(index), len(columns)), dtype=np.int8)
+        values, previous_values = [], []
+        for j, c in enumerate(columns):
+            a, b = cur[c].values, prev[c].values
+            if pd.api.types.is_numeric_dtype(a.dtype) and \
+               pd.api.types.is_numeric_dtype(b.dtype) and \
+               not pd.api.types.is_bool_dtype(a.dtype):
+                diff = ~np.isclose(a.astype(float), b.astype(float),
+                                   rtol=0, atol=self.tolerance, equal_nan=True)
+            else:
+                na, nb = pd.isnull(a), pd.isnull(b)
+                with np.errstate(invalid='ignore'):
+                    diff = (na != nb) | (~na & ~nb & np.asarray(a != b, dtype=bool))
+            codes[in_cur[:, j] & in_prev[:, j] & diff, j] = self.CHANGED
+            # Removed cells are drawn with their previous values
+            removed = ~in_cur[:, j]
+            values.append(prev[c].values if removed.all() else
+                          cur[c].values if not removed.any() else
+                          cur[c].where(~removed, prev[c]).values)
+            previous_values.append(b)
+        codes[in_cur & ~in_prev] = self.ADDED
+        codes[~in_cur] = self.REMOVED
+
+        self._index, self._columns = index, columns
+        self._codes = codes
+        self._values = values
+        self._previous = previous_values
+        self._row_codes = np.where(~rows_cur, self.REMOVED,
+                                   np.where(~rows_prev, self.ADDED, self.UNCHANGED))
+        self._col_codes = np.where(~cols_cur, self.REMOVED,
+                                   np.where(~cols_prev, self.ADDED, self.UNCHANGED))
+
+    def _formats(self, be, style, values=None):
+        """Get formats of the kinds of cells (with date formats for dates)."""
+        if values is not None and np.asarray(values).dtype.kind in 'Mm' \
+           and 'num_format' not in style:
+            style = layer(style, {'num_format': date_num_format(values)})
+        kinds = (None, 'changed', 'added', 'removed')
+        return [ be.format(layer(style, self.styles.get(k) if k else None))
+                 for k in kinds ]
+
+    def draw(self, x, y, ws, wb, na_rep, **kwargs):
+        """Draw FrameDiff in the worksheet.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the table.
+            y : int
+                Y-coordinate for the upper-left corner of the table.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the table in.
+            wb : xlsxwriter.workbook.Workbook
+                Workbook the worksheet is in.
+            na_rep : str
+                String representation of missing values.
+            **kwargs
+                Not used; accepted for compatibility with other elements.
+        """
+        be = get_backend(ws, wb)
+        na_rep = na_rep if self.na_rep is None else self.na_rep
+        label_fmts = self._formats(be, layer(self.style, self.header_style))
+        columns = list(self._values)
+        codes = self._codes
+        formats = [ self._formats(be, self.style, col) for col in columns ]
+        if self.index:
+            columns.insert(0, self._index.values)
+            codes = np.column_stack([self._row_codes, codes])
+            formats.insert(0, label_fmts)
+        if self.header:
+            if self.index:
+                be.write(x, y, self._index.name, label_fmts[0])
+            for j, (name, code) in enumerate(zip(self._columns, self._col_codes),
+                                             y + int(self.index)):
+                be.write(x, j, name, label_fmts[code])
+            x += 1
+        base = [ f[0] for f in formats ]
+        dirty = codes.any(axis=1)
+        for start in range(0, len(dirty), self.chunksize):
+            if be.draft_stop is not None and x + start >= be.draft_stop:
+                break
+            stop = min(start + self.chunksize, len(dirty))
+            # Runs of unchanged rows and rows with changes
+            breaks = np.flatnonzero(np.diff(dirty[start:stop])) + 1 + start
+            for a, b in zip(np.r_[start, breaks].tolist(), np.r_[breaks, stop].tolist()):
+                if not dirty[a]:
+                    be.write_block(x + a, y, [ col[a:b] for col in columns ],
+                                   base, na_rep)
+                    continue
+                cells = [ pd.Series(col[a:b]).astype(object).tolist()
+                          for col in columns ]
+                for i, row in enumerate(zip(*cells), a):
+                    for j, value in enumerate(row):
+                        if is_null(value):
+                            value = na_rep if na_rep else None
+                        be.write(x + i, y + j, value, formats[j][codes[i, j]])
+        if self.comments:
+            offset = int(self.index)
+            for i, j in zip(*np.nonzero(self._codes == self.CHANGED)):
+                value = pd.Series(self._previous[j][i:i + 1]).astype(object).iloc[0]
+                value = na_rep if is_null(value) else value
+                be.comment(x + int(i), y + offset + int(j), self.comment_label % (value,))
+
+###############################################################################
@@ -0,0 +1,255 @@
+"""Parallel rendering of workbooks
+
+Every worksheet is drawn in a separate worker process with its own workbook
+and `Drawer`. Workers return XML of their worksheets together with their local
+tables of styles and shared strings. The coordinator remaps format indices
+and shared strings to the global tables of the final workbook
+and assembles it with `xlsxwriter`, which writes the prepared sheet XML
+instead of generating it.
+
+Only data stored in sheet XML is supported (cells, merged ranges, formats,
+column and row settings, conditional formats, data validations etc.).
+Names defined by workers (see `Drawer.define_name`) are defined again
+in the final workbook; global names have to be unique across worksheets.
+Features stored in separate parts of the file or in the workbook
+(comments, images, charts, tables, hyperlinks, autofilters,
+print areas and titles, dynamic arrays) can not be used in parallel mode.
+"""
+
+# Imported modules ------------------------------------------------------------
+
+# Full imports ---
+import io
+import re
+import zipfile
+import xlsxwriter
+
+# Partial imports ---
+from concurrent.futures import ProcessPoolExecutor
+from xlsxwriter.worksheet import Worksheet
+from xlsxwriter.utility import quote_sheetname
+from xlsxpandas.__internals__ import _FORMATS, make_format
+from xlsxpandas.drawer import Drawer
+
+# Worksheet attributes of features not supported in parallel mode
+_UNSUPPORTED = (
+    ('has_comments', 'comments'),
+    ('buttons_list', 'buttons'),
+    ('charts', 'charts'),
+    ('images', 'images'),
+    ('shapes', 'shapes'),
+    ('tables', 'tables'),
+    ('hyperlinks', 'hyperlinks'),
+    ('background_image', 'background images'),
+    ('header_images', 'header/footer images'),
+    ('autofilter_area', 'autofilters'),
+    ('print_area_range', 'print areas'),
+    ('repeat_row_range', 'print titles'),
+    ('repeat_col_range', 'print titles'),
+    ('has_dynamic_arrays', 'dynamic arrays')
+)
+
+_STYLE_ATTR = re.compile(r'( s="| style=")(\d+)"')
+_DXF_ATTR = re.compile(r' dxfId="(\d+)"')
+_STRING_CELL = re.compile(r' t="s"><v>(\d+)</v>')
+
+###############################################################################
+
+
+class SheetPart(object):
+    """Worksheet drawn by a worker.
+
+    Attributes
+    ----------
+    name : str
+        Name of the worksheet.
+    xml : str
+        Worksheet XML with worker-local format and shared string indices.
+    styles : dict
+        Style definitions of the worker's cell formats (by XF indices).
+    dxf_styles : dict
+        Style definitions of the worker's conditional formats (by DXF indices).
+    strings : list
+        Worker's shared strings (in the order of indices).
+    string_count : int
+        Number of string cells.
+    names : list
+        Names defined in the worker's workbook as `(name, local, formula)` tuples.
+    """
+
+    def __init__(self, name, xml, styles, dxf_styles, strings, string_count,
+                 names=()):
+        """Initialization method."""
+        self.name = name
+        self.xml = xml
+        self.styles = styles
+        self.dxf_styles = dxf_styles
+        self.strings = strings
+        self.string_count = string_count
+        self.names = list(names)
+
+###############################################################################
+
+
+class PreparedWorksheet(Worksheet):
+    """Worksheet writing prepared XML instead of generating it."""
+
+    def __init__(self):
+        super(PreparedWorksheet, self).__init__()
+        self.prepared_xml = ''
+
+    def _assemble_xml_file(self):
+        xml = self.prepared_xml
+        if not self.selected:
+            # Workers' sheets are the only (and so selected) sheets
+            head, sep, tail = xml.partition('</sheetViews>')
+            xml = head.replace(' tabSelected="1"', '') + sep + tail
+        self.fh.write(xml)
+        self.fh.close()
+
+###############################################################################
+
+def render_sheet(name, func, args=(), kwargs={}, options={}, drawer_args={}):
+    """Draw a worksheet in its own workbook (in a worker process).
+
+    Parameters
+    ----------
+        name : str
+            Name of the worksheet.
+        func : callable
+            Function drawing the worksheet; it is called with a `Drawer`
+            (and `args` and `kwargs`). It has to be picklable
+            (i.e. defined at the top level of a module).
+        args : tuple
+            Additional positional arguments of the function.
+        kwargs : dict
+            Additional keyword arguments of the function.
+        options : dict
+            Workbook options (the `constant_memory` mode is not supported).
+        drawer_args : dict
+            Additional arguments of the drawer (i.e. `na_rep` or `backend`).
+
+    Returns
+    -------
+        SheetPart
+            Drawn worksheet.
+    """
+    buf = io.BytesIO()
+    wb = xlsxwriter.Workbook(buf, {**options, 'in_memory': True,
+                                   'constant_memory': False})
+    ws = wb.add_worksheet(name)
+    func(Drawer(ws, wb, **drawer_args), *args, **kwargs)
+    unsupported = [ feature for attr, feature in _UNSUPPORTED if getattr(ws, attr, None) ]
+    images = getattr(wb, 'embedded_images', None)
+    if images is not None and images.has_images():
+        unsupported.append('images')
+    if unsupported:
+        raise ValueError('%s are not supported in parallel mode (sheet %r).'
+                         % (unsupported[0], name))
+
+    names = [ (name, index != -1, formula)
+              for name, index, formula, hidden in wb.defined_names ]
+    cache = _FORMATS.get(wb, {})
+    wb.close()
+    styles, dxf_styles = {}, {}
+    formats = set()
+    for key, fmt in cache.items():
+        formats.add(id(fmt))
+        if fmt.xf_index is not None:
+            styles[fmt.xf_index] = dict(key)
+        if fmt.dxf_index is not None:
+            dxf_styles[fmt.dxf_index] = dict(key)
+    for fmt in wb.formats:
+        if (fmt.xf_index or fmt.dxf_index is not None) and id(fmt) not in formats:
+            raise ValueError('formats have to be made from style definitions '
+                             'in parallel mode (sheet %r).' % name)
+    xml = zipfile.ZipFile(buf).read('xl/worksheets/sheet1.xml').decode('utf-8')
+    return SheetPart(name, xml, styles, dxf_styles,
+                     list(wb.str_table.string_array), wb.str_table.count, names)
+
+def merge_sheet(wb, part):
+    """Add a worksheet drawn by a worker to a workbook.
+
+    Format indices are remapped to the formats of the workbook,
+    shared strings are added to its shared strings table
+    and names defined by the worker are defined in the workbook
+    (local names in the added worksheet).
+
+    Parameters
+    ----------
+        wb : xlsxwriter.workbook.Workbook
+            Workbook to add the worksheet to.
+        part : SheetPart
+            Worksheet drawn by a worker.
+
+    Returns
+    -------
+        PreparedWorksheet
+            Added worksheet.
+    """
+    xf = { 0: '0' }
+    for index, style in part.styles.items():
+        xf[index] = str(make_format(wb, style)._get_xf_index())
+    dxf = {}
+    for index, style in part.dxf_styles.items():
+        dxf[index] = str(make_format(wb, style)._get_dxf_index())
+    table = wb.str_table
+    strings = [ str(table._get_shared_string_index(s)) for s in part.strings ]
+    table.count += part.string_count - len(part.strings)
+
+    xml = part.xml
+    xml = _STYLE_ATTR.sub(lambda m: m.group(1) + xf[int(m.group(2))] + '"', xml)
+    xml = _DXF_ATTR.sub(lambda m: ' dxfId="%s"' % dxf[int(m.group(1))], xml)
+    xml = _STRING_CELL.sub(lambda m: ' t="s"><v>%s</v>' % strings[int(m.group(1))], xml)
+
+    ws = wb.add_worksheet(part.name, worksheet_class=PreparedWorksheet)
+    ws.prepared_xml = xml
+    defined = { name.lower() for name, index, formula, hidden in wb.defined_names
+                if index == -1 }
+    for name, local, formula in part.names:
+        if local:
+            name = '%s!%s' % (quote_sheetname(ws.name), name)
+        elif name.lower() in defined:
+            raise ValueError('name `%s` is defined by more than one worksheet '
+                             '(sheet %r).' % (name, part.name))
+        wb.define_name(name, '=' + formula)
+    return ws
+
+def render_workbook(filename, sheets, processes=None, options={}, drawer_args={}):
+    """Render a workbook drawing its worksheets in parallel.
+
+    Parameters
+    ----------
+        filename : str or file-like object
+            Output file.
+        sheets : list of tuples
+            Worksheets given as `(name, func)` or `(name, func, args)`
+            or `(name, func, args, kwargs)` tuples (see `render_sheet`).
+        processes : int or None
+            Number of worker processes; defaults to the number of processors.
+            If it is `0`, then worksheets are drawn in the current process.
+        options : dict
+            Workbook options.
+        drawer_args : dict
+            Additional arguments of drawers.
+
+    Returns
+    -------
+        list
+            Names of the worksheets (in order).
+    """
+    jobs = [ tuple(sheet) + ((), {})[len(sheet) - 2:] for sheet in sheets ]
+    if processes == 0:
+        parts = [ render_sheet(name, func, args, kwargs, options, drawer_args)
+                  for name, func, args, kwargs in jobs ]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [ pool.submit(render_sheet, name, func, args, kwargs,
+                                    options, drawer_args)
+                        for name, func, args, kwargs in jobs ]
+            parts = [ f.result() for f in futures ]
+    wb = xlsxwriter.Workbook(filename, {**options, 'constant_memory': False})
+    for part in parts:
+        merge_sheet(wb, part)
+    wb.close()
+    return [ part.name for part in parts ]
@@ -0,0 +1,187 @@
+"""Render pipeline
+
+Preparing elements (building their values, resolving styles and laying
+them out) is usually much more expensive than the final worksheet calls.
+In the pipeline mode elements are prepared by a pool of workers
+(threads or processes), which record them as templates with resolved
+cell operations, while a single writer thread takes prepared templates
+from a bounded queue and draws them with the drawer in the order
+of submission. So preparation of many blocks of a report may use several
+cores, while `xlsxwriter` is used by one thread only, and the bounded queue
+limits the number of prepared, but not yet written, elements held in memory.
+"""
+
+# Imported modules ------------------------------------------------------------
+
+# Full imports ---
+import queue
+import threading
+
+# Partial imports ---
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from xlsxpandas.__internals__ import validate_param
+from xlsxpandas.templates import Template
+
+###############################################################################
+
+def prepare(elem, args=(), kwargs={}, draw_args={}, na_rep=''):
+    """Prepare an element for drawing (in a worker).
+
+    Parameters
+    ----------
+        elem : any object with a proper `draw` method or callable
+            Element or a function building it.
+        args : tuple
+            Positional arguments of the building function.
+        kwargs : dict
+            Keyword arguments of the building function.
+        draw_args : dict
+            Keyword arguments passed to the element's draw method.
+        na_rep : str
+            String representation of missing values.
+
+    Returns
+    -------
+        xlsxpandas.templates.Template
+            Template with recorded operations of the element.
+    """
+    if not hasattr(elem, 'draw'):
+        elem = elem(*args, **kwargs)
+    return Template(elem, na_rep=na_rep, **draw_args)
+
+###############################################################################
+
+
+class Pipeline(object):
+    """Producer/consumer pipeline drawing elements with a drawer.
+
+    Elements are submitted with `draw` and prepared by workers in parallel.
+    Drawer actions (i.e. moves) are submitted with `call`. Both are applied
+    by a single writer thread in the order of submission, so layouts
+    depending on sizes of previously drawn elements work as usual
+    (sizes are the ones of templates, which cover all the written cells,
+    i.e. also names of data frames). Submitting blocks if the queue is full.
+
+    In the process mode elements (or functions building them
+    and their arguments) have to be picklable; functions building elements
+    in workers are preferred, as they also move building out of the main process.
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def drawer(self):
+        """xlsxpandas.drawer.Drawer: Drawer used by the writer."""
+        return self._drawer
+
+    @property
+    def maxsize(self):
+        """positive int: Maximum number of submitted and not written items."""
+        return self._maxsize
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, drawer, workers=None, processes=False, maxsize=16):
+        """Initialization method.
+
+        Parameters
+        ----------
+        drawer : xlsxpandas.drawer.Drawer
+            Drawer used by the writer thread; it should not be used
+            by other threads until the pipeline is closed.
+        workers : int or None
+            Number of workers; defaults to the executor's default.
+        processes : bool
+            Should elements be prepared in worker processes instead of threads.
+        maxsize : int
+            Maximum number of submitted and not yet written items;
+            submitting blocks when it is reached.
+        """
+        self._drawer = drawer
+        self._maxsize = validate_param(maxsize, 'maxsize', int, True, 'x > 0')
+        executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self._pool = executor(workers)
+        self._queue = queue.Queue(self.maxsize)
+        self._error = None
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(raise_errors=exc_type is None)
+
+    def _write(self):
+        """Apply submitted items (in the writer thread)."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                # Remaining items are discarded after an error
+                continue
+            func, args, kwargs = item
+            try:
+                if func is None:
+                    self.drawer.draw(args.result())
+                else:
+                    func(self.drawer, *args, **kwargs)
+            except BaseException as exc:
+                self._error = exc
+
+    def _check(self):
+        """Raise an error of the writer or of a worker."""
+        if self._error is not None:
+            raise self._error
+
+    def draw(self, elem, args=(), kwargs={}, draw_args={}):
+        """Submit an element for drawing.
+
+        Parameters
+        ----------
+            elem : any object with a proper `draw` method or callable
+                Element or a function building it (in a worker).
+            args : tuple
+                Positional arguments of the building function.
+            kwargs : dict
+                Keyword arguments of the building function.
+            draw_args : dict
+                Keyword arguments passed to the element's draw method
+                (i.e. `draw_names` of data frames).
+        """
+        self._check()
+        future = self._pool.submit(prepare, elem, args, kwargs, draw_args,
+                                   self.drawer.na_rep)
+        self._queue.put((None, future, None))
+
+    def call(self, func, *args, **kwargs):
+        """Submit a drawer action.
+
+        Parameters
+        ----------
+            func : callable
+                Function called with the drawer (and arguments)
+                in the writer thread, i.e. `Drawer.move_vertical`.
+            *args
+                Positional arguments of the function.
+            **kwargs
+                Keyword arguments of the function.
+        """
+        self._check()
+        self._queue.put((func, args, kwargs))
+
+    def close(self, raise_errors=True):
+        """Wait until all submitted items are written and stop the workers.
+
+        Parameters
+        ----------
+            raise_errors : bool
+                Should an error of preparing or writing an item be raised.
+        """
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self._pool.shutdown()
+        if raise_errors:
+            self._check()
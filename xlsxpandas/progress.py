@@ -0,0 +1,278 @@
+"""Progress reporting and cancellation of rendering
+
+A `Progress` object passed to `Drawer.draw` counts cells written
+by the drawn element (through a wrapping backend), reports progress
+to a callback every given number of cells and checks a deadline
+and a cancellation token. Checks are done every given number of cells
+and between row bands of blocks; if the rendering is over its budget
+or cancelled, `Cancelled` is raised. `Drawer.draw` then releases
+the workbook without writing it with `discard`.
+"""
+
+# Imported modules ------------------------------------------------------------
+
+# Full imports ---
+import os
+import threading
+import time
+
+# Partial imports ---
+from xlsxpandas.__internals__ import validate_param
+from xlsxpandas.backends import Backend
+
+###############################################################################
+
+
+class Cancelled(Exception):
+    """Rendering was cancelled or exceeded its deadline."""
+    pass
+
+###############################################################################
+
+
+class CancelToken(object):
+    """Thread-safe flag for cancelling rendering (i.e. from a scheduler)."""
+
+    def __init__(self):
+        """Initialization method."""
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        """bool: Was the rendering cancelled (read-only)."""
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the rendering."""
+        self._event.set()
+
+###############################################################################
+
+
+class Progress(object):
+    """Progress of rendering.
+
+    Attributes
+    ----------
+    cells : int
+        Number of cells written.
+    rows : int
+        Number of rows of the current element reached
+        (the furthest row written counting from its top).
+    total : int or None
+        Expected number of cells; areas of the drawn elements
+        are added up if it is not given.
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def elapsed(self):
+        """float: Seconds since the start (read-only)."""
+        return time.monotonic() - self._start
+
+    @property
+    def eta(self):
+        """float or None: Estimated number of seconds remaining (read-only)."""
+        if not self.cells or not self.total:
+            return None
+        return max(self.total - self.cells, 0) * self.elapsed / self.cells
+
+    @property
+    def fraction(self):
+        """float or None: Fraction of the expected cells written (read-only)."""
+        if not self.total:
+            return None
+        return min(self.cells / self.total, 1.0)
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, callback=None, every=10000, check_every=1000,
+                 timeout=None, deadline=None, token=None, total=None):
+        """Initialization method.
+
+        Parameters
+        ----------
+        callback : callable or None
+            Function called with the progress object every `every` cells
+            and when a drawn element is finished.
+        every : int
+            Number of cells between progress reports.
+        check_every : int
+            Number of cells between checks of the deadline
+            and the cancellation token.
+        timeout : float or None
+            Time budget in seconds (counting from now).
+        deadline : float or None
+            Deadline as a `time.time()` timestamp.
+        token : CancelToken or None
+            Token cancelling the rendering.
+        total : int or None
+            Expected number of cells; areas of the drawn elements
+            are used if `None`.
+        """
+        self.callback = callback
+        self.every = validate_param(every, 'every', int, True, 'x > 0')
+        self.check_every = validate_param(check_every, 'check_every', int, True, 'x > 0')
+        self.token = token
+        self.cells = 0
+        self.rows = 0
+        self.total = total
+        self._fixed_total = total is not None
+        self._start = time.monotonic()
+        self._deadline = None
+        if timeout is not None:
+            self._deadline = self._start + timeout
+        if deadline is not None:
+            # Wall clock deadline translated to the monotonic clock
+            until = self._start + deadline - time.time()
+            self._deadline = until if self._deadline is None else min(self._deadline, until)
+        self._next_report = self.every
+        self._next_check = self.check_every
+
+    def begin(self, elem):
+        """Start drawing an element.
+
+        Parameters
+        ----------
+            elem : any object with `width` and `height` properties
+                Drawn element.
+        """
+        self.check()
+        self.rows = 0
+        if not self._fixed_total:
+            area = int(getattr(elem, 'width', 0) or 0) * int(getattr(elem, 'height', 0) or 0)
+            self.total = (self.total or 0) + area
+
+    def finish(self):
+        """Finish drawing an element (reports the progress)."""
+        if self.callback is not None:
+            self.callback(self)
+
+    def update(self, cells, rows=0):
+        """Record written cells.
+
+        Parameters
+        ----------
+            cells : int
+                Number of written cells.
+            rows : int
+                Number of rows of the current element reached.
+        """
+        self.cells += cells
+        if rows > self.rows:
+            self.rows = rows
+        if self.cells >= self._next_check:
+            self._next_check = self.cells + self.check_every
+            self.check()
+        if self.cells >= self._next_report:
+            self._next_report = self.cells + self.every
+            if self.callback is not None:
+                self.callback(self)
+
+    def check(self):
+        """Raise `Cancelled` if the rendering is cancelled or over its deadline."""
+        if self.token is not None and self.token.cancelled:
+            raise Cancelled('rendering was cancelled after %d cells.' % self.cells)
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise Cancelled('rendering exceeded its deadline after %d cells.'
+                            % self.cells)
+
+###############################################################################
+
+
+class ProgressBackend(Backend):
+    """Backend counting written cells of another backend."""
+
+    def __init__(self, backend, progress, x=0):
+        """Initialization method.
+
+        Parameters
+        ----------
+        backend : xlsxpandas.backends.Backend
+            Backend to write with.
+        progress : Progress
+            Progress to update.
+        x : int
+            Top row of the drawn element.
+        """
+        super(ProgressBackend, self).__init__(backend.ws, backend.wb)
+        self.backend = backend
+        self.progress = progress
+        self.x = x
+
+    @property
+    def draft(self):
+        return self.backend.draft
+
+    @property
+    def draft_stop(self):
+        return self.backend.draft_stop
+
+    def format(self, style):
+        return self.backend.format(style)
+
+    def write(self, x, y, token, fmt=None, method='write', **kwargs):
+        result = self.backend.write(x, y, token, fmt, method, **kwargs)
+        self.progress.update(1, x - self.x + 1)
+        return result
+
+    def merge(self, x0, y0, x1, y1, fmt=None):
+        return self.backend.merge(x0, y0, x1, y1, fmt)
+
+    def comment(self, x, y, text, params={}):
+        return self.backend.comment(x, y, text, params)
+
+    def set_column(self, first_col, last_col, width=None, fmt=None):
+        return self.backend.set_column(first_col, last_col, width, fmt)
+
+    def set_row(self, row, height=None, fmt=None):
+        return self.backend.set_row(row, height, fmt)
+
+    def outline_rows(self, x, levels):
+        return self.backend.outline_rows(x, levels)
+
+    def conditional_format(self, x0, y0, x1, y1, options):
+        return self.backend.conditional_format(x0, y0, x1, y1, options)
+
+    def write_formulas(self, x, y, formulas, fmt=None, values=None):
+        result = self.backend.write_formulas(x, y, formulas, fmt, values)
+        self.progress.update(len(formulas), x + len(formulas) - self.x)
+        return result
+
+    def write_array_formula(self, x0, y0, x1, y1, formula, fmt=None,
+                            dynamic=False, value=0):
+        result = self.backend.write_array_formula(x0, y0, x1, y1, formula, fmt,
+                                                  dynamic, value)
+        self.progress.update((x1 - x0 + 1) * (y1 - y0 + 1), x1 - self.x + 1)
+        return result
+
+    def write_block(self, x, y, columns, formats=None, na_rep=''):
+        result = self.backend.write_block(x, y, columns, formats, na_rep)
+        n = max([ len(col) for col in columns ] + [0])
+        self.progress.update(n * len(columns), x + n - self.x)
+        # Blocks are written in bands of rows, so every band is checked
+        self.progress.check()
+        return result
+
+###############################################################################
+
+def discard(wb):
+    """Release resources of a workbook without writing it.
+
+    Temporary files of worksheets (in the `constant_memory` mode) are closed
+    and removed and the workbook is marked as closed.
+
+    Parameters
+    ----------
+        wb : xlsxwriter.workbook.Workbook
+            Workbook to discard.
+    """
+    for ws in wb.worksheets():
+        fh = getattr(ws, 'row_data_fh', None)
+        if fh is not None and not fh.closed:
+            fh.close()
+        filename = getattr(ws, 'row_data_filename', None)
+        if filename and os.path.exists(filename):
+            os.remove(filename)
+    wb.fileclosed = True
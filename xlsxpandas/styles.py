@@ -0,0 +1,166 @@
+"""Style objects
+
+Styles of elements are immutable, hashable `dict`s (`Style`) with
+precomputed keys, so they may be compared, hashed and looked up
+in caches of workbook formats without sorting their items again.
+Styles of elements are built from layers (i.e. base, table, column,
+edge and cell styles) with `layer`, which resolves every combination
+of layers only once.
+CSS declarations (i.e. computed by a pandas `Styler`) are translated
+into styles with `css_style`, which parses every declaration only once.
+"""
+
+###############################################################################
+
+
+class Style(dict):
+    """Immutable, hashable style definition.
+
+    It is a `dict`, so it may be used anywhere a style definition is expected.
+    Copies (`copy` or `{**style}`) are ordinary, mutable `dict`s.
+    """
+
+    __slots__ = ('_key', '_hash')
+
+    def __init__(self, *args, **kwargs):
+        """Initialization method (arguments as for `dict`)."""
+        super(Style, self).__init__(*args, **kwargs)
+        self._key = tuple(sorted(self.items()))
+        self._hash = hash(self._key)
+
+    @property
+    def key(self):
+        """tuple: Sorted items of the style (read-only)."""
+        return self._key
+
+    @classmethod
+    def make(cls, style):
+        """Get a style object for a style definition.
+
+        Parameters
+        ----------
+            style : dict, Style or None
+                Style definition; style objects are returned as they are.
+        """
+        if style.__class__ is cls:
+            return style
+        return EMPTY if not style else cls(style)
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return 'Style(%s)' % dict.__repr__(self)
+
+    def __reduce__(self):
+        return (Style, (dict(self),))
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('Style objects are immutable.')
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+    __ior__ = _immutable
+
+# Empty style
+EMPTY = Style()
+
+# Resolved combinations of layers
+_LAYERS = {}
+_MAXLAYERS = 2**16
+
+# Translated CSS declarations (single ones and sets of border declarations)
+_CSS = {}
+# Converter of CSS declarations (made when the first one is translated)
+_CSS_CONVERTER = None
+
+###############################################################################
+
+def layer(*styles):
+    """Resolve layered styles (later layers override earlier ones).
+
+    Every combination of layers is resolved once and the resulting
+    style object is reused afterwards.
+
+    Parameters
+    ----------
+        *styles : dict, Style or None
+            Layers of the style (empty ones are skipped).
+
+    Returns
+    -------
+        Style
+            Resolved style.
+    """
+    styles = tuple(Style.make(s) for s in styles if s)
+    if not styles:
+        return EMPTY
+    if len(styles) == 1:
+        return styles[0]
+    try:
+        return _LAYERS[styles]
+    except KeyError:
+        if len(_LAYERS) >= _MAXLAYERS:
+            _LAYERS.clear()
+        resolved = {}
+        for s in styles:
+            resolved.update(s)
+        resolved = _LAYERS[styles] = Style(resolved)
+        return resolved
+
+def _css_to_style(css):
+    """Translate a CSS string into a style (not cached).
+
+    Internals of pandas are imported only when CSS is translated.
+    """
+    global _CSS_CONVERTER
+    from pandas.io.formats.excel import CSSToExcelConverter
+    from pandas.io.excel._xlsxwriter import _XlsxStyler
+    if _CSS_CONVERTER is None:
+        _CSS_CONVERTER = CSSToExcelConverter()
+    return Style.make(_XlsxStyler.convert(_CSS_CONVERTER(css)))
+
+def _cached_css(key, css):
+    """Get a translated CSS string from the cache (or translate it)."""
+    try:
+        return _CSS[key]
+    except KeyError:
+        if len(_CSS) >= _MAXLAYERS:
+            _CSS.clear()
+        stl = _CSS[key] = _css_to_style(css)
+        return stl
+
+def css_style(declarations):
+    """Translate CSS declarations into a style.
+
+    Every distinct declaration is parsed once and its style is reused
+    afterwards; declarations of a cell are then resolved with `layer`
+    (later declarations override earlier ones). Border declarations
+    depend on each other (i.e. a border color without a border style),
+    so they are translated together as one set. Declarations
+    that have no counterpart in `xlsxwriter` formats are ignored.
+
+    Parameters
+    ----------
+        declarations : iterable of (str, str) tuples or str
+            Declarations as `(property, value)` pairs
+            (like in `Styler.ctx`) or `'property: value'` strings.
+
+    Returns
+    -------
+        Style
+            Translated style.
+    """
+    layers = []
+    borders = []
+    for decl in declarations:
+        if isinstance(decl, str):
+            decl = tuple(p.strip() for p in decl.split(':', 1))
+        if decl[0].startswith('border'):
+            borders.append(decl)
+            continue
+        layers.append(_cached_css(decl, '%s: %s' % decl))
+    if borders:
+        css = '; '.join('%s: %s' % d for d in borders)
+        layers.append(_cached_css(tuple(borders), css))
+    return layer(*layers)
@@ -0,0 +1,540 @@
+"""Element templates
+
+A template freezes the layout of an element (an element, a series,
+a data frame, a dictionary or any other drawable object) together with
+its resolved styles. It may then be stamped many times, at different positions
+and in different worksheets, possibly with new values,
+without constructing and laying out the element again.
+"""
+
+# Imported modules ------------------------------------------------------------
+
+# Full imports ---
+import json
+import mmap
+import pickle
+import numpy as np
+import pandas as pd
+
+# Partial imports ---
+from weakref import WeakKeyDictionary
+from xlsxpandas.__internals__ import style_key, shift_formula
+from xlsxpandas.backends import Backend, get_backend
+
+# Write methods writing formulas
+_FORMULA_METHODS = ('write_formula', 'write_array_formula',
+                    'write_dynamic_array_formula')
+
+# Options of conditional formats that may refer to cells
+_CF_REFS = ('criteria', 'value', 'minimum', 'maximum', 'multi_range')
+
+# Serialization format ---
+_MAGIC = b'XLSXPANDAS-TEMPLATE\n'
+_VERSION = 1
+_ALIGN = 64
+# Op codes (`write`, `merge` and other operations)
+_OP_WRITE, _OP_MERGE, _OP_OTHER = 0, 1, 2
+# Kinds of written values
+_V_NONE, _V_FLOAT, _V_INT, _V_BOOL, _V_STR, _V_OBJECT = range(6)
+
+###############################################################################
+
+
+class _StyleRef(object):
+    """Reference to a style recorded by a `Recorder`."""
+
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+###############################################################################
+
+
+class Recorder(Backend):
+    """Backend recording drawing operations instead of executing them.
+
+    Formats are not registered in any workbook;
+    styles are collected in a table and referred to by their positions.
+    """
+
+    recording = True
+
+    def __init__(self):
+        """Initialization method."""
+        self._ws = None
+        self._wb = None
+        self.ops = []
+        self.styles = []
+        self._refs = {}
+
+    def format(self, style):
+        key = style_key(style)
+        try:
+            return self._refs[key]
+        except KeyError:
+            ref = self._refs[key] = _StyleRef(len(self.styles))
+            self.styles.append(dict(style))
+            return ref
+
+    def write(self, x, y, token, fmt=None, method='write', **kwargs):
+        self.ops.append(('write', x, y, token, fmt, method, kwargs))
+
+    def merge(self, x0, y0, x1, y1, fmt=None):
+        self.ops.append(('merge', x0, y0, x1, y1, fmt))
+
+    def comment(self, x, y, text, params={}):
+        self.ops.append(('comment', x, y, text, params))
+
+    def set_column(self, first_col, last_col, width=None, fmt=None):
+        self.ops.append(('set_column', first_col, last_col, width, fmt))
+
+    def set_row(self, row, height=None, fmt=None):
+        self.ops.append(('set_row', row, height, fmt))
+
+    def outline_rows(self, x, levels):
+        self.ops.append(('outline_rows', x, np.asarray(levels)))
+
+    def conditional_format(self, x0, y0, x1, y1, options):
+        self.ops.append(('conditional_format', x0, y0, x1, y1, dict(options)))
+
+    def write_array_formula(self, x0, y0, x1, y1, formula, fmt=None,
+                            dynamic=False, value=0):
+        self.ops.append(('array_formula', x0, y0, x1, y1, formula, fmt, dynamic, value))
+
+    def write_block(self, x, y, columns, formats=None, na_rep=''):
+        self.ops.append(('write_block', x, y, columns, formats, na_rep))
+
+###############################################################################
+
+
+class Template(object):
+    """Frozen, reusable layout of an element.
+
+    The element is drawn once (at the origin) with a recording backend.
+    Stamping the template replays the recorded operations moved
+    to the target position, with formats registered only once per workbook.
+    Values of the element's data cells (see `data_positions` methods
+    of elements) may be replaced with new values; all other cells
+    (names, keys, labels) are written as recorded.
+
+    A1 references in formulas and conditional formats are moved
+    together with the template. Cached results of formulas
+    (i.e. of aggregate rows) are the ones computed for the recorded values.
+    """
+
+    # -------------------------------------------------------------------------
+
+    @property
+    def width(self):
+        """int: Width of the template (read-only)."""
+        return self._width
+
+    @property
+    def height(self):
+        """int: Height of the template (read-only)."""
+        return self._height
+
+    @property
+    def positions(self):
+        """list: Coordinates of data cells relative to the upper-left corner
+        (read-only).
+        """
+        return [ tuple(p) for p in np.asarray(self._positions).tolist() ]
+
+    # -------------------------------------------------------------------------
+
+    def __init__(self, elem, na_rep='', **kwargs):
+        """Initialization method.
+
+        Parameters
+        ----------
+        elem : any object with a proper `draw` method
+            Element to make the template of.
+        na_rep : str
+            String representation of missing values the element is recorded with.
+        **kwargs
+            Keyword arguments passed to the element's draw method
+            (i.e. `draw_names` of data frames).
+        """
+        rec = Recorder()
+        elem.draw(0, 0, rec, None, na_rep, **kwargs)
+        self._ops = rec.ops
+        self._packed = None
+        self._extra = None
+        self._styles = rec.styles
+        self._formats = WeakKeyDictionary()
+
+        # Data cells ---
+        if hasattr(elem, 'data_positions'):
+            self._positions = elem.data_positions(0, 0, **kwargs)
+        else:
+            self._positions = []
+        writes = { (op[1], op[2]): i for i, op in enumerate(self._ops)
+                   if op[0] == 'write' }
+        try:
+            self._slots = [ writes[pos] for pos in self._positions ]
+        except KeyError as exc:
+            raise ValueError('data cell %r is not written by the element.' % (exc.args,))
+
+        # Geometry ---
+        height, width = 0, 0
+        for op in self._ops:
+            if op[0] in ('write', 'comment'):
+                height, width = max(height, op[1] + 1), max(width, op[2] + 1)
+            elif op[0] in ('merge', 'conditional_format', 'array_formula'):
+                height, width = max(height, op[3] + 1), max(width, op[4] + 1)
+        self._height = max(height, getattr(elem, 'height', 0))
+        self._width = max(width, getattr(elem, 'width', 0))
+
+    def __getstate__(self):
+        # Operations are unpacked, as loaded templates refer to their files
+        state = self.__dict__.copy()
+        state['_ops'] = list(self._iter_ops())
+        state['_packed'] = None
+        state['_extra'] = None
+        state['_positions'] = np.asarray(self._positions).tolist()
+        state['_slots'] = np.asarray(self._slots).tolist()
+        del state['_formats']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._formats = WeakKeyDictionary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the file of a loaded template.
+
+        Arrays of the template are dropped (and the memory map closed),
+        so it can not be drawn or saved anymore. Does nothing
+        for templates made from elements.
+        """
+        if self._packed is None:
+            return
+        buf = self._packed[2]
+        self._positions = np.array(self._positions)
+        self._slots = np.array(self._slots)
+        self._packed = None
+        self._extra = None
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+    def _iter_ops(self):
+        """Iterate over recorded operations (decoding them from the arrays
+        if the template was loaded).
+        """
+        if self._ops is not None:
+            return iter(self._ops)
+        if self._packed is None:
+            raise ValueError('template is closed.')
+        arrays, methods, buf, offset, length = self._packed
+        if self._extra is None:
+            self._extra = pickle.loads(bytes(buf[offset:offset + length]))
+        return _iter_packed(arrays, methods, self._extra, len(self._styles))
+
+    def _resolve(self, be):
+        """Get formats of the recorded styles for a backend."""
+        wb = be.wb
+        if wb is not None and wb in self._formats:
+            return self._formats[wb]
+        formats = [ be.format(style) for style in self._styles ]
+        if wb is not None:
+            self._formats[wb] = formats
+        return formats
+
+    def draw(self, x, y, ws, wb, na_rep, values=None, **kwargs):
+        """Stamp the template in a worksheet.
+
+        Parameters
+        ----------
+            x : int
+                X-coordinate for the upper-left corner of the template.
+            y : int
+                Y-coordinate for the upper-left corner of the template.
+            ws : xlsxwriter.worksheet.Worksheet or xlsxpandas.backends.Backend
+                Worksheet (or a backend) to write the template in.
+            wb : xlsxwriter.workbook.Workbook
+                Workbook the worksheet is in.
+            na_rep : str
+                String representation of missing values.
+            values : array-like or None
+                New values of the data cells in the order of `positions`
+                (2-dimensional arrays are flattened row by row);
+                recorded values are used if `None`.
+                New values are written with the generic `write` method.
+            **kwargs
+                Ignored; accepted for compatibility with elements.
+        """
+        be = get_backend(ws, wb)
+        formats = self._resolve(be)
+        def fmt(ref):
+            return formats[ref.index] if isinstance(ref, _StyleRef) else ref
+
+        subs = {}
+        if values is not None:
+            if not isinstance(values, np.ndarray):
+                values = np.array(values, dtype=object) \
+                         if not isinstance(values, (pd.Series, pd.DataFrame)) \
+                         else values.values
+            values = values.ravel().tolist()
+            if len(values) != len(self._slots):
+                raise ValueError('template has %d data cells, but %d values were given.'
+                                 % (len(self._slots), len(values)))
+            subs = dict(zip(np.asarray(self._slots, dtype=np.int64).tolist(), values))
+
+        for i, op in enumerate(self._iter_ops()):
+            kind = op[0]
+            if kind == 'write':
+                _, x0, y0, token, f, method, wargs = op
+                if i in subs:
+                    token, method, wargs = subs[i], 'write', {}
+                    if token is None or (np.isscalar(token) and pd.isnull(token)):
+                        token = na_rep if na_rep else None
+                elif method == 'write_rich_string' and isinstance(token, tuple):
+                    token = tuple(fmt(t) for t in token)
+                elif isinstance(token, str) and (method in _FORMULA_METHODS or
+                                                 token.startswith('=')):
+                    token = shift_formula(token, x, y)
+                be.write(x0 + x, y0 + y, token, fmt(f), method, **wargs)
+            elif kind == 'merge':
+                _, x0, y0, x1, y1, f = op
+                be.merge(x0 + x, y0 + y, x1 + x, y1 + y, fmt(f))
+            elif kind == 'comment':
+                _, x0, y0, text, params = op
+                be.comment(x0 + x, y0 + y, text, params)
+            elif kind == 'set_column':
+                _, first, last, width, f = op
+                be.set_column(first + y, last + y, width, fmt(f))
+            elif kind == 'set_row':
+                _, row, height, f = op
+                be.set_row(row + x, height, fmt(f))
+            elif kind == 'outline_rows':
+                _, row, levels = op
+                be.outline_rows(row + x, levels)
+            elif kind == 'conditional_format':
+                _, x0, y0, x1, y1, options = op
+                options = dict(options)
+                for key in _CF_REFS:
+                    if isinstance(options.get(key), str):
+                        options[key] = shift_formula(options[key], x, y)
+                if 'format' in options:
+                    options['format'] = fmt(options['format'])
+                be.conditional_format(x0 + x, y0 + y, x1 + x, y1 + y, options)
+            elif kind == 'array_formula':
+                _, x0, y0, x1, y1, formula, f, dynamic, value = op
+                be.write_array_formula(x0 + x, y0 + y, x1 + x, y1 + y,
+                                       shift_formula(formula, x, y), fmt(f),
+                                       dynamic, value)
+            elif kind == 'write_block':
+                _, x0, y0, columns, fs, block_na = op
+                fs = None if fs is None else [ fmt(f) for f in fs ]
+                be.write_block(x0 + x, y0 + y, columns, fs, block_na or na_rep)
+
+    def save(self, path):
+        """Save the template in a compact binary file.
+
+        Written values, coordinates, formats and write methods of cells
+        are stored as columnar arrays (strings in a single UTF-8 buffer),
+        merged ranges as an array of spans and styles in a table,
+        so the file may be memory-mapped by `Template.load`.
+        Other operations (comments, conditional formats, column settings,
+        rich strings and values of other types) are pickled.
+
+        Parameters
+        ----------
+            path : str
+                Path of the file.
+        """
+        arrays, methods, objects, others = _pack_ops(list(self._iter_ops()))
+        arrays['positions'] = np.asarray(self._positions, dtype=np.int32).reshape(-1, 2)
+        arrays['slots'] = np.asarray(self._slots, dtype=np.int64)
+        extra = pickle.dumps((objects, others), protocol=pickle.HIGHEST_PROTOCOL)
+
+        specs, offset = {}, 0
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            arrays[name] = arr
+            specs[name] = [arr.dtype.str, list(arr.shape), offset]
+            offset = _align(offset + arr.nbytes)
+        header = json.dumps({
+            'version': _VERSION,
+            'width': int(self.width),
+            'height': int(self.height),
+            'styles': self._styles,
+            'methods': methods,
+            'arrays': specs,
+            'extra': [offset, len(extra)]
+        }).encode('utf-8')
+
+        with open(path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(header)
+            start = _align(len(_MAGIC) + 8 + len(header))
+            f.write(b'\0' * (start - f.tell()))
+            for name, arr in arrays.items():
+                f.write(b'\0' * (start + specs[name][2] - f.tell()))
+                f.write(arr.tobytes())
+            f.write(b'\0' * (start + offset - f.tell()))
+            f.write(extra)
+
+    @classmethod
+    def load(cls, path, memory_map=True):
+        """Load a template saved with `Template.save`.
+
+        Only the header is parsed; arrays are views of the (memory-mapped)
+        file and operations are decoded from them whenever the template
+        is drawn. The file is released by `close` (templates may also be
+        used as context managers).
+
+        Parameters
+        ----------
+            path : str
+                Path of the file.
+            memory_map : bool
+                Should the file be memory-mapped instead of read.
+        """
+        with open(path, 'rb') as f:
+            if memory_map:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = f.read()
+        n = len(_MAGIC)
+        if buf[:n] != _MAGIC:
+            raise ValueError('%s is not a template file.' % path)
+        size = int(np.frombuffer(buf, np.uint64, 1, n)[0])
+        header = json.loads(bytes(buf[n + 8:n + 8 + size]).decode('utf-8'))
+        if header['version'] != _VERSION:
+            raise ValueError('unsupported template file version %r.' % header['version'])
+        start = _align(n + 8 + size)
+        arrays = {}
+        for name, (dtype, shape, offset) in header['arrays'].items():
+            count = int(np.prod(shape))
+            arrays[name] = np.frombuffer(buf, dtype, count, start + offset).reshape(shape)
+        offset, length = header['extra']
+
+        tpl = cls.__new__(cls)
+        tpl._ops = None
+        tpl._packed = (arrays, header['methods'], buf, start + offset, length)
+        tpl._extra = None
+        tpl._styles = header['styles']
+        tpl._formats = WeakKeyDictionary()
+        tpl._positions = arrays['positions']
+        tpl._slots = arrays['slots']
+        tpl._width = header['width']
+        tpl._height = header['height']
+        return tpl
+
+###############################################################################
+
+def _align(n):
+    """Round a size up to the alignment of arrays in template files."""
+    return -(-n // _ALIGN) * _ALIGN
+
+def _pack_ops(ops):
+    """Pack recorded operations into columnar arrays.
+
+    Returns
+    -------
+        tuple
+            Arrays (by names), names of write methods,
+            values of other types (by writes) and other operations.
+    """
+    codes = np.empty(len(ops), dtype=np.int8)
+    xs, ys, fmts, meths, kinds, nums, offsets = [], [], [], [], [], [], [0]
+    strings, spans, methods, objects, others = [], [], [], {}, []
+    size = 0
+    for i, op in enumerate(ops):
+        if op[0] == 'write':
+            _, x, y, token, f, method, wargs = op
+            codes[i] = _OP_WRITE
+            if method not in methods:
+                methods.append(method)
+            kind, num = _V_OBJECT, 0.0
+            if wargs:
+                objects[len(xs)] = (token, wargs)
+            elif token is None:
+                kind = _V_NONE
+            elif isinstance(token, (bool, np.bool_)):
+                kind, num = _V_BOOL, float(token)
+            elif isinstance(token, (int, np.integer)) and abs(int(token)) < 2**53:
+                kind, num = _V_INT, float(token)
+            elif isinstance(token, (float, np.floating)):
+                kind, num = _V_FLOAT, float(token)
+            elif isinstance(token, str):
+                kind = _V_STR
+                token = token.encode('utf-8')
+                strings.append(token)
+                size += len(token)
+            else:
+                objects[len(xs)] = (token, wargs)
+            xs.append(x)
+            ys.append(y)
+            fmts.append(-1 if f is None else f.index)
+            meths.append(methods.index(method))
+            kinds.append(kind)
+            nums.append(num)
+            offsets.append(size)
+        elif op[0] == 'merge':
+            codes[i] = _OP_MERGE
+            spans.append(op[1:5] + (-1 if op[5] is None else op[5].index,))
+        else:
+            codes[i] = _OP_OTHER
+            others.append(op)
+    arrays = {
+        'codes': codes,
+        'x': np.array(xs, dtype=np.int32),
+        'y': np.array(ys, dtype=np.int32),
+        'fmt': np.array(fmts, dtype=np.int32),
+        'method': np.array(meths, dtype=np.int16),
+        'kind': np.array(kinds, dtype=np.int8),
+        'num': np.array(nums, dtype=np.float64),
+        'offsets': np.array(offsets, dtype=np.int64),
+        'strings': np.frombuffer(b''.join(strings), dtype=np.uint8),
+        'spans': np.array(spans, dtype=np.int32).reshape(-1, 5)
+    }
+    return arrays, methods, objects, others
+
+def _iter_packed(arrays, methods, extra, nstyles):
+    """Iterate over operations packed with `_pack_ops`.
+
+    Operations are decoded one by one, so none of them are kept in memory.
+    """
+    objects, others = extra
+    refs = [ _StyleRef(i) for i in range(nstyles) ] + [None]
+    strings, offsets = arrays['strings'], arrays['offsets']
+    xs, ys, fmts = arrays['x'], arrays['y'], arrays['fmt']
+    meths, kinds, nums = arrays['method'], arrays['kind'], arrays['num']
+    spans = arrays['spans']
+    others = iter(others)
+    k, m = 0, 0
+    for code in arrays['codes'].tolist():
+        if code == _OP_WRITE:
+            kind, wargs = int(kinds[k]), {}
+            if kind == _V_NONE:
+                token = None
+            elif kind == _V_FLOAT:
+                token = float(nums[k])
+            elif kind == _V_INT:
+                token = int(nums[k])
+            elif kind == _V_BOOL:
+                token = bool(nums[k])
+            elif kind == _V_STR:
+                token = strings[offsets[k]:offsets[k + 1]].tobytes().decode('utf-8')
+            else:
+                token, wargs = objects[k]
+            yield ('write', int(xs[k]), int(ys[k]), token, refs[fmts[k]],
+                   methods[meths[k]], wargs)
+            k += 1
+        elif code == _OP_MERGE:
+            x0, y0, x1, y1, f = spans[m].tolist()
+            yield ('merge', x0, y0, x1, y1, refs[f])
+            m += 1
+        else:
+            yield next(others)